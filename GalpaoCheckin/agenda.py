@@ -0,0 +1,98 @@
+"""Índice em memória da grade de sessões (dia da semana, horário e capacidade)"""
+import os
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+from sqlalchemy import select
+from models import db, Sessao
+from clubes import PorClube
+
+# Grade usada na criação do banco: os antigos HORARIOS com 12 vagas, todos os dias
+GRADE_PADRAO = ("18:00-20:00", "20:00-22:00")
+CAPACIDADE_PADRAO = 12
+MESAS_PADRAO = 6
+
+DIAS_SEMANA = ("Segunda", "Terça", "Quarta", "Quinta", "Sexta", "Sábado", "Domingo")
+
+# Cópia imutável de uma linha de Sessao, segura para compartilhar entre threads
+InfoSessao = namedtuple("InfoSessao", "id dia_semana inicio fim capacidade mesas ativa rotulo corte")
+
+class _Grade:
+    """Snapshot da grade com os índices de consulta já montados"""
+
+    def __init__(self, sessoes):
+        self.por_id = {s.id: s for s in sessoes}
+        ativas = sorted((s for s in sessoes if s.ativa), key=lambda s: (s.inicio, s.fim))
+        self.por_dia = {dia: tuple(s for s in ativas if s.dia_semana == dia) for dia in range(7)}
+        self.por_rotulo = {(s.dia_semana, s.rotulo): s for s in sessoes}
+
+class AgendaSessoes:
+    """Grade de sessões de um clube carregada uma vez e consultada sem ir ao banco.
+
+    Leituras usam o snapshot atual sem trava; alterações feitas pelo admin
+    chamam invalidar() e o TTL faz os outros workers recarregarem.
+    """
+
+    def __init__(self, clube_id, ttl=None):
+        self.clube_id = clube_id
+        self.ttl = ttl if ttl is not None else int(os.environ.get("AGENDA_TTL", "60"))
+        self._trava = threading.Lock()
+        self._grade = None
+        self._carregada_em = 0.0
+
+    def _carregar(self):
+        sessoes = [
+            InfoSessao(s.id, s.dia_semana, s.inicio, s.fim, s.capacidade, s.mesas, s.ativa, s.rotulo,
+                       s.corte_cancelamento)
+            for s in db.session.execute(select(Sessao).where(Sessao.clube_id == self.clube_id)).scalars()
+        ]
+        return _Grade(sessoes)
+
+    def _atual(self):
+        """Snapshot vigente, recarregado do banco quando ausente ou expirado"""
+        grade = self._grade
+        if grade is None or time.monotonic() - self._carregada_em >= self.ttl:
+            with self._trava:
+                # Outra thread pode ter recarregado enquanto esta esperava
+                if self._grade is grade:
+                    self._grade = self._carregar()
+                    self._carregada_em = time.monotonic()
+                grade = self._grade
+        return grade
+
+    def invalidar(self):
+        """Descarta o snapshot; a próxima consulta recarrega do banco"""
+        with self._trava:
+            self._grade = None
+
+    def todas(self):
+        """Todas as sessões (inclusive inativas) por dia da semana e horário"""
+        return sorted(self._atual().por_id.values(), key=lambda s: (s.dia_semana, s.inicio, s.fim))
+
+    def sessao(self, sessao_id):
+        """Sessão pelo id (inclusive inativas, para exibir reservas antigas)"""
+        return self._atual().por_id.get(sessao_id)
+
+    def do_dia(self, data):
+        """Sessões ativas no dia da semana da data, em ordem de horário"""
+        return self._atual().por_dia[data.weekday()]
+
+    def validar(self, sessao_id, data):
+        """Sessão ativa que acontece na data, ou None"""
+        sessao = self._atual().por_id.get(sessao_id)
+        if sessao is None or not sessao.ativa or sessao.dia_semana != data.weekday():
+            return None
+        return sessao
+
+    def buscar(self, data, rotulo):
+        """Sessão da data pelo rótulo legado "HH:MM-HH:MM" (importação de JSON)"""
+        return self._atual().por_rotulo.get((data.weekday(), rotulo))
+
+def ler_rotulo(rotulo):
+    """Converte "HH:MM-HH:MM" em (inicio, fim); ValueError se o formato for inválido"""
+    inicio, fim = rotulo.split("-")
+    return datetime.strptime(inicio.strip(), "%H:%M").time(), datetime.strptime(fim.strip(), "%H:%M").time()
+
+# Uma grade por clube (a do clube em uso)
+agenda = PorClube(AgendaSessoes)
@@ -0,0 +1,266 @@
+"""Histórico de frequência: rollups materializados, consultas por período e exportação"""
+import csv
+from datetime import timedelta
+from sqlalchemy import select, update, delete, func, literal, union_all
+from models import db, Aluno, Checkin, CheckinArquivo, Sessao, ResumoDiario, FrequenciaMensal, inserir_do_dialeto
+from agenda import agenda
+from relogio import momento
+from clubes import clube_atual
+
+# Linhas buscadas por vez nas exportações (o histórico nunca é carregado inteiro)
+LOTE_EXPORTACAO = 1000
+
+def inicio_do_mes(data):
+    """Primeiro dia do mês da data"""
+    return data.replace(day=1)
+
+def fim_do_mes(data):
+    """Último dia do mês da data"""
+    return (data.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+
+def contabilizar(aluno_id, data, sessao_id, delta):
+    """Soma uma reserva (+1) ou cancelamento (-1) aos rollups, dentro da transação atual"""
+    reservas = 1 if delta > 0 else 0
+    cancelamentos = 1 if delta < 0 else 0
+
+    tabela = ResumoDiario.__table__
+    insercao = inserir_do_dialeto(tabela).values(
+        data=data, sessao_id=sessao_id, checkins=delta,
+        reservas=reservas, cancelamentos=cancelamentos
+    )
+    db.session.execute(insercao.on_conflict_do_update(
+        index_elements=["data", "sessao_id"],
+        set_={
+            "checkins": tabela.c.checkins + delta,
+            "reservas": tabela.c.reservas + reservas,
+            "cancelamentos": tabela.c.cancelamentos + cancelamentos,
+        }
+    ))
+
+    tabela = FrequenciaMensal.__table__
+    insercao = inserir_do_dialeto(tabela).values(mes=inicio_do_mes(data), aluno_id=aluno_id, checkins=delta)
+    db.session.execute(insercao.on_conflict_do_update(
+        index_elements=["mes", "aluno_id"],
+        set_={"checkins": tabela.c.checkins + delta}
+    ))
+
+def _mes_sql(coluna):
+    """Expressão SQL do primeiro dia do mês de uma coluna de data"""
+    if db.engine.dialect.name == 'postgresql':
+        return func.date_trunc('month', coluna).cast(db.Date)
+    return func.date(coluna, 'start of month')
+
+def _historico():
+    """Check-ins da tabela quente e do arquivo (retencao.py) como uma única subconsulta"""
+    def colunas(modelo):
+        return select(modelo.id, modelo.clube_id, modelo.aluno_id, modelo.data, modelo.sessao_id, modelo.criado_em)
+    return union_all(colunas(Checkin), colunas(CheckinArquivo)).subquery("historico")
+
+def reconstruir(inicio=None, fim=None):
+    """Recalcula os rollups a partir dos check-ins (meses inteiros); retorna as linhas diárias gravadas.
+
+    Usado na primeira migração, depois de importações que gravam check-ins
+    diretamente, pelo comando reconstruir-analitico e antes de arquivar um
+    mês. Cada rollup é recalculado com um único INSERT ... SELECT agrupado
+    no banco, somando a tabela quente e o arquivo.
+    """
+    historico = _historico()
+    if inicio is None or fim is None:
+        menor, maior = db.session.execute(select(func.min(historico.c.data), func.max(historico.c.data))).one()
+        if menor is None:
+            return 0
+        inicio = inicio or menor
+        fim = fim or maior
+    inicio, fim = inicio_do_mes(inicio), fim_do_mes(fim)
+
+    try:
+        # Linhas existentes só têm checkins corrigido: reservas e cancelamentos não
+        # podem ser deduzidos da tabela checkins e são preservados
+        tabela = ResumoDiario.__table__
+        total = func.count(historico.c.id)
+        insercao = inserir_do_dialeto(tabela).from_select(
+            ["data", "sessao_id", "checkins", "reservas", "cancelamentos"],
+            select(historico.c.data, historico.c.sessao_id, total, total, literal(0))
+            .where(historico.c.data.between(inicio, fim))
+            .group_by(historico.c.data, historico.c.sessao_id)
+        )
+        linhas = db.session.execute(insercao.on_conflict_do_update(
+            index_elements=["data", "sessao_id"],
+            set_={"checkins": insercao.excluded.checkins}
+        )).rowcount
+        db.session.execute(
+            update(ResumoDiario)
+            .where(
+                ResumoDiario.data.between(inicio, fim),
+                ~select(historico.c.id).where(
+                    historico.c.data == ResumoDiario.data,
+                    historico.c.sessao_id == ResumoDiario.sessao_id
+                ).exists()
+            )
+            .values(checkins=0)
+            .execution_options(synchronize_session=False)
+        )
+
+        db.session.execute(delete(FrequenciaMensal).where(FrequenciaMensal.mes.between(inicio, fim)))
+
+        tabela = FrequenciaMensal.__table__
+        mes = _mes_sql(historico.c.data)
+        insercao = inserir_do_dialeto(tabela).from_select(
+            ["mes", "aluno_id", "checkins"],
+            select(mes, historico.c.aluno_id, func.count(historico.c.id))
+            .where(historico.c.data.between(inicio, fim))
+            .group_by(mes, historico.c.aluno_id)
+        )
+        db.session.execute(insercao)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return linhas
+
+def _sessoes_do_clube():
+    """Subconsulta com as sessões do clube em uso (os rollups são por sessão)"""
+    return select(Sessao.id).where(Sessao.clube_id == clube_atual().id)
+
+def _alunos_do_clube():
+    """Condição que limita uma consulta já ligada a Aluno ao clube em uso"""
+    return Aluno.clube_id == clube_atual().id
+
+def _ocorrencias(dia_semana, inicio, fim):
+    """Quantas vezes um dia da semana aparece no intervalo [inicio, fim]"""
+    primeiro = inicio + timedelta(days=(dia_semana - inicio.weekday()) % 7)
+    return 0 if primeiro > fim else (fim - primeiro).days // 7 + 1
+
+def utilizacao_sessoes(inicio, fim):
+    """Check-ins e ocupação média de cada sessão da grade no período"""
+    somas = dict(db.session.execute(
+        select(ResumoDiario.sessao_id, func.sum(ResumoDiario.checkins))
+        .where(ResumoDiario.data.between(inicio, fim), ResumoDiario.sessao_id.in_(_sessoes_do_clube()))
+        .group_by(ResumoDiario.sessao_id)
+    ).all())
+
+    resultado = []
+    for sessao in agenda.todas():
+        checkins = somas.get(sessao.id) or 0
+        if not sessao.ativa and not checkins:
+            continue
+        vagas = _ocorrencias(sessao.dia_semana, inicio, fim) * sessao.capacidade
+        resultado.append({
+            "sessao_id": sessao.id,
+            "dia_semana": sessao.dia_semana,
+            "rotulo": sessao.rotulo,
+            "checkins": checkins,
+            "vagas": vagas,
+            "ocupacao": round(100 * checkins / vagas, 1) if vagas else 0.0,
+        })
+    return resultado
+
+def serie_diaria(inicio, fim):
+    """Por dia: check-ins em vigor, reservas feitas e cancelamentos"""
+    return [
+        {"data": data, "checkins": checkins, "reservas": reservas, "cancelamentos": cancelamentos}
+        for data, checkins, reservas, cancelamentos in db.session.execute(
+            select(
+                ResumoDiario.data, func.sum(ResumoDiario.checkins),
+                func.sum(ResumoDiario.reservas), func.sum(ResumoDiario.cancelamentos)
+            )
+            .where(ResumoDiario.data.between(inicio, fim), ResumoDiario.sessao_id.in_(_sessoes_do_clube()))
+            .group_by(ResumoDiario.data)
+            .order_by(ResumoDiario.data)
+        )
+    ]
+
+def resumo_mensal(inicio, fim):
+    """Por mês: alunos distintos, check-ins e créditos consumidos por dia"""
+    resultado = []
+    for mes, alunos, checkins in db.session.execute(
+        select(FrequenciaMensal.mes, func.count(FrequenciaMensal.aluno_id), func.sum(FrequenciaMensal.checkins))
+        .join(Aluno, Aluno.id == FrequenciaMensal.aluno_id)
+        .where(FrequenciaMensal.mes.between(inicio_do_mes(inicio), fim), FrequenciaMensal.checkins > 0,
+               _alunos_do_clube())
+        .group_by(FrequenciaMensal.mes)
+        .order_by(FrequenciaMensal.mes)
+    ):
+        # Cada check-in em vigor consumiu um crédito; o mês corrente conta só até hoje
+        dias = (min(fim_do_mes(mes), momento().hoje) - mes).days + 1
+        resultado.append({
+            "mes": mes,
+            "alunos": alunos,
+            "checkins": checkins,
+            "creditos_por_dia": round(checkins / max(dias, 1), 1),
+        })
+    return resultado
+
+def frequencia_alunos(inicio, fim, limite=20):
+    """Alunos mais frequentes nos meses do período"""
+    total = func.sum(FrequenciaMensal.checkins)
+    return [
+        {"nome": nome, "checkins": checkins, "meses": meses}
+        for nome, checkins, meses in db.session.execute(
+            select(Aluno.nome, total, func.count(FrequenciaMensal.mes))
+            .join(Aluno, Aluno.id == FrequenciaMensal.aluno_id)
+            .where(FrequenciaMensal.mes.between(inicio_do_mes(inicio), fim), FrequenciaMensal.checkins > 0,
+                   _alunos_do_clube())
+            .group_by(Aluno.id, Aluno.nome)
+            .order_by(total.desc(), Aluno.nome)
+            .limit(limite)
+        )
+    ]
+
+class _Eco:
+    """Destino do csv.writer que devolve a linha em vez de gravá-la"""
+
+    def write(self, texto):
+        return texto
+
+def _checkins_do_periodo(inicio, fim):
+    """Check-ins brutos do clube no período, incluindo os já arquivados"""
+    historico = _historico()
+    return (
+        select(historico.c.data, historico.c.sessao_id, historico.c.aluno_id, Aluno.nome, historico.c.criado_em)
+        .join(Aluno, Aluno.id == historico.c.aluno_id)
+        .where(historico.c.clube_id == clube_atual().id, historico.c.data.between(inicio, fim))
+        .order_by(historico.c.data, historico.c.id)
+    )
+
+# Exportações: tipo -> (cabeçalho, função(inicio, fim) que monta o SELECT).
+# A coluna "horario" não vem do SELECT: é preenchida pela agenda a partir de sessao_id.
+EXPORTACOES = {
+    "diario": (
+        ["data", "sessao_id", "horario", "checkins", "reservas", "cancelamentos"],
+        lambda inicio, fim: select(
+            ResumoDiario.data, ResumoDiario.sessao_id,
+            ResumoDiario.checkins, ResumoDiario.reservas, ResumoDiario.cancelamentos
+        ).where(ResumoDiario.data.between(inicio, fim), ResumoDiario.sessao_id.in_(_sessoes_do_clube()))
+         .order_by(ResumoDiario.data, ResumoDiario.sessao_id)
+    ),
+    "mensal": (
+        ["mes", "aluno_id", "nome", "checkins"],
+        lambda inicio, fim: select(
+            FrequenciaMensal.mes, FrequenciaMensal.aluno_id, Aluno.nome, FrequenciaMensal.checkins
+        ).join(Aluno, Aluno.id == FrequenciaMensal.aluno_id)
+         .where(FrequenciaMensal.mes.between(inicio_do_mes(inicio), fim), _alunos_do_clube())
+         .order_by(FrequenciaMensal.mes, Aluno.nome)
+    ),
+    "checkins": (
+        ["data", "sessao_id", "horario", "aluno_id", "nome", "criado_em"],
+        _checkins_do_periodo
+    ),
+}
+
+def exportar_csv(tipo, inicio, fim):
+    """Gera o CSV linha a linha, buscando LOTE_EXPORTACAO linhas por vez (cursor no servidor no Postgres)"""
+    cabecalho, consulta = EXPORTACOES[tipo]
+    escritor = csv.writer(_Eco())
+    yield escritor.writerow(cabecalho)
+
+    horario = cabecalho.index("horario") if "horario" in cabecalho else None
+    resultado = db.session.execute(
+        consulta(inicio, fim).execution_options(yield_per=LOTE_EXPORTACAO)
+    )
+    for linha in resultado:
+        valores = list(linha)
+        if horario is not None:
+            sessao = agenda.sessao(valores[horario - 1])
+            valores.insert(horario, sessao.rotulo if sessao else "")
+        yield escritor.writerow(valores)
@@ -0,0 +1,11 @@
+"""Utilitários comuns dos benchmarks"""
+from datetime import datetime
+
+def fixar_relogio(app, hora=8):
+    """Para o relógio do app às `hora` de hoje no fuso do clube: as sessões do dia seguem abertas e canceláveis"""
+    from relogio import FUSO, fixar
+    return fixar(app, datetime.now(FUSO).replace(hour=hora, minute=0, second=0, microsecond=0))
+
+def data_local(app):
+    """Data local do relógio do app (não a do servidor, que pode estar em UTC)"""
+    return app.extensions["relogio"].agora().date()
@@ -0,0 +1,190 @@
+"""Lista de espera: volume de requisições num horário lotado e promoção sob cancelamentos simultâneos.
+
+Uso (a partir da pasta GalpaoCheckin/):
+    python -m bench.espera                        # SQLite temporário
+    python -m bench.espera --esperando 100 --cancelamentos 6
+
+Cenário "atualizar": sem lista de espera, quem quer a vaga repete o
+check-in a cada --intervalo segundos até conseguir (o comportamento que a
+fila substitui). Cenário "fila": cada aluno entra na fila com uma única
+requisição e recebe a vaga por promoção; os cancelamentos são disparados
+todos ao mesmo tempo para verificar ordem FIFO, débito único e contador.
+
+Use sempre um banco descartável: o teste cria alunos "espera-*" e apaga
+as reservas e a fila de hoje da sessão testada.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from bench import fixar_relogio, data_local
+
+def preparar(app, sessao, esperando, creditos):
+    """Lota a sessão de hoje com titulares e zera a fila; retorna (titulares, candidatos, ids por nome)"""
+    from models import db, Aluno, Checkin, VagaSessao, Espera
+    from clubes import clube_atual
+    from reservas import reservar
+
+    hoje = data_local(app)
+    titulares = [f"espera-t-{i:03d}" for i in range(sessao.capacidade)]
+    candidatos = [f"espera-c-{i:04d}" for i in range(esperando)]
+    with app.app_context():
+        Checkin.query.filter_by(data=hoje, sessao_id=sessao.id).delete()
+        Espera.query.filter_by(data=hoje, sessao_id=sessao.id).delete()
+        VagaSessao.query.filter_by(data=hoje, sessao_id=sessao.id).delete()
+        existentes = {a.nome: a for a in Aluno.query.filter(Aluno.nome.in_(titulares + candidatos))}
+        for nome in titulares + candidatos:
+            aluno = existentes.get(nome)
+            if aluno:
+                aluno.creditos = creditos
+            else:
+                db.session.add(Aluno(clube_id=clube_atual().id, nome=nome, senha=nome, pagamento="carga", creditos=creditos))
+        db.session.commit()
+        ids = dict(db.session.query(Aluno.nome, Aluno.id).filter(Aluno.nome.in_(titulares + candidatos)))
+        for nome in titulares:
+            reservar(ids[nome], hoje, sessao.id, sessao.capacidade)
+    return [ids[n] for n in titulares], [ids[n] for n in candidatos], ids
+
+def cliente(app, nome):
+    http = app.test_client()
+    with http.session_transaction() as sessao:
+        sessao["usuario"] = nome
+    return http
+
+def cancelar_em_paralelo(app, titulares, sessao):
+    """Cancela as reservas dos titulares todas ao mesmo tempo"""
+    from reservas import cancelar_reserva
+
+    largada = threading.Barrier(len(titulares))
+
+    def cancelar(aluno_id):
+        with app.app_context():
+            largada.wait()
+            cancelar_reserva(aluno_id, data_local(app), sessao.id, sessao.capacidade)
+
+    threads = [threading.Thread(target=cancelar, args=(a,)) for a in titulares]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+def cenario_atualizar(app, sessao, candidatos, titulares, intervalo, duracao):
+    """Candidatos repetem o check-in até conseguir; cancelamentos espalhados na duração"""
+    from reservas import cancelar_reserva
+
+    pedidos = [0]
+    trava = threading.Lock()
+    fim = threading.Event()
+
+    def insistir(nome):
+        http = cliente(app, nome)
+        while not fim.is_set():
+            resposta = http.get(f"/checkin/{sessao.id}", follow_redirects=False)
+            with trava:
+                pedidos[0] += 1
+            with http.session_transaction() as s:
+                mensagens = [m for _, m in s.get("_flashes", [])]
+                s.pop("_flashes", None)
+            if resposta.status_code == 302 and any("sucesso" in m for m in mensagens):
+                return
+            fim.wait(intervalo)
+
+    threads = [threading.Thread(target=insistir, args=(nome,)) for nome in candidatos]
+    inicio = time.perf_counter()
+    for t in threads:
+        t.start()
+    with app.app_context():
+        for aluno_id in titulares:
+            time.sleep(duracao / len(titulares))
+            cancelar_reserva(aluno_id, data_local(app), sessao.id, sessao.capacidade)
+    time.sleep(intervalo * 2)
+    fim.set()
+    for t in threads:
+        t.join()
+    return pedidos[0], time.perf_counter() - inicio
+
+def cenario_fila(app, sessao, candidatos, titulares):
+    """Candidatos entram na fila uma vez; os titulares cancelam juntos"""
+    from models import Espera
+
+    for nome in candidatos:
+        cliente(app, nome).get(f"/espera/{sessao.id}")
+    with app.app_context():
+        ordem = [e.aluno_id for e in Espera.query.filter_by(data=data_local(app), sessao_id=sessao.id).order_by(Espera.id)]
+    inicio = time.perf_counter()
+    cancelar_em_paralelo(app, titulares, sessao)
+    return len(candidatos), time.perf_counter() - inicio, ordem
+
+def verificar(app, sessao, ordem, titulares, cancelados, creditos):
+    """Confere promoção FIFO, débito único e contador de vagas após os cancelamentos"""
+    from models import Aluno, Checkin, VagaSessao, Espera
+
+    hoje = data_local(app)
+    with app.app_context():
+        reservados = {c.aluno_id for c in Checkin.query.filter_by(data=hoje, sessao_id=sessao.id)}
+        vaga = VagaSessao.query.filter_by(data=hoje, sessao_id=sessao.id).first()
+        fila = [e.aluno_id for e in Espera.query.filter_by(data=hoje, sessao_id=sessao.id).order_by(Espera.id)]
+        saldos = dict(Aluno.query.with_entities(Aluno.id, Aluno.creditos).filter(Aluno.id.in_(ordem + cancelados)))
+
+    esperados = ordem[:len(cancelados)]
+    promovidos = reservados - set(titulares)
+    problemas = []
+    if set(esperados) != promovidos:
+        problemas.append(f"promovidos fora da ordem da fila: {sorted(promovidos)} != {sorted(esperados)}")
+    if vaga is None or vaga.ocupadas != len(reservados):
+        problemas.append(f"contador de vagas divergente: {vaga.ocupadas if vaga else None} != {len(reservados)}")
+    if fila != ordem[len(cancelados):]:
+        problemas.append("fila restante fora de ordem")
+    debitos = [creditos - saldos[a] for a in esperados]
+    if any(d != 1 for d in debitos):
+        problemas.append(f"débitos dos promovidos diferentes de 1: {debitos}")
+    if any(saldos[a] != creditos for a in cancelados):
+        problemas.append("titulares sem reembolso")
+    return problemas
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--esperando", type=int, default=50)
+    parser.add_argument("--cancelamentos", type=int, default=6)
+    parser.add_argument("--intervalo", type=float, default=0.25, help="Segundos entre tentativas no cenário atualizar")
+    parser.add_argument("--duracao", type=float, default=3.0, help="Segundos em que os cancelamentos se espalham")
+    parser.add_argument("--creditos", type=int, default=5)
+    args = parser.parse_args()
+
+    if not os.environ.get("DATABASE_URL"):
+        arquivo = os.path.join(tempfile.mkdtemp(), "espera.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{arquivo}"
+
+    from main import app, init_db
+    from agenda import agenda
+
+    init_db(app)
+    fixar_relogio(app)
+    with app.app_context():
+        sessao = agenda.do_dia(data_local(app))[0]
+    cancelamentos = min(args.cancelamentos, sessao.capacidade)
+    print(f"Sessão {sessao.rotulo} ({sessao.capacidade} vagas), {args.esperando} interessados, "
+          f"{cancelamentos} cancelamentos")
+
+    titulares, candidatos, ids = preparar(app, sessao, args.esperando, args.creditos)
+    nomes = {v: k for k, v in ids.items()}
+    pedidos, segundos = cenario_atualizar(
+        app, sessao, [nomes[c] for c in candidatos], titulares[:cancelamentos], args.intervalo, args.duracao
+    )
+    print(f"Atualizar a página: {pedidos} requisições em {segundos:.1f} s ({pedidos / segundos:.0f}/s)")
+
+    titulares, candidatos, ids = preparar(app, sessao, args.esperando, args.creditos)
+    pedidos_fila, segundos, ordem = cenario_fila(app, sessao, [nomes[c] for c in candidatos], titulares[:cancelamentos])
+    print(f"Lista de espera:    {pedidos_fila} requisições (+1 conexão SSE por aluno); "
+          f"{cancelamentos} cancelamentos simultâneos promovidos em {segundos * 1000:.0f} ms")
+    print(f"Redução: {pedidos / max(pedidos_fila, 1):.1f}x menos requisições")
+
+    problemas = verificar(app, sessao, ordem, titulares, titulares[:cancelamentos], args.creditos)
+    for problema in problemas:
+        print(f"FALHA: {problema}")
+    return 1 if problemas else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
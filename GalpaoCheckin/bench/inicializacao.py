@@ -0,0 +1,62 @@
+"""Mede o tempo de subida a frio: import do app até a primeira resposta.
+
+Uso (a partir da pasta GalpaoCheckin/):
+    python -m bench.inicializacao --rodadas 10
+
+Cada rodada é um processo Python novo. Compara a subida normal (sem tocar
+no banco) com INICIALIZAR_BANCO=1, que cria o esquema e aplica migrações.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+PASTA_APP = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCRIPT = """
+import time
+inicio = time.perf_counter()
+from main import app
+importado = time.perf_counter()
+resposta = app.test_client().get("/")
+respondido = time.perf_counter()
+assert resposta.status_code == 200, resposta.status_code
+print(importado - inicio, respondido - inicio)
+"""
+
+def rodar(ambiente):
+    """Executa uma subida a frio e retorna (import, primeira resposta, processo) em segundos"""
+    inicio = time.perf_counter()
+    saida = subprocess.run(
+        [sys.executable, "-c", SCRIPT],
+        cwd=PASTA_APP, env=ambiente, capture_output=True, text=True, check=True
+    ).stdout
+    total = time.perf_counter() - inicio
+    importado, respondido = (float(v) for v in saida.split())
+    return importado, respondido, total
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rodadas", type=int, default=10)
+    args = parser.parse_args()
+
+    ambiente = dict(os.environ)
+    if not ambiente.get("DATABASE_URL"):
+        ambiente["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'inicio.db')}"
+
+    cenarios = [
+        ("app factory (padrão)", {}),
+        ("INICIALIZAR_BANCO=1", {"INICIALIZAR_BANCO": "1"}),
+    ]
+    for rotulo, extra in cenarios:
+        medidas = [rodar({**ambiente, **extra}) for _ in range(args.rodadas)]
+        importado, respondido, total = (statistics.median(m[i] for m in medidas) for i in range(3))
+        print(f"{rotulo:24s} import {importado * 1000:7.1f} ms  "
+              f"1ª resposta {respondido * 1000:7.1f} ms  "
+              f"processo {total * 1000:7.1f} ms  (mediana de {args.rodadas})")
+
+if __name__ == "__main__":
+    main()
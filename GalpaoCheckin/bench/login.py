@@ -0,0 +1,107 @@
+"""Carga no login: logins legítimos simultâneos e uma rajada de força bruta.
+
+Uso (a partir da pasta GalpaoCheckin/):
+    python -m bench.login                     # SQLite temporário
+    python -m bench.login --clientes 50 --rajada 500
+
+Os logins legítimos medem logins/s e latência com o hash scrypt rodando no
+pool limitado. A rajada repete senhas erradas para um mesmo aluno e mostra
+que as tentativas recusadas pelo limitador (HTTP 429) saem sem calcular hash.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from bench.carga_checkin import percentil
+
+def preparar(app, clientes):
+    """Cria alunos de teste com senha em hash (senha = nome)"""
+    from models import db, Aluno
+    from clubes import clube_atual
+    from senhas import gerar_hashes
+
+    nomes = [f"login-{i:04d}" for i in range(clientes)]
+    with app.app_context():
+        Aluno.query.filter(Aluno.nome.in_(nomes)).delete()
+        for nome, senha in zip(nomes, gerar_hashes(nomes)):
+            db.session.add(Aluno(clube_id=clube_atual().id, nome=nome, senha=senha, pagamento="carga", creditos=0))
+        db.session.commit()
+    return nomes
+
+def logar(app, pares, ip_por_cliente=True):
+    """Dispara um POST /usuario por par (nome, senha); retorna latências e status HTTP"""
+    latencias = []
+    status = []
+    trava = threading.Lock()
+    largada = threading.Barrier(len(pares))
+
+    def cliente(i, nome, senha):
+        http = app.test_client()
+        ip = f"10.0.{i // 250}.{i % 250}" if ip_por_cliente else "10.9.9.9"
+        largada.wait()
+        inicio = time.perf_counter()
+        resposta = http.post("/usuario", data={"nome": nome, "senha": senha},
+                             environ_base={"REMOTE_ADDR": ip})
+        decorrido = time.perf_counter() - inicio
+        with trava:
+            latencias.append(decorrido)
+            status.append(resposta.status_code)
+
+    threads = [threading.Thread(target=cliente, args=(i, n, s)) for i, (n, s) in enumerate(pares)]
+    inicio = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return sorted(latencias), status, time.perf_counter() - inicio
+
+def resumir(rotulo, latencias, status, total):
+    contagem = {codigo: status.count(codigo) for codigo in sorted(set(status))}
+    print(f"{rotulo}: {len(status)} tentativas em {total:.2f} s "
+          f"({len(status) / total:.0f}/s)  HTTP {contagem}")
+    print(f"  p50 {percentil(latencias, 50) * 1000:.1f} ms  p99 {percentil(latencias, 99) * 1000:.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clientes", type=int, default=50)
+    parser.add_argument("--rajada", type=int, default=500)
+    args = parser.parse_args()
+
+    if not os.environ.get("DATABASE_URL"):
+        arquivo = os.path.join(tempfile.mkdtemp(), "login.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{arquivo}"
+
+    import senhas
+    from main import app, init_db
+
+    init_db(app)
+    nomes = preparar(app, args.clientes)
+    print(f"scrypt N={senhas.SCRYPT_N} r={senhas.SCRYPT_R} p={senhas.SCRYPT_P}  "
+          f"pool {senhas.THREADS_SENHA} threads, fila {senhas.FILA_SENHA}")
+
+    resumir("Logins legítimos", *logar(app, [(nome, nome) for nome in nomes]))
+
+    # Conta quantos hashes a rajada realmente calculou
+    calculados = [0]
+    original = senhas._scrypt
+    def contar(*a):
+        calculados[0] += 1
+        return original(*a)
+    senhas._scrypt = contar
+    try:
+        rajada = logar(app, [(nomes[0], "errada")] * args.rajada, ip_por_cliente=False)
+    finally:
+        senhas._scrypt = original
+    resumir("Força bruta (um aluno, um IP)", *rajada)
+    print(f"  hashes calculados: {calculados[0]} de {args.rajada} tentativas")
+
+    falhas = rajada[1].count(200) > 5
+    if falhas:
+        print("FALHA: a rajada passou do limite de tentativas por aluno")
+    return 1 if falhas else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,145 @@
+"""Tempo de renderização dos painéis com e sem cache de fragmentos, e compilação dos templates.
+
+Uso (a partir da pasta GalpaoCheckin/):
+    python -m bench.render                        # SQLite temporário
+    python -m bench.render --alunos 50 --requisicoes 300
+
+Renderização: mede o tempo de template (registro de metricas.py) de
+admin.html e painel_usuario.html em três cenários: sem cache de
+fragmentos (como antes), cache quente e cache frio (versão dos dados
+tocada antes de cada requisição, como logo depois de uma reserva).
+
+Compilação: tempo para carregar todos os templates num Environment novo,
+como um worker recém-criado, compilando do zero e com o cache de bytecode
+em disco já preenchido.
+
+Use sempre um banco descartável: o teste cria alunos "render-NNN" com
+check-ins hoje.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from bench import fixar_relogio, data_local
+
+def preparar(app, alunos):
+    """Cria os alunos de teste e reserva as sessões de hoje para eles; retorna o id do primeiro"""
+    from models import db, Aluno
+    from clubes import clube_atual
+    from agenda import agenda
+    from reservas import reservar
+
+    nomes = [f"render-{i:03d}" for i in range(alunos)]
+    hoje = data_local(app)
+    with app.app_context():
+        existentes = {a.nome for a in Aluno.query.filter(Aluno.nome.in_(nomes))}
+        for nome in nomes:
+            if nome not in existentes:
+                db.session.add(Aluno(clube_id=clube_atual().id, nome=nome, senha="render", pagamento="render", creditos=20))
+        db.session.commit()
+        ids = [i for (i,) in db.session.query(Aluno.id).filter(Aluno.nome.in_(nomes)).order_by(Aluno.nome)]
+        for sessao in agenda.do_dia(hoje):
+            for aluno_id in ids[:sessao.capacidade]:
+                reservar(aluno_id, hoje, sessao.id, sessao.capacidade)
+    return ids[0]
+
+def medir_render(app, rotas, requisicoes):
+    """Milissegundos médios de template por página em cada cenário"""
+    from fragmentos import fragmentos
+    from metricas import metricas
+
+    def tocar():
+        with app.app_context():
+            fragmentos.tocar()
+
+    cenarios = {
+        "sem cache": lambda: None,
+        "cache quente": lambda: None,
+        "cache frio": tocar,
+    }
+    resultado = {}
+    for cenario, antes in cenarios.items():
+        fragmentos.ativo = cenario != "sem cache"
+        tocar()
+        for template, (url, sessao) in rotas.items():
+            http = app.test_client()
+            with http.session_transaction() as s:
+                s.update(sessao)
+            http.get(url)  # aquece os caches de dados e, no cenário quente, os fragmentos
+            metricas.limpar()
+            for _ in range(requisicoes):
+                antes()
+                resposta = http.get(url)
+                assert resposta.status_code == 200, (url, resposta.status_code)
+            total, soma = metricas.templates.serie(template)
+            resultado[(cenario, template)] = soma / total * 1000
+    fragmentos.ativo = True
+    return resultado
+
+def medir_compilacao(app, rodadas):
+    """Milissegundos para carregar todos os templates num Environment novo (sem e com bytecode em disco)"""
+    from jinja2 import FileSystemBytecodeCache
+    from fragmentos import fragmentos, ExtensaoFragmento
+
+    pasta = tempfile.mkdtemp()
+    nomes = app.jinja_env.list_templates(extensions=["html"])
+
+    def carregar(bytecode):
+        ambiente = app.create_jinja_environment()
+        ambiente.add_extension(ExtensaoFragmento)
+        ambiente.cache_fragmentos = fragmentos
+        ambiente.bytecode_cache = FileSystemBytecodeCache(pasta) if bytecode else None
+        inicio = time.perf_counter()
+        for nome in nomes:
+            ambiente.get_template(nome)
+        return (time.perf_counter() - inicio) * 1000
+
+    with app.app_context():
+        carregar(True)  # preenche o cache em disco
+        return {
+            "compilando": statistics.median(carregar(False) for _ in range(rodadas)),
+            "bytecode em disco": statistics.median(carregar(True) for _ in range(rodadas)),
+        }, len(nomes)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--alunos", type=int, default=50, help="Alunos na primeira página do admin")
+    parser.add_argument("--requisicoes", type=int, default=200, help="Requisições por página e cenário")
+    parser.add_argument("--rodadas", type=int, default=20, help="Rodadas da medição de compilação")
+    args = parser.parse_args()
+
+    if not os.environ.get("DATABASE_URL"):
+        arquivo = os.path.join(tempfile.mkdtemp(), "render.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{arquivo}"
+
+    from main import app, init_db
+
+    init_db(app)
+    fixar_relogio(app)
+    aluno_id = preparar(app, args.alunos)
+    rotas = {
+        "admin.html": ("/admin", {"admin": True}),
+        "painel_usuario.html": ("/painel_usuario", {"aluno_id": aluno_id}),
+    }
+
+    resultado = medir_render(app, rotas, args.requisicoes)
+    print(f"Renderização (ms de template por requisição, média de {args.requisicoes}):")
+    for template in rotas:
+        base = resultado[("sem cache", template)]
+        linha = "  ".join(
+            f"{cenario} {resultado[(cenario, template)]:6.3f}"
+            + ("" if cenario == "sem cache" else f" ({base / resultado[(cenario, template)]:4.1f}x)")
+            for cenario in ("sem cache", "cache quente", "cache frio")
+        )
+        print(f"  {template:<20} {linha}")
+
+    compilacao, quantos = medir_compilacao(app, args.rodadas)
+    print(f"Compilação de {quantos} templates num worker novo (mediana de {args.rodadas}):")
+    for cenario, ms in compilacao.items():
+        print(f"  {cenario:<18} {ms:7.2f} ms")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
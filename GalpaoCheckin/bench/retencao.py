@@ -0,0 +1,121 @@
+"""Consultas do caminho quente com histórico crescente, com e sem retenção de check-ins.
+
+Uso (a partir da pasta GalpaoCheckin/):
+    python -m bench.retencao                      # dois SQLite temporários
+    python -m bench.retencao --escalas 10000,100000,500000 --dias 90
+
+Dois bancos recebem o mesmo histórico (dias passados, sessões cheias). No
+banco "com retenção" o arquivamento (retencao.arquivar, o mesmo do comando
+arquivar-checkins) roda depois de cada escala, então checkins guarda só os
+meses recentes; no "sem retenção" a tabela guarda tudo. Para cada escala
+mede a mediana, em milissegundos, do que o app faz sem cache: ocupação dos
+próximos 7 dias (calendário e reservas), resumo da última semana (painel
+admin) e uma reserva seguida do cancelamento, que atualizam os índices de
+checkins.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from bench import fixar_relogio, data_local
+from bench.suite import preparar, crescer_historico
+
+def criar_banco(url):
+    """App apontado para `url`, com esquema criado e relógio fixo"""
+    from main import create_app, init_db
+
+    app = create_app({"SQLALCHEMY_DATABASE_URI": url})
+    init_db(app)
+    fixar_relogio(app)
+    return app
+
+def medir(app, aluno_id, repeticoes):
+    """Mediana em ms de cada operação e linhas em checkins"""
+    from models import db, Checkin
+    from agenda import agenda
+    from clubes import clube_atual
+    from ocupacao import CacheOcupacao
+    from resumo import ResumoCheckins
+    from reservas import reservar, cancelar_reserva
+    from sqlalchemy import select, func
+
+    hoje = data_local(app)
+    amanha = hoje + timedelta(days=1)
+    with app.app_context():
+        clube_id = clube_atual().id
+        sessao = agenda.do_dia(amanha)[0]
+        operacoes = {
+            "ocupação 7 dias": lambda: CacheOcupacao(clube_id)._carregar(hoje, hoje + timedelta(days=6)),
+            "resumo da semana": lambda: ResumoCheckins(clube_id)._carregar(hoje),
+            "reserva+cancelamento": lambda: (
+                reservar(aluno_id, amanha, sessao.id, sessao.capacidade),
+                cancelar_reserva(aluno_id, amanha, sessao.id, sessao.capacidade),
+            ),
+        }
+        resultado = {"linhas em checkins": db.session.execute(select(func.count(Checkin.id))).scalar()}
+        for nome, operacao in operacoes.items():
+            operacao()  # aquece o cache de páginas do banco
+            tempos = []
+            for _ in range(repeticoes):
+                inicio = time.perf_counter()
+                operacao()
+                tempos.append(time.perf_counter() - inicio)
+            resultado[nome] = statistics.median(tempos) * 1000
+    return resultado
+
+def arquivar(app, dias):
+    """Roda o arquivamento até o horizonte; retorna os check-ins movidos"""
+    import retencao
+
+    with app.app_context():
+        return sum(movidos for _, movidos in retencao.arquivar(retencao.horizonte(dias)))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--alunos", type=int, default=200)
+    parser.add_argument("--escalas", default="10000,50000,200000", help="Totais de check-ins no histórico")
+    parser.add_argument("--dias", type=int, default=90, help="Retenção da tabela quente (arquivar-checkins --dias)")
+    parser.add_argument("--repeticoes", type=int, default=50, help="Repetições de cada operação por escala")
+    args = parser.parse_args()
+
+    pasta = tempfile.mkdtemp()
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(pasta, 'principal.db')}")
+    bancos = {
+        "sem retenção": criar_banco(f"sqlite:///{os.path.join(pasta, 'sem.db')}"),
+        "com retenção": criar_banco(f"sqlite:///{os.path.join(pasta, 'com.db')}"),
+    }
+    estado = {}
+    for rotulo, app in bancos.items():
+        _, ids = preparar(app, args.alunos, creditos=10 ** 6)
+        estado[rotulo] = (ids, 0, data_local(app) - timedelta(days=1))
+
+    escalas = sorted(int(e) for e in args.escalas.split(","))
+    medidas = {}
+    for escala in escalas:
+        for rotulo, app in bancos.items():
+            ids, total, dia = estado[rotulo]
+            total, dia = crescer_historico(app, ids, total, escala, dia)
+            estado[rotulo] = (ids, total, dia)
+            if rotulo == "com retenção":
+                inicio = time.perf_counter()
+                movidos = arquivar(app, args.dias)
+                print(f"{escala}: {movidos} check-ins arquivados em {time.perf_counter() - inicio:.1f} s",
+                      file=sys.stderr)
+            medidas[(escala, rotulo)] = medir(app, ids[0], args.repeticoes)
+
+    print(f"Mediana de {args.repeticoes} execuções, retenção de {args.dias} dias (ms):")
+    for escala in escalas:
+        print(f"  histórico {escala}")
+        for operacao in medidas[(escala, "sem retenção")]:
+            valores = [medidas[(escala, rotulo)][operacao] for rotulo in bancos]
+            formato = "{:>10}" if operacao.startswith("linhas") else "{:>10.3f}"
+            print(f"    {operacao:<22}" + "  ".join(
+                f"{rotulo} " + formato.format(valor) for rotulo, valor in zip(bancos, valores)
+            ))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,49 @@
+"""Consultas do cadastro de alunos usadas pelo painel administrativo"""
+from sqlalchemy import select, func
+from models import db, Aluno
+from clubes import clube_atual
+
+POR_PAGINA = 50
+
+def _escapar_like(texto):
+    """Escapa curingas do LIKE para buscar o texto literalmente"""
+    return texto.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def listar_alunos(prefixo="", depois=None, antes=None, por_pagina=POR_PAGINA):
+    """Uma página de alunos do clube em ordem de nome, com paginação keyset e busca por prefixo.
+
+    `depois`/`antes` são o nome do último/primeiro aluno da página vista;
+    a consulta anda pelo índice (clube, nome) sem OFFSET, então o custo de uma
+    página não cresce com o tamanho do cadastro.
+    Retorna (alunos, tem_anterior, tem_proxima).
+    """
+    consulta = select(Aluno).where(Aluno.clube_id == clube_atual().id)
+    if prefixo:
+        consulta = consulta.where(
+            func.lower(Aluno.nome).like(_escapar_like(prefixo.lower()) + "%", escape="\\")
+        )
+
+    if antes is not None:
+        linhas = db.session.execute(
+            consulta.where(Aluno.nome < antes).order_by(Aluno.nome.desc()).limit(por_pagina + 1)
+        ).scalars().all()
+        return list(reversed(linhas[:por_pagina])), len(linhas) > por_pagina, True
+
+    if depois is not None:
+        consulta = consulta.where(Aluno.nome > depois)
+    linhas = db.session.execute(
+        consulta.order_by(Aluno.nome).limit(por_pagina + 1)
+    ).scalars().all()
+    return linhas[:por_pagina], depois is not None, len(linhas) > por_pagina
+
+def totais_alunos():
+    """Total de alunos do clube, soma e média de créditos numa única consulta agregada"""
+    total, creditos = db.session.execute(
+        select(func.count(Aluno.id), func.coalesce(func.sum(Aluno.creditos), 0))
+        .where(Aluno.clube_id == clube_atual().id)
+    ).one()
+    return {
+        "alunos": total,
+        "creditos": creditos,
+        "media_creditos": round(creditos / total, 1) if total else 0
+    }
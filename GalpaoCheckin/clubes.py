@@ -0,0 +1,181 @@
+"""Clubes que dividem o mesmo deploy: resolução por domínio ou caminho e caches separados por clube"""
+import os
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from flask import abort, g, has_request_context, request
+from sqlalchemy import select, inspect
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from models import db, Clube
+
+InfoClube = namedtuple("InfoClube", "id slug nome dominio")
+
+# Clube das instalações com um só local e das requisições sem domínio ou caminho de clube
+CLUBE_PADRAO = os.environ.get("CLUBE_PADRAO", "galpao")
+NOME_PADRAO = "Galpão Tênis de Mesa"
+
+# Clubes sem domínio próprio respondem em /c/<slug>/...
+PREFIXO = "/c/"
+
+class RegistroClubes:
+    """Clubes cadastrados em memória, por id, slug e domínio.
+
+    São poucos e quase nunca mudam: a tabela inteira é relida no máximo a
+    cada CLUBES_TTL segundos (ou na hora, após invalidar()).
+    """
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl if ttl is not None else int(os.environ.get("CLUBES_TTL", "60"))
+        self._trava = threading.Lock()
+        self._indices = None
+        self._carregado_em = 0.0
+
+    def _carregar(self):
+        """Índices da tabela clubes; None se o esquema ainda não foi criado (antes do init-db)"""
+        try:
+            clubes = [InfoClube(c.id, c.slug, c.nome, c.dominio) for c in db.session.execute(select(Clube)).scalars()]
+        except (OperationalError, ProgrammingError):
+            db.session.rollback()
+            if inspect(db.engine).has_table(Clube.__tablename__):
+                raise
+            return None
+        return self._indexar(clubes)
+
+    @staticmethod
+    def _indexar(clubes):
+        return (
+            {c.id: c for c in clubes},
+            {c.slug: c for c in clubes},
+            {c.dominio.lower(): c for c in clubes if c.dominio},
+        )
+
+    def _atual(self):
+        indices = self._indices
+        if indices is None or time.monotonic() - self._carregado_em >= self.ttl:
+            with self._trava:
+                if self._indices is indices:
+                    carregados = self._carregar()
+                    if carregados is None:
+                        # Sem esquema só existe o clube padrão; nada fica em cache
+                        return self._indexar([InfoClube(1, CLUBE_PADRAO, NOME_PADRAO, None)])
+                    self._indices = carregados
+                    self._carregado_em = time.monotonic()
+                indices = self._indices
+        return indices
+
+    def invalidar(self):
+        """Descarta os índices; a próxima consulta relê a tabela"""
+        with self._trava:
+            self._indices = None
+
+    def por_id(self, clube_id):
+        return self._atual()[0].get(clube_id)
+
+    def por_slug(self, slug):
+        return self._atual()[1].get(slug)
+
+    def por_dominio(self, host):
+        return self._atual()[2].get(host.lower())
+
+    def padrao(self):
+        """Clube de CLUBE_PADRAO"""
+        return self.por_slug(CLUBE_PADRAO)
+
+    def todos(self):
+        return sorted(self._atual()[0].values(), key=lambda c: c.id)
+
+    def instalar(self, app):
+        """Liga o prefixo /c/<slug> e expõe clube_atual() nos templates"""
+        app.wsgi_app = PrefixoClube(app.wsgi_app)
+        app.jinja_env.globals["clube_atual"] = clube_atual
+
+def resolver():
+    """Clube da requisição: prefixo /c/<slug>, domínio cadastrado ou o padrão; 404 se o slug não existir"""
+    slug = request.environ.get("galpao.clube")
+    if slug is not None:
+        clube = clubes.por_slug(slug)
+    else:
+        clube = clubes.por_dominio(request.host.split(":")[0]) or clubes.padrao()
+    if clube is None:
+        abort(404)
+    return clube
+
+def clube_atual():
+    """Clube em uso: o fixado por usar(), o da requisição (resolvido uma vez) ou o padrão"""
+    clube = g.get("clube")
+    if clube is not None:
+        return clube
+    if not has_request_context():
+        return clubes.padrao()
+    g.clube = resolver()
+    return g.clube
+
+@contextmanager
+def usar(clube):
+    """Fixa o clube em uso no contexto atual (comandos, worker e benchmarks)"""
+    anterior = g.get("clube")
+    g.clube = clube
+    try:
+        yield clube
+    finally:
+        if anterior is None:
+            g.pop("clube", None)
+        else:
+            g.clube = anterior
+
+class PorClube:
+    """Uma instância de cache por clube, criada sob demanda e escolhida pelo clube em uso.
+
+    Atributos e métodos são repassados à instância de clube_atual(), então
+    quem usa o cache não muda; cada clube tem seus próprios limites e TTL e
+    um clube movimentado não descarta os dados quentes de outro.
+    """
+
+    def __init__(self, fabrica):
+        self._fabrica = fabrica  # fabrica(clube_id) -> instância
+        self._trava = threading.Lock()
+        self._instancias = {}
+
+    def de(self, clube_id):
+        """Instância do clube"""
+        instancia = self._instancias.get(clube_id)
+        if instancia is None:
+            with self._trava:
+                instancia = self._instancias.get(clube_id)
+                if instancia is None:
+                    instancia = self._instancias[clube_id] = self._fabrica(clube_id)
+        return instancia
+
+    def instancias(self):
+        """Instâncias já criadas, de todos os clubes"""
+        return list(self._instancias.values())
+
+    def registrar(self, *evento):
+        """Ouvinte de reservas.py: o evento vai para o cache do clube em uso"""
+        self.de(clube_atual().id).registrar(*evento)
+
+    def __getattr__(self, nome):
+        return getattr(self.de(clube_atual().id), nome)
+
+class PrefixoClube:
+    """Middleware WSGI: /c/<slug>/resto vira /resto com o prefixo no SCRIPT_NAME.
+
+    As rotas continuam as mesmas e o url_for() já gera links com o prefixo
+    do clube.
+    """
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        caminho = environ.get("PATH_INFO", "")
+        if caminho.startswith(PREFIXO):
+            slug, _, resto = caminho[len(PREFIXO):].partition("/")
+            environ["galpao.clube"] = slug
+            environ["SCRIPT_NAME"] = environ.get("SCRIPT_NAME", "") + PREFIXO + slug
+            environ["PATH_INFO"] = "/" + resto
+        return self.wsgi_app(environ, start_response)
+
+# Instância única do processo
+clubes = RegistroClubes()
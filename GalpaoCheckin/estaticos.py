@@ -0,0 +1,149 @@
+"""Arquivos estáticos versionados e requisições condicionais (ETag/304) das páginas"""
+import gzip
+import hashlib
+import json
+import os
+import re
+from flask import current_app, request, send_from_directory, url_for
+
+try:
+    import brotli
+except ImportError:  # brotli é opcional: sem ele só o .gz é gerado
+    brotli = None
+
+PASTA_STATIC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+PASTA_DIST = os.path.join(PASTA_STATIC, "dist")
+MANIFESTO = os.path.join(PASTA_DIST, "manifesto.json")
+
+# Arquivos processados pelo build; o resto de static/ continua servido como está
+ARQUIVOS = ("script.js", "style.css")
+
+# O nome muda a cada conteúdo novo, então o navegador pode guardar para sempre
+CACHE_IMUTAVEL = "public, max-age=31536000, immutable"
+
+# Páginas dinâmicas: o navegador guarda, mas revalida a cada uso (304 se nada mudou)
+CACHE_PAGINAS = "private, no-cache"
+
+TIPOS = {".js": "text/javascript", ".css": "text/css"}
+
+def minificar_js(texto):
+    """Minificação conservadora por linha: tira comentários de linha inteira, recuo e linhas vazias.
+
+    Não mexe em nada dentro das linhas, então strings, regex e template
+    literals ficam intactos; comentários no fim de uma linha de código são
+    mantidos.
+    """
+    linhas = []
+    em_bloco = False
+    for linha in texto.splitlines():
+        linha = linha.strip()
+        if em_bloco:
+            em_bloco = "*/" not in linha
+            continue
+        if linha.startswith("/*"):
+            em_bloco = "*/" not in linha
+            continue
+        if linha and not linha.startswith("//"):
+            linhas.append(linha)
+    return "\n".join(linhas) + "\n"
+
+def minificar_css(texto):
+    """Remove comentários e espaços que não mudam o significado do CSS"""
+    texto = re.sub(r"/\*.*?\*/", "", texto, flags=re.S)
+    texto = re.sub(r"\s+", " ", texto)
+    texto = re.sub(r"\s*([{};,>])\s*", r"\1", texto)
+    texto = re.sub(r":\s+", ":", texto)
+    return texto.replace(";}", "}").strip() + "\n"
+
+MINIFICADORES = {".js": minificar_js, ".css": minificar_css}
+
+def construir(origem=PASTA_STATIC, destino=PASTA_DIST):
+    """Minifica, versiona pelo conteúdo e pré-comprime os ARQUIVOS; retorna o manifesto.
+
+    Cada arquivo vira nome.<hash>.ext mais as variantes .gz e .br (se o
+    brotli estiver instalado). Versões antigas ficam na pasta para páginas
+    ainda abertas com o HTML anterior.
+    """
+    os.makedirs(destino, exist_ok=True)
+    manifesto = {}
+    for nome in ARQUIVOS:
+        base, extensao = os.path.splitext(nome)
+        with open(os.path.join(origem, nome), encoding="utf-8") as f:
+            conteudo = MINIFICADORES[extensao](f.read()).encode("utf-8")
+        versionado = f"{base}.{hashlib.sha256(conteudo).hexdigest()[:12]}{extensao}"
+        caminho = os.path.join(destino, versionado)
+        with open(caminho, "wb") as f:
+            f.write(conteudo)
+        # mtime fixo: o .gz sai idêntico a cada build do mesmo conteúdo
+        with open(caminho + ".gz", "wb") as f:
+            f.write(gzip.compress(conteudo, compresslevel=9, mtime=0))
+        if brotli is not None:
+            with open(caminho + ".br", "wb") as f:
+                f.write(brotli.compress(conteudo, quality=11))
+        manifesto[nome] = versionado
+
+    temporario = os.path.join(destino, "manifesto.json.tmp")
+    with open(temporario, "w", encoding="utf-8") as f:
+        json.dump(manifesto, f, indent=2)
+    os.replace(temporario, os.path.join(destino, "manifesto.json"))
+    return manifesto
+
+class Estaticos:
+    """Resolve os nomes versionados no HTML e serve as variantes comprimidas"""
+
+    def __init__(self):
+        self.manifesto = None
+
+    def carregar(self):
+        """Lê o manifesto do build (vazio se o build não rodou)"""
+        try:
+            with open(MANIFESTO, encoding="utf-8") as f:
+                self.manifesto = json.load(f)
+        except (OSError, ValueError):
+            self.manifesto = {}
+        return self.manifesto
+
+    def url(self, nome):
+        """URL versionada do arquivo, ou a de static/ sem build ou em modo debug"""
+        if self.manifesto is None:
+            self.carregar()
+        versionado = None if current_app.debug else self.manifesto.get(nome)
+        if versionado is None:
+            return url_for("static", filename=nome)
+        return url_for("galpao.asset", nome=versionado)
+
+    def servir(self, nome):
+        """Entrega o arquivo versionado na melhor codificação aceita pelo cliente"""
+        tipo = TIPOS.get(os.path.splitext(nome)[1], "application/octet-stream")
+        arquivo, codificacao = nome, None
+        for candidata, sufixo in (("br", ".br"), ("gzip", ".gz")):
+            if request.accept_encodings.quality(candidata) > 0 \
+                    and os.path.exists(os.path.join(PASTA_DIST, nome + sufixo)):
+                arquivo, codificacao = nome + sufixo, candidata
+                break
+
+        resposta = send_from_directory(PASTA_DIST, arquivo, mimetype=tipo)
+        if codificacao:
+            resposta.headers["Content-Encoding"] = codificacao
+        resposta.headers["Vary"] = "Accept-Encoding"
+        resposta.headers["Cache-Control"] = CACHE_IMUTAVEL
+        return resposta
+
+    def instalar(self, app):
+        """Expõe estatico() nos templates e liga o ETag nas páginas dinâmicas"""
+        app.jinja_env.globals["estatico"] = self.url
+        app.after_request(condicional)
+
+def condicional(resposta):
+    """ETag pelo corpo das páginas HTML/JSON: um painel sem mudanças volta como 304 sem corpo"""
+    if request.method not in ("GET", "HEAD") or resposta.status_code != 200 \
+            or resposta.is_streamed or resposta.direct_passthrough \
+            or resposta.mimetype not in ("text/html", "application/json"):
+        return resposta
+    if "Cache-Control" not in resposta.headers:
+        resposta.headers["Cache-Control"] = CACHE_PAGINAS
+    resposta.add_etag()
+    return resposta.make_conditional(request)
+
+# Instância única do processo
+estaticos = Estaticos()
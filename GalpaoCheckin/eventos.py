@@ -0,0 +1,74 @@
+"""Canal de notificação de mudanças de ocupação e fluxo Server-Sent Events"""
+import json
+import threading
+import time
+
+class CanalEventos:
+    """Contador de versão que acorda conexões em espera a cada mudança"""
+
+    def __init__(self):
+        self._condicao = threading.Condition()
+        self.versao = 0
+
+    def publicar(self, *_):
+        """Sinaliza uma mudança; aceita a assinatura dos ouvintes de reservas.py"""
+        with self._condicao:
+            self.versao += 1
+            self._condicao.notify_all()
+
+    # Nome usado por PorClube.registrar para repassar eventos de reservas.py
+    registrar = publicar
+
+    def aguardar(self, versao, timeout):
+        """Bloqueia até a versão mudar ou o timeout expirar; retorna a versão atual"""
+        with self._condicao:
+            self._condicao.wait_for(lambda: self.versao != versao, timeout)
+            return self.versao
+
+def fluxo_sse(calcular, canal, duracao=300, intervalo=15, ping=5):
+    """Gera eventos SSE com o resultado de calcular() sempre que ele mudar.
+
+    Entre mudanças só envia comentários de keep-alive, a cada `ping`
+    segundos: é a escrita que revela um cliente que desconectou, e só então
+    a thread e a vaga em LimiteFluxos são liberadas. A cada intervalo o
+    estado é recalculado mesmo sem aviso, para captar escritas feitas em
+    outros processos. Após `duracao` segundos o fluxo termina e o
+    EventSource do navegador reconecta sozinho.
+    """
+    fim = time.monotonic() + duracao
+    versao = canal.versao
+    ultimo = None
+    yield "retry: 3000\n\n"
+    while time.monotonic() < fim:
+        atual = calcular()
+        if atual != ultimo:
+            yield f"data: {json.dumps(atual)}\n\n"
+            ultimo = atual
+        recalcular = min(time.monotonic() + intervalo, fim)
+        while True:
+            nova = canal.aguardar(versao, max(0, min(ping, recalcular - time.monotonic())))
+            if nova != versao or time.monotonic() >= recalcular:
+                versao = nova
+                break
+            yield ": ping\n\n"
+
+class LimiteFluxos:
+    """Vagas para fluxos SSE abertos ao mesmo tempo no processo.
+
+    Cada fluxo prende uma thread do worker (gthread) enquanto durar; sem
+    limite, poucos painéis abertos tomariam todas as threads e o resto do
+    site pararia. Quem não consegue vaga recebe 503 e o painel passa a
+    consultar /api/status periodicamente.
+    """
+
+    def __init__(self, maximo):
+        self.maximo = maximo
+        self._vagas = threading.BoundedSemaphore(maximo) if maximo > 0 else None
+
+    def entrar(self):
+        """Ocupa uma vaga sem esperar; False se todas estiverem em uso"""
+        return self._vagas is not None and self._vagas.acquire(blocking=False)
+
+    def sair(self):
+        """Libera a vaga ocupada por entrar()"""
+        self._vagas.release()
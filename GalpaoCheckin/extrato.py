@@ -0,0 +1,114 @@
+"""Extrato de créditos: lançamentos só de inclusão ao lado do saldo em Aluno.creditos"""
+from datetime import datetime
+from sqlalchemy import select, update, delete, insert, func, literal
+from models import db, Aluno, MovimentoCredito
+
+# Tipos de lançamento
+COMPRA = "compra"
+DEBITO = "debito"
+REEMBOLSO = "reembolso"
+AJUSTE = "ajuste"
+SALDO = "saldo"  # saldo de abertura ou resultado de uma compactação
+
+def lancar(aluno_id, tipo, quantidade, data=None, sessao_id=None, descricao=None):
+    """Acrescenta um lançamento na transação atual (quem chama já alterou Aluno.creditos)"""
+    db.session.execute(insert(MovimentoCredito.__table__).values(
+        aluno_id=aluno_id, tipo=tipo, quantidade=quantidade, data=data,
+        sessao_id=sessao_id, descricao=descricao, criado_em=datetime.utcnow()
+    ))
+
+def ajustar_saldo(aluno_id, novo_saldo, descricao=None):
+    """Leva o saldo a `novo_saldo` com um incremento atômico e lança a diferença.
+
+    A linha do aluno é bloqueada antes da leitura, então um check-in
+    simultâneo espera e debita sobre o novo saldo em vez de ser
+    sobrescrito. Retorna a diferença lançada (0 se nada mudou).
+    """
+    atual = db.session.execute(
+        select(Aluno.creditos).where(Aluno.id == aluno_id).with_for_update()
+    ).scalar()
+    diferenca = novo_saldo - (atual or 0)
+    if diferenca:
+        db.session.execute(
+            update(Aluno).where(Aluno.id == aluno_id).values(creditos=Aluno.creditos + diferenca)
+        )
+        lancar(aluno_id, COMPRA if diferenca > 0 else AJUSTE, diferenca, descricao=descricao)
+    return diferenca
+
+def abrir_saldos(*condicoes, tipo=SALDO, descricao=None):
+    """Lança o saldo atual de alunos sem nenhum lançamento (um INSERT ... SELECT)"""
+    tabela = MovimentoCredito.__table__
+    sem_lancamentos = ~select(tabela.c.id).where(tabela.c.aluno_id == Aluno.id).exists()
+    return db.session.execute(insert(tabela).from_select(
+        ["aluno_id", "tipo", "quantidade", "descricao", "criado_em"],
+        select(Aluno.id, literal(tipo), Aluno.creditos, literal(descricao), literal(datetime.utcnow()))
+        .where(Aluno.creditos != 0, sem_lancamentos, *condicoes)
+    )).rowcount
+
+def compactar(corte):
+    """Troca os lançamentos anteriores a `corte` por um lançamento de saldo por aluno.
+
+    O total por aluno não muda, então a conciliação continua valendo; só o
+    detalhe anterior ao corte deixa de existir. Retorna (alunos, removidos).
+    """
+    try:
+        somas = db.session.execute(
+            select(MovimentoCredito.aluno_id, func.sum(MovimentoCredito.quantidade), func.count(MovimentoCredito.id))
+            .where(MovimentoCredito.criado_em < corte)
+            .group_by(MovimentoCredito.aluno_id)
+        ).all()
+        # Só compacta quem tem mais de um lançamento antes do corte
+        somas = [(aluno_id, soma) for aluno_id, soma, quantos in somas if quantos > 1]
+        removidos = 0
+        for i in range(0, len(somas), 500):
+            ids = [aluno_id for aluno_id, _ in somas[i:i + 500]]
+            removidos += db.session.execute(
+                delete(MovimentoCredito)
+                .where(MovimentoCredito.criado_em < corte, MovimentoCredito.aluno_id.in_(ids))
+                .execution_options(synchronize_session=False)
+            ).rowcount
+        if somas:
+            db.session.execute(insert(MovimentoCredito.__table__), [
+                {"aluno_id": aluno_id, "tipo": SALDO, "quantidade": soma,
+                 "descricao": f"compactação até {corte:%Y-%m-%d}", "criado_em": corte}
+                for aluno_id, soma in somas
+            ])
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return len(somas), removidos
+
+def conciliar():
+    """Alunos cujo saldo difere da soma do extrato: lista de (aluno_id, nome, saldo, extrato)"""
+    soma = (
+        select(MovimentoCredito.aluno_id, func.sum(MovimentoCredito.quantidade).label("total"))
+        .group_by(MovimentoCredito.aluno_id)
+        .subquery()
+    )
+    total = func.coalesce(soma.c.total, 0)
+    return db.session.execute(
+        select(Aluno.id, Aluno.nome, Aluno.creditos, total)
+        .outerjoin(soma, soma.c.aluno_id == Aluno.id)
+        .where(Aluno.creditos != total)
+        .order_by(Aluno.id)
+    ).all()
+
+def corrigir(divergencias):
+    """Lança ajustes que igualam o extrato aos saldos atuais (o saldo visto pelo aluno prevalece)"""
+    if divergencias:
+        db.session.execute(insert(MovimentoCredito.__table__), [
+            {"aluno_id": aluno_id, "tipo": AJUSTE, "quantidade": saldo - total,
+             "descricao": "conciliação", "criado_em": datetime.utcnow()}
+            for aluno_id, _, saldo, total in divergencias
+        ])
+    db.session.commit()
+
+def extrato(aluno_id, limite=50):
+    """Lançamentos mais recentes de um aluno"""
+    return db.session.execute(
+        select(MovimentoCredito)
+        .where(MovimentoCredito.aluno_id == aluno_id)
+        .order_by(MovimentoCredito.criado_em.desc(), MovimentoCredito.id.desc())
+        .limit(limite)
+    ).scalars().all()
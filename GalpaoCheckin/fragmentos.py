@@ -0,0 +1,114 @@
+"""Cache de fragmentos de template por versão dos dados e bytecode do Jinja em disco"""
+import os
+import tempfile
+import threading
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+from flask import g, has_request_context, request
+from markupsafe import Markup
+from identidade import ArmazemLRU
+from clubes import PorClube, clube_atual
+
+class CacheFragmentos:
+    """HTML renderizado de blocos caros, guardado por clube sob (nome, versão, chave).
+
+    As rotas que escrevem (admin, check-in, cancelamento, grade) chamam
+    tocar(), que sobe a versão do clube em uso. Cada requisição usa as
+    versões lidas no seu início, antes de qualquer consulta: um fragmento
+    renderizado com dados lidos antes de uma escrita fica gravado sob a
+    versão anterior a ela e não é servido depois. A versão é do processo; o
+    TTL limita quanto tempo outro worker mostra um fragmento anterior a uma
+    escrita feita fora dele. O HTML tem links de url_for, então a chave
+    inclui o prefixo da requisição (/c/<slug> ou o domínio do clube).
+    """
+
+    def __init__(self, armazens=None):
+        self.armazens = armazens or PorClube(lambda clube_id: ArmazemLRU(
+            max_itens=int(os.environ.get("FRAGMENTOS_MAX", "2000")),
+            ttl=int(os.environ.get("FRAGMENTOS_TTL", "30"))
+        ))
+        self.ativo = os.environ.get("FRAGMENTOS", "1") == "1"
+        self._trava = threading.Lock()
+        self.versoes = {}  # clube_id -> versão dos dados
+
+    def tocar(self):
+        """Marca os dados do clube em uso como alterados: os fragmentos dele são refeitos"""
+        clube_id = clube_atual().id
+        with self._trava:
+            self.versoes[clube_id] = self.versoes.get(clube_id, 0) + 1
+            self.armazens.de(clube_id).limpar()
+            # A própria requisição que escreveu passa a ler a versão nova
+            if has_request_context() and "versoes_fragmentos" in g:
+                g.versoes_fragmentos[clube_id] = self.versoes[clube_id]
+
+    def _fotografar(self):
+        """Versões no início da requisição (before_request), antes das consultas da view"""
+        g.versoes_fragmentos = dict(self.versoes)
+
+    def _versao(self, clube_id):
+        if has_request_context() and "versoes_fragmentos" in g:
+            return g.versoes_fragmentos.get(clube_id, 0)
+        return self.versoes.get(clube_id, 0)
+
+    def obter(self, nome, chave, renderizar):
+        """HTML do fragmento; chama renderizar() só em falta de cache"""
+        if not self.ativo:
+            return renderizar()
+        clube_id = clube_atual().id
+        armazem = self.armazens.de(clube_id)
+        prefixo = request.script_root if has_request_context() else ""
+        completa = (nome, self._versao(clube_id), prefixo, *chave)
+        html = armazem.obter(completa)
+        if html is None:
+            html = renderizar()
+            armazem.gravar(completa, html)
+        return html
+
+    def registrar(self, evento, aluno_id, data, sessao_id):
+        """Ouvinte de reservas.py: toda reserva, cancelamento ou promoção muda os painéis"""
+        self.tocar()
+
+    def instalar(self, app):
+        """Liga a tag {% fragmento %} e o cache de bytecode no Jinja do app"""
+        app.before_request(self._fotografar)
+        app.jinja_env.add_extension(ExtensaoFragmento)
+        app.jinja_env.cache_fragmentos = self
+        pasta = os.environ.get("JINJA_CACHE") or os.path.join(tempfile.gettempdir(), "galpao-jinja")
+        os.makedirs(pasta, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(pasta)
+
+    def precompilar(self, app):
+        """Compila todos os templates agora (ex.: no master do gunicorn, antes do fork)"""
+        for nome in app.jinja_env.list_templates(extensions=["html"]):
+            app.jinja_env.get_template(nome)
+
+class ExtensaoFragmento(Extension):
+    """{% fragmento "nome", chave1, chave2 %}...{% endfragmento %}
+
+    O corpo só é renderizado se não houver HTML em cache para o nome e as
+    chaves na versão atual dos dados. As chaves devem cobrir tudo o que o
+    corpo usa e não muda com uma escrita (aluno, página, data...).
+    """
+
+    tags = {"fragmento"}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(cache_fragmentos=None)
+
+    def parse(self, parser):
+        linha = next(parser.stream).lineno
+        argumentos = [parser.parse_expression()]
+        while parser.stream.skip_if("comma"):
+            argumentos.append(parser.parse_expression())
+        corpo = parser.parse_statements(["name:endfragmento"], drop_needle=True)
+        return nodes.CallBlock(
+            self.call_method("_renderizar", [nodes.List(argumentos)]), [], [], corpo
+        ).set_lineno(linha)
+
+    def _renderizar(self, argumentos, caller):
+        nome, *chave = argumentos
+        return Markup(self.environment.cache_fragmentos.obter(nome, chave, caller))
+
+# Instância única do processo
+fragmentos = CacheFragmentos()
@@ -0,0 +1,34 @@
+"""Configuração do gunicorn para produção: gunicorn -c gunicorn.conf.py main:app"""
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+
+# Workers com threads: as conexões SSE ocupam uma thread, não um processo inteiro.
+# No máximo metade das threads atende fluxos SSE (SSE_MAX_FLUXOS em main.py);
+# painéis além disso consultam /api/status
+worker_class = "gthread"
+workers = int(os.environ.get("WEB_CONCURRENCY", "2"))
+threads = int(os.environ.get("WEB_THREADS", "8"))
+
+# Carrega o app uma vez no master; os workers herdam o código já importado
+preload_app = True
+
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "30"))
+keepalive = 5
+accesslog = "-"
+
+def when_ready(server):
+    """Compila os templates no master: os workers nascem com eles prontos"""
+    from main import app
+    from fragmentos import fragmentos
+
+    fragmentos.precompilar(app)
+
+def post_fork(server, worker):
+    """Descarta conexões herdadas do master; cada worker abre as suas"""
+    from main import app
+    from models import db
+
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
@@ -0,0 +1,98 @@
+"""Chaves de idempotência da API: a mesma ação reenviada (fila offline do PWA, retry) roda uma vez só"""
+import json
+import os
+import re
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, delete
+from models import db, ChaveIdempotencia, inserir_ignorando_conflito
+
+# Por quanto tempo a resposta de uma chave é lembrada (mais que uma ação fica na fila offline)
+VALIDADE_HORAS = int(os.environ.get("IDEMPOTENCIA_HORAS", "48"))
+
+# Chave sem resposta há mais que isso é de uma requisição que morreu no meio: outra pode assumir
+EM_ANDAMENTO_SEGUNDOS = 30
+
+# Chaves expiradas são apagadas no máximo uma vez por intervalo em cada processo
+INTERVALO_LIMPEZA = 3600
+
+EM_PROCESSAMENTO = "em_processamento"
+CHAVE_REUTILIZADA = "chave_reutilizada"
+
+_FORMATO_CHAVE = re.compile(r"[A-Za-z0-9_-]{8,64}")
+_limpeza = {"ultima": 0.0}
+
+def chave_valida(chave):
+    """UUID ou outro identificador de 8 a 64 caracteres [A-Za-z0-9_-]"""
+    return bool(chave and _FORMATO_CHAVE.fullmatch(chave))
+
+def _limpar_se_preciso(agora):
+    """Apaga as chaves expiradas na transação atual, no máximo uma vez por INTERVALO_LIMPEZA"""
+    if time.monotonic() - _limpeza["ultima"] < INTERVALO_LIMPEZA:
+        return
+    _limpeza["ultima"] = time.monotonic()
+    db.session.execute(delete(ChaveIdempotencia).where(
+        ChaveIdempotencia.criado_em < agora - timedelta(hours=VALIDADE_HORAS)
+    ))
+
+def _em_processamento():
+    return {"resultado": EM_PROCESSAMENTO, "mensagem": "Esta ação ainda está sendo processada. Tente em instantes."}, 409
+
+def executar(aluno_id, chave, pedido, acao):
+    """Resposta (corpo, status) de acao(); repetições com a mesma chave recebem a primeira resposta.
+
+    A chave é gravada antes da ação e a resposta depois dela. Enquanto a
+    primeira requisição não termina, outra com a mesma chave recebe 409
+    (em processamento) em vez de rodar a ação de novo; se a primeira morrer
+    sem responder, a chave pode ser assumida depois de EM_ANDAMENTO_SEGUNDOS
+    (a reserva em si já não debita duas vezes, pela restrição única de
+    checkins). A mesma chave com outro pedido é recusada com 422.
+    """
+    agora = datetime.utcnow()
+    _limpar_se_preciso(agora)
+    gravada = db.session.execute(inserir_ignorando_conflito(ChaveIdempotencia.__table__).values(
+        aluno_id=aluno_id, chave=chave, pedido=pedido, criado_em=agora
+    )).rowcount
+    db.session.commit()
+
+    if not gravada:
+        linha = db.session.execute(
+            select(ChaveIdempotencia.pedido, ChaveIdempotencia.status,
+                   ChaveIdempotencia.resposta, ChaveIdempotencia.criado_em)
+            .where(ChaveIdempotencia.aluno_id == aluno_id, ChaveIdempotencia.chave == chave)
+        ).one()
+        if linha.pedido != pedido:
+            return {"resultado": CHAVE_REUTILIZADA, "mensagem": "Chave de idempotência já usada em outro pedido"}, 422
+        if linha.status is not None:
+            return json.loads(linha.resposta), linha.status
+        if agora - linha.criado_em < timedelta(seconds=EM_ANDAMENTO_SEGUNDOS):
+            return _em_processamento()
+        # UPDATE condicional: só uma das requisições concorrentes assume a chave abandonada
+        assumida = db.session.execute(
+            update(ChaveIdempotencia)
+            .where(ChaveIdempotencia.aluno_id == aluno_id, ChaveIdempotencia.chave == chave,
+                   ChaveIdempotencia.status.is_(None), ChaveIdempotencia.criado_em == linha.criado_em)
+            .values(criado_em=agora)
+        ).rowcount
+        db.session.commit()
+        if not assumida:
+            return _em_processamento()
+
+    try:
+        corpo, status = acao()
+    except Exception:
+        # Falha inesperada: libera a chave para o cliente tentar de novo
+        db.session.rollback()
+        db.session.execute(delete(ChaveIdempotencia).where(
+            ChaveIdempotencia.aluno_id == aluno_id, ChaveIdempotencia.chave == chave
+        ))
+        db.session.commit()
+        raise
+
+    db.session.execute(
+        update(ChaveIdempotencia)
+        .where(ChaveIdempotencia.aluno_id == aluno_id, ChaveIdempotencia.chave == chave)
+        .values(status=status, resposta=json.dumps(corpo, ensure_ascii=False))
+    )
+    db.session.commit()
+    return corpo, status
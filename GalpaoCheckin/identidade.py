@@ -0,0 +1,129 @@
+"""Cache da identidade do aluno logado (id, nome, créditos) por id"""
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from sqlalchemy import select
+from models import db, Aluno
+from clubes import PorClube
+from reservas import RESERVADO, CANCELADO
+
+Identidade = namedtuple("Identidade", "id nome creditos")
+
+class ArmazemLRU:
+    """Armazém em memória do processo com TTL e descarte do menos usado.
+
+    Outro armazém (ex.: compartilhado entre workers) pode ser usado no lugar
+    desde que ofereça obter(chave), gravar(chave, valor), apagar(chave) e
+    limpar().
+    """
+
+    def __init__(self, max_itens=5000, ttl=30):
+        self.max_itens = max_itens
+        self.ttl = ttl
+        self._trava = threading.Lock()
+        self._itens = OrderedDict()  # chave -> (valor, instante da gravação)
+
+    def obter(self, chave):
+        """Valor da chave, ou None se ausente ou expirado"""
+        with self._trava:
+            item = self._itens.get(chave)
+            if item is None:
+                return None
+            if time.monotonic() - item[1] > self.ttl:
+                del self._itens[chave]
+                return None
+            self._itens.move_to_end(chave)
+            return item[0]
+
+    def gravar(self, chave, valor):
+        """Grava o valor e descarta os mais antigos acima do limite"""
+        with self._trava:
+            self._itens[chave] = (valor, time.monotonic())
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.max_itens:
+                self._itens.popitem(last=False)
+
+    def apagar(self, chave):
+        """Remove a chave, se existir"""
+        with self._trava:
+            self._itens.pop(chave, None)
+
+    def limpar(self):
+        """Remove todas as chaves"""
+        with self._trava:
+            self._itens.clear()
+
+class CacheIdentidade:
+    """Identidades dos alunos de um clube por aluno_id, invalidadas por reservas e edições do admin.
+
+    Cada aluno tem uma versão local que sobe a cada invalidação: uma carga
+    do banco iniciada antes de uma invalidação não é gravada depois dela,
+    então o cache nunca volta a um estado anterior à mudança. As versões só
+    importam para cargas em andamento: passando do limite do armazém, a
+    geração sobe e elas são descartadas (cargas em andamento apenas deixam
+    de ser gravadas), então a memória não cresce com cada aluno já
+    invalidado. O TTL do armazém limita a defasagem de mudanças feitas em
+    outros processos.
+    """
+
+    def __init__(self, clube_id, armazem=None):
+        self.clube_id = clube_id
+        self.max_itens = int(os.environ.get("IDENTIDADE_MAX", "5000"))
+        self.armazem = armazem or ArmazemLRU(
+            max_itens=self.max_itens,
+            ttl=int(os.environ.get("IDENTIDADE_TTL", "30"))
+        )
+        self._trava = threading.Lock()
+        self._versoes = {}  # aluno_id -> versão local
+        self._geracao = 0   # sobe a cada limpar()
+
+    def _versao(self, aluno_id):
+        """Marca de versão lida antes de consultar o banco"""
+        with self._trava:
+            return (self._geracao, self._versoes.get(aluno_id, 0))
+
+    def obter(self, aluno_id):
+        """Identidade do aluno (None se não existir ou for de outro clube); consulta o banco só em falta de cache"""
+        identidade = self.armazem.obter(aluno_id)
+        if identidade is not None:
+            return identidade
+        versao = self._versao(aluno_id)
+        linha = db.session.execute(
+            select(Aluno.id, Aluno.nome, Aluno.creditos).where(Aluno.id == aluno_id, Aluno.clube_id == self.clube_id)
+        ).first()
+        if linha is None:
+            return None
+        return self.lembrar(Identidade(*linha), versao)
+
+    def lembrar(self, identidade, versao=None):
+        """Grava uma identidade já lida do banco (ex.: no login) se nada mudou desde a leitura"""
+        with self._trava:
+            atual = (self._geracao, self._versoes.get(identidade.id, 0))
+            if versao is None or versao == atual:
+                self.armazem.gravar(identidade.id, identidade)
+        return identidade
+
+    def invalidar(self, aluno_id):
+        """Descarta a identidade de um aluno (créditos ou nome mudaram)"""
+        with self._trava:
+            if aluno_id not in self._versoes and len(self._versoes) >= self.max_itens:
+                self._geracao += 1
+                self._versoes.clear()
+            self._versoes[aluno_id] = self._versoes.get(aluno_id, 0) + 1
+            self.armazem.apagar(aluno_id)
+
+    def limpar(self):
+        """Descarta todas as identidades (ex.: importação em lote)"""
+        with self._trava:
+            self._geracao += 1
+            self._versoes.clear()
+            self.armazem.limpar()
+
+    def registrar(self, evento, aluno_id, data, sessao_id):
+        """Ouvinte de reservas.py: reserva e cancelamento mudam os créditos"""
+        if evento in (RESERVADO, CANCELADO):
+            self.invalidar(aluno_id)
+
+# Um cache por clube: o limite IDENTIDADE_MAX vale para cada um
+identidades = PorClube(CacheIdentidade)
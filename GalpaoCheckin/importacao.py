@@ -0,0 +1,335 @@
+"""Importação em lote: arquivos JSON legados e planilhas de cadastro de alunos"""
+import csv
+import io
+import json
+import time
+from datetime import datetime
+from sqlalchemy import select, insert, update, func, bindparam, Integer, String
+from models import db, Aluno, Checkin, MovimentoCredito, inserir_ignorando_conflito
+from reservas import recalcular_vagas
+from extrato import abrir_saldos, COMPRA, AJUSTE
+from senhas import gerar_hashes
+from agenda import agenda
+from clubes import clube_atual
+
+TAMANHO_BLOCO = 64 * 1024
+TAMANHO_LOTE = 1000
+
+class _LeitorJson:
+    """Decodifica um documento JSON de nível superior aos pedaços, bloco a bloco"""
+
+    def __init__(self, arquivo, tamanho_bloco=TAMANHO_BLOCO):
+        self.arquivo = arquivo
+        self.tamanho_bloco = tamanho_bloco
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.fim_arquivo = False
+
+    def ler_mais(self):
+        bloco = self.arquivo.read(self.tamanho_bloco)
+        if not bloco:
+            self.fim_arquivo = True
+        self.buffer = self.buffer[self.pos:] + bloco
+        self.pos = 0
+
+    def proximo(self):
+        """Próximo caractere significativo (sem consumi-lo), ou '' no fim"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos].isspace():
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if self.fim_arquivo:
+                return ""
+            self.ler_mais()
+
+    def esperar(self, caracteres):
+        caractere = self.proximo()
+        if not caractere or caractere not in caracteres:
+            raise ValueError(f"JSON inválido: esperado um de '{caracteres}'")
+        self.pos += 1
+        return caractere
+
+    def decodificar(self):
+        self.proximo()
+        while True:
+            try:
+                valor, fim = self.decoder.raw_decode(self.buffer, self.pos)
+                # Um valor que termina no fim do buffer pode estar incompleto
+                if fim < len(self.buffer) or self.fim_arquivo:
+                    self.pos = fim
+                    return valor
+            except json.JSONDecodeError:
+                if self.fim_arquivo:
+                    raise
+            self.ler_mais()
+
+def iterar_objeto_json(caminho, tamanho_bloco=TAMANHO_BLOCO):
+    """Percorre um objeto JSON de nível superior gerando pares (chave, valor).
+
+    O arquivo é lido em blocos e cada valor é decodificado assim que
+    termina, então só um item do objeto fica em memória por vez.
+    """
+    with open(caminho, "r", encoding="utf-8") as arquivo:
+        leitor = _LeitorJson(arquivo, tamanho_bloco)
+        leitor.esperar("{")
+        if leitor.proximo() == "}":
+            return
+        while True:
+            chave = leitor.decodificar()
+            leitor.esperar(":")
+            yield chave, leitor.decodificar()
+            if leitor.esperar(",}") == "}":
+                return
+
+def iterar_lista_json(arquivo, tamanho_bloco=TAMANHO_BLOCO):
+    """Percorre uma lista JSON de nível superior (arquivo texto já aberto), item a item"""
+    leitor = _LeitorJson(arquivo, tamanho_bloco)
+    leitor.esperar("[")
+    if leitor.proximo() == "]":
+        return
+    while True:
+        yield leitor.decodificar()
+        if leitor.esperar(",]") == "]":
+            return
+
+def _gravar_lote(modelo, linhas):
+    """Insere um lote ignorando linhas que já existem; retorna quantas entraram"""
+    if not linhas:
+        return 0
+    resultado = db.session.execute(inserir_ignorando_conflito(modelo.__table__), linhas)
+    return max(resultado.rowcount, 0)
+
+def _gravar_alunos(lote):
+    """Grava um lote de alunos com as senhas convertidas em hash (custo de lote)"""
+    for linha, senha in zip(lote, gerar_hashes([linha["senha"] for linha in lote])):
+        linha["senha"] = senha
+    return _gravar_lote(Aluno, lote)
+
+def importar_alunos(caminho, tamanho_lote=TAMANHO_LOTE):
+    """Importa alunos do JSON legado para o clube em uso; alunos já cadastrados são mantidos"""
+    inicio = time.perf_counter()
+    clube_id = clube_atual().id
+    existentes = set(db.session.execute(select(Aluno.nome).where(Aluno.clube_id == clube_id)).scalars())
+    lidos = inseridos = 0
+    lote = []
+
+    for nome, dados in iterar_objeto_json(caminho):
+        lidos += 1
+        if nome in existentes:
+            continue
+        existentes.add(nome)
+        lote.append({
+            "clube_id": clube_id,
+            "nome": nome,
+            "senha": dados.get("senha", nome.lower().replace(" ", "")[:8]),
+            "pagamento": dados.get("pagamento", ""),
+            "creditos": dados.get("creditos", 0)
+        })
+        if len(lote) >= tamanho_lote:
+            inseridos += _gravar_alunos(lote)
+            lote = []
+
+    inseridos += _gravar_alunos(lote)
+    # Alunos recém-criados entram no extrato com o saldo importado
+    abrir_saldos(Aluno.clube_id == clube_id, descricao="importação JSON")
+    db.session.commit()
+    return {"lidos": lidos, "inseridos": inseridos, "segundos": time.perf_counter() - inicio}
+
+def importar_checkins(caminho, tamanho_lote=TAMANHO_LOTE):
+    """Importa check-ins do JSON legado no clube em uso; nomes vêm de uma única consulta e horários da grade em memória"""
+    inicio = time.perf_counter()
+    clube_id = clube_atual().id
+    ids_por_nome = dict(db.session.execute(select(Aluno.nome, Aluno.id).where(Aluno.clube_id == clube_id)).all())
+    lidos = inseridos = desconhecidos = 0
+    datas = set()
+    lote = []
+
+    for data_str, horarios in iterar_objeto_json(caminho):
+        data_obj = datetime.strptime(data_str, "%Y-%m-%d").date()
+        for horario, nomes in horarios.items():
+            for nome in nomes:
+                lidos += 1
+                aluno_id = ids_por_nome.get(nome)
+                sessao = agenda.buscar(data_obj, horario)
+                if aluno_id is None or sessao is None:
+                    desconhecidos += 1
+                    continue
+                datas.add(data_obj)
+                lote.append({"clube_id": clube_id, "aluno_id": aluno_id, "data": data_obj, "sessao_id": sessao.id})
+                if len(lote) >= tamanho_lote:
+                    inseridos += _gravar_lote(Checkin, lote)
+                    lote = []
+
+    inseridos += _gravar_lote(Checkin, lote)
+    # Contadores de vagas já existentes precisam refletir os check-ins importados
+    recalcular_vagas(datas)
+    db.session.commit()
+    return {
+        "lidos": lidos,
+        "inseridos": inseridos,
+        "desconhecidos": desconhecidos,
+        "segundos": time.perf_counter() - inicio
+    }
+
+# Importação de cadastro (CSV ou JSON): cria alunos, atualiza pagamento e créditos
+
+def ler_cadastro(arquivo, formato):
+    """Gera dicionários de linhas a partir de um arquivo texto CSV ou JSON (lista de objetos)"""
+    if formato == "csv":
+        return csv.DictReader(arquivo)
+    return iterar_lista_json(arquivo)
+
+def _inteiro(valor, campo):
+    if valor is None or valor == "":
+        return None
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        raise ValueError(f"{campo} deve ser um número inteiro")
+
+def _texto(dados, campo, limite):
+    valor = dados.get(campo)
+    valor = str(valor).strip() if valor is not None else ""
+    if len(valor) > limite:
+        raise ValueError(f"{campo} deve ter no máximo {limite} caracteres")
+    return valor or None
+
+def validar_linha_cadastro(dados):
+    """Normaliza e valida uma linha do arquivo; levanta ValueError com a mensagem do problema"""
+    if not isinstance(dados, dict):
+        raise ValueError("linha deve ser um objeto com os campos do aluno")
+    nome = _texto(dados, "nome", 100)
+    if not nome:
+        raise ValueError("nome é obrigatório")
+    creditos = _inteiro(dados.get("creditos"), "creditos")
+    if creditos is not None and creditos < 0:
+        raise ValueError("creditos não pode ser negativo")
+    return {
+        "nome": nome,
+        "pagamento": _texto(dados, "pagamento", 200),
+        "senha": _texto(dados, "senha", 50),
+        "creditos": creditos,
+        "delta": _inteiro(dados.get("delta_creditos"), "delta_creditos") or 0
+    }
+
+def _aplicar_lote_cadastro(lote, relatorio):
+    """Grava um lote validado: um SELECT, INSERTs e um UPDATE em lote, com os lançamentos do extrato"""
+    nomes = [linha["nome"] for _, linha in lote]
+    clube_id = clube_atual().id
+    # Bloqueia os alunos existentes: check-ins simultâneos esperam a importação
+    existentes = {nome: (aluno_id, creditos) for nome, aluno_id, creditos in db.session.execute(
+        select(Aluno.nome, Aluno.id, Aluno.creditos)
+        .where(Aluno.clube_id == clube_id, Aluno.nome.in_(nomes))
+        .with_for_update()
+    )}
+
+    novos = []
+    atualizacoes = []
+    lancamentos = []
+    agora = datetime.utcnow()
+    for numero, linha in lote:
+        if linha["nome"] in existentes:
+            aluno_id, saldo = existentes[linha["nome"]]
+            novo_saldo = max(0, (saldo if linha["creditos"] is None else linha["creditos"]) + linha["delta"])
+            atualizacoes.append({
+                "b_nome": linha["nome"],
+                "b_pagamento": linha["pagamento"],
+                "b_senha": linha["senha"],
+                "b_diferenca": novo_saldo - saldo
+            })
+            if novo_saldo != saldo:
+                lancamentos.append({
+                    "aluno_id": aluno_id, "tipo": COMPRA if novo_saldo > saldo else AJUSTE,
+                    "quantidade": novo_saldo - saldo, "descricao": "importação", "criado_em": agora
+                })
+            relatorio.append({"linha": numero, "nome": linha["nome"], "resultado": "atualizado", "mensagem": ""})
+        elif not linha["pagamento"]:
+            relatorio.append({"linha": numero, "nome": linha["nome"], "resultado": "erro",
+                              "mensagem": "pagamento é obrigatório para aluno novo"})
+        else:
+            novos.append({
+                "clube_id": clube_id,
+                "nome": linha["nome"],
+                "senha": linha["senha"] or linha["nome"].lower().replace(" ", "")[:8],
+                "pagamento": linha["pagamento"],
+                "creditos": max(0, (linha["creditos"] or 0) + linha["delta"])
+            })
+            relatorio.append({"linha": numero, "nome": linha["nome"], "resultado": "criado", "mensagem": ""})
+
+    # Hashes de custo de lote (refeitos no primeiro login), só para alunos novos e senhas informadas no arquivo
+    trocas = [(a, "senha") for a in novos] + [(a, "b_senha") for a in atualizacoes if a["b_senha"]]
+    for (item, campo), senha in zip(trocas, gerar_hashes([item[campo] for item, campo in trocas])):
+        item[campo] = senha
+
+    if novos:
+        db.session.execute(insert(Aluno.__table__), novos)
+        abrir_saldos(Aluno.clube_id == clube_id, Aluno.nome.in_([a["nome"] for a in novos]),
+                     tipo=COMPRA, descricao="importação")
+
+    if atualizacoes:
+        # Créditos: a diferença calculada sobre as linhas bloqueadas é somada no próprio
+        # banco, a mesma que vai para o extrato
+        db.session.execute(
+            update(Aluno.__table__)
+            .where(Aluno.__table__.c.clube_id == clube_id, Aluno.__table__.c.nome == bindparam("b_nome"))
+            .values(
+                pagamento=func.coalesce(bindparam("b_pagamento", type_=String), Aluno.__table__.c.pagamento),
+                senha=func.coalesce(bindparam("b_senha", type_=String), Aluno.__table__.c.senha),
+                creditos=Aluno.__table__.c.creditos + bindparam("b_diferenca", type_=Integer)
+            ),
+            atualizacoes
+        )
+    if lancamentos:
+        db.session.execute(insert(MovimentoCredito.__table__), lancamentos)
+
+def importar_cadastro(linhas, tamanho_lote=500):
+    """Valida as linhas em fluxo e aplica tudo numa única transação, no clube em uso.
+
+    Linhas inválidas entram no relatório como erro e não são gravadas.
+    Retorna (relatorio, resumo) com uma entrada por linha do arquivo.
+    """
+    inicio = time.perf_counter()
+    relatorio = []
+    lote = []
+    nomes_no_lote = set()
+
+    try:
+        for numero, dados in enumerate(linhas, start=1):
+            try:
+                linha = validar_linha_cadastro(dados)
+            except ValueError as e:
+                nome = dados.get("nome", "") if isinstance(dados, dict) else ""
+                relatorio.append({"linha": numero, "nome": nome, "resultado": "erro", "mensagem": str(e)})
+                continue
+
+            # Um nome repetido no mesmo lote precisa enxergar a gravação anterior
+            if linha["nome"] in nomes_no_lote or len(lote) >= tamanho_lote:
+                _aplicar_lote_cadastro(lote, relatorio)
+                lote = []
+                nomes_no_lote = set()
+            lote.append((numero, linha))
+            nomes_no_lote.add(linha["nome"])
+
+        if lote:
+            _aplicar_lote_cadastro(lote, relatorio)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    relatorio.sort(key=lambda item: item["linha"])
+    resumo = {resultado: 0 for resultado in ("criado", "atualizado", "erro")}
+    for item in relatorio:
+        resumo[item["resultado"]] += 1
+    resumo["segundos"] = time.perf_counter() - inicio
+    return relatorio, resumo
+
+def relatorio_csv(relatorio):
+    """Relatório por linha no formato CSV (linha, nome, resultado, mensagem)"""
+    saida = io.StringIO()
+    escritor = csv.DictWriter(saida, fieldnames=["linha", "nome", "resultado", "mensagem"])
+    escritor.writeheader()
+    escritor.writerows(relatorio)
+    return saida.getvalue()
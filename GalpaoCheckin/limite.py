@@ -0,0 +1,37 @@
+"""Limitador de tentativas em memória (token bucket por chave)"""
+import threading
+import time
+
+class LimitadorTentativas:
+    """Um balde de `capacidade` fichas por chave, reabastecido a `por_segundo`.
+
+    Cada tentativa consome uma ficha; sem fichas a tentativa é recusada
+    antes de qualquer consulta ao banco ou cálculo de hash.
+    """
+
+    def __init__(self, capacidade, por_segundo, max_chaves=10000):
+        self.capacidade = capacidade
+        self.por_segundo = por_segundo
+        self.max_chaves = max_chaves
+        self._trava = threading.Lock()
+        self._baldes = {}  # chave -> (fichas, instante da última atualização)
+
+    def _limpar(self, agora):
+        """Descarta baldes que já voltaram a ficar cheios (chaves ociosas)"""
+        cheio_apos = self.capacidade / self.por_segundo
+        for chave in [c for c, (_, t) in self._baldes.items() if agora - t >= cheio_apos]:
+            del self._baldes[chave]
+
+    def permitir(self, chave):
+        """Consome uma ficha da chave; retorna False se o balde estiver vazio"""
+        agora = time.monotonic()
+        with self._trava:
+            fichas, ultima = self._baldes.get(chave, (self.capacidade, agora))
+            fichas = min(self.capacidade, fichas + (agora - ultima) * self.por_segundo)
+            permitido = fichas >= 1
+            if permitido:
+                fichas -= 1
+            self._baldes[chave] = (fichas, agora)
+            if len(self._baldes) > self.max_chaves:
+                self._limpar(agora)
+            return permitido
@@ -1,124 +1,474 @@
 import os
-import json
-from flask import Flask, render_template, request, redirect, session, url_for, flash
-from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime, time, timedelta, date, timezone
-from collections import defaultdict
-from models import db, Aluno, Checkin, Admin
-from sqlalchemy import func, and_
-
-app = Flask(__name__)
-app.secret_key = os.environ.get("SESSION_SECRET", "chave-secreta-padrao")
-
-# Configuração do banco de dados
-app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL')
-app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
-    'pool_recycle': 300,
-    'pool_pre_ping': True,
-}
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-# Inicializar o banco
-db.init_app(app)
-
-HORARIOS = ["18:00-20:00", "20:00-22:00"]
-LIMITE_VAGAS = 12
+import io
+import re
+import functools
+import asyncio
+import hmac
+import hashlib
+import csv
+import click
+from collections import Counter
+from flask import Flask, Blueprint, current_app, render_template, request, redirect, session, url_for, flash, jsonify, Response, stream_with_context, g
+from datetime import datetime, timedelta, date
+from models import db, Aluno, Admin, Sessao, Clube
+from migracoes import aplicar_migracoes, semear_sessoes
+from reservas import (
+    reservar, cancelar_reserva, entrar_na_espera, sair_da_espera, preencher_vagas, registrar_ouvinte,
+    RESERVADO, SEM_CREDITOS, JA_RESERVADO, LOTADO, SEM_RESERVA, JA_NA_ESPERA, HA_VAGA
+)
+from resumo import resumo_checkins
+from ocupacao import cache_ocupacao
+from eventos import CanalEventos, LimiteFluxos, fluxo_sse
+from importacao import importar_alunos, importar_checkins, importar_cadastro, ler_cadastro, relatorio_csv
+from cadastro import listar_alunos, totais_alunos
+from agenda import agenda, ler_rotulo, DIAS_SEMANA
+from senhas import gerar_hash, gerar_hash_pool, gerar_hashes, eh_hash, verificar_senha_pool, precisa_rehash, SobrecargaLogin
+from limite import LimitadorTentativas
+from metricas import metricas
+from estaticos import estaticos, construir
+from fragmentos import fragmentos
+from clubes import clubes, clube_atual, usar, PorClube
+import relogio
+from relogio import momento
+from identidade import identidades, Identidade
+import analitico
+import extrato
+import retencao
+import idempotencia
+import notificacoes
+from werkzeug.middleware.proxy_fix import ProxyFix
+from time import monotonic
+from sqlalchemy import select, update, bindparam
+from sqlalchemy.exc import IntegrityError
+
+# Rotas da aplicação; registradas no app por create_app()
+bp = Blueprint("galpao", __name__, cli_group=None)
+
 SENHA_ADMIN = "bolinha"
 
-def init_db():
+# Quantos dias à frente (contando hoje) o aluno pode reservar
+DIAS_ANTECEDENCIA = int(os.environ.get("DIAS_ANTECEDENCIA", "7"))
+
+# Resultados das regras de reserva além dos de reservas.py
+INVALIDO = "invalido"
+ENCERRADA = "encerrada"
+FORA_DO_CORTE = "fora_do_corte"
+OUTRO_ALUNO = "outro_aluno"
+
+# Maior id das colunas INTEGER
+ID_MAXIMO = 2 ** 31 - 1
+
+# Status HTTP da API de reservas pela categoria da mensagem (inválido é 400)
+STATUS_API = {"success": 200, "info": 200, "error": 409}
+
+# Folhas de estilo e scripts de CDN do base.html, guardados pelo service worker
+SHELL_CDN = (
+    "https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css",
+    "https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/css/all.min.css",
+    "https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js",
+)
+
+# Tentativas de login: por nome (força bruta numa conta) e por IP (a academia
+# compartilha um IP entre muitos alunos, então o balde do IP é mais folgado)
+limite_login_nome = LimitadorTentativas(capacidade=5, por_segundo=1 / 12)
+limite_login_ip = LimitadorTentativas(capacidade=30, por_segundo=0.5)
+
+# Hash da senha admin de cada clube, relido do banco no máximo a cada minuto
+_senha_admin = {}  # clube_id -> (valor, lido_em)
+
+# Manter resumo administrativo e ocupação em dia a cada reserva/cancelamento
+registrar_ouvinte(resumo_checkins.registrar)
+registrar_ouvinte(cache_ocupacao.registrar)
+registrar_ouvinte(identidades.registrar)
+registrar_ouvinte(fragmentos.registrar)
+
+# Avisar as conexões SSE (do mesmo clube) depois que o cache já reflete a mudança
+canal_status = PorClube(lambda clube_id: CanalEventos())
+registrar_ouvinte(canal_status.registrar)
+
+# Cada fluxo SSE prende uma thread: metade das threads do worker fica para as demais requisições
+THREADS = int(os.environ.get("WEB_THREADS", "8"))
+fluxos_sse = LimiteFluxos(int(os.environ.get("SSE_MAX_FLUXOS", max(1, THREADS // 2))))
+
+def opcoes_engine():
+    """Opções do pool de conexões, dimensionado pelas threads de cada worker"""
+    return {
+        # Cada thread usa no máximo uma conexão; o excedente cobre o fluxo SSE e o CLI
+        'pool_size': int(os.environ.get("DB_POOL_SIZE", THREADS)),
+        'max_overflow': int(os.environ.get("DB_MAX_OVERFLOW", max(2, THREADS // 2))),
+        'pool_timeout': 10,
+        # LIFO reaproveita as conexões quentes e deixa as ociosas expirarem
+        'pool_use_lifo': True,
+        'pool_recycle': int(os.environ.get("DB_POOL_RECYCLE", "300")),
+        # Sem ping por checkout: conexões derrubadas são descartadas pelo SQLAlchemy
+        # no primeiro erro de desconexão; DB_PRE_PING=1 volta ao modo pessimista
+        'pool_pre_ping': os.environ.get("DB_PRE_PING", "0") == "1",
+    }
+
+def create_app(config=None):
+    """Cria a aplicação sem tocar no banco; esquema e migração ficam em init-db"""
+    app = Flask(__name__)
+    app.secret_key = os.environ.get("SESSION_SECRET", "chave-secreta-padrao")
+    
+    # Configuração do banco de dados
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL')
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = opcoes_engine()
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    if config:
+        app.config.update(config)
+    
+    # O deploy (Procfile) fica atrás do roteador do Heroku: o IP real vem em X-Forwarded-For,
+    # senão todos os alunos dividiriam o limite de login do IP do roteador.
+    # PROXIES=0 quando o app recebe conexões direto dos clientes
+    proxies = int(os.environ.get("PROXIES", "1"))
+    if proxies:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxies)
+    
+    # Inicializar o banco
+    db.init_app(app)
+    app.register_blueprint(bp)
+    
+    # Vários clubes no mesmo deploy: domínio próprio ou /c/<slug>/
+    clubes.instalar(app)
+    
+    # Latência por rota, SQL por requisição e tempo de template (exportados em /metrics)
+    with app.app_context():
+        metricas.instalar(app, db.engine)
+    
+    # Data local e cortes no fuso do clube (RELOGIO em config injeta um relógio fixo)
+    relogio.instalar(app)
+    
+    # Arquivos estáticos versionados e ETag/304 nas páginas
+    estaticos.instalar(app)
+    
+    # Fragmentos de template por versão dos dados e bytecode compilado em disco
+    fragmentos.instalar(app)
+    
+    # Implantações sem passo de release podem criar o esquema na subida
+    if os.environ.get("INICIALIZAR_BANCO") == "1":
+        init_db(app)
+    
+    return app
+
+def init_db(app):
     """Inicializa o banco de dados com tabelas e dados padrão"""
     with app.app_context():
         db.create_all()
+        aplicar_migracoes()
         
-        # Verificar se já existe configuração admin
-        admin_senha = Admin.query.filter_by(chave='senha_admin').first()
-        if not admin_senha:
-            admin_config = Admin(chave='senha_admin', valor=SENHA_ADMIN)
-            db.session.add(admin_config)
-            db.session.commit()
+        # Clubes ainda sem configuração admin recebem a senha padrão
+        clubes.invalidar()
+        for clube in clubes.todos():
+            if not Admin.query.filter_by(clube_id=clube.id, chave='senha_admin').first():
+                db.session.add(Admin(clube_id=clube.id, chave='senha_admin', valor=gerar_hash(SENHA_ADMIN)))
+        db.session.commit()
+        
+        for grade in agenda.instancias():
+            grade.invalidar()
 
-def migrar_dados_json():
-    """Migra dados existentes do JSON para o banco de dados"""
-    try:
-        # Migrar alunos
-        with open("data/alunos.json", "r", encoding="utf-8") as f:
-            alunos_json = json.load(f)
-            
-        for nome, dados in alunos_json.items():
-            aluno_existente = Aluno.query.filter_by(nome=nome).first()
-            if not aluno_existente:
-                aluno = Aluno(
-                    nome=nome,
-                    senha=dados.get('senha', nome.lower().replace(" ", "")[:8]),
-                    pagamento=dados.get('pagamento', ''),
-                    creditos=dados.get('creditos', 0)
-                )
-                db.session.add(aluno)
+def com_clube(comando):
+    """Acrescenta --clube SLUG ao comando e o executa com esse clube em uso"""
+    @click.option("--clube", "slug", default=None, help="Slug do clube (padrão: CLUBE_PADRAO)")
+    @functools.wraps(comando)
+    def executar(slug, **opcoes):
+        clube = clubes.por_slug(slug) if slug else clubes.padrao()
+        if clube is None:
+            raise click.BadParameter(f"clube '{slug}' não cadastrado", param_hint="--clube")
+        with usar(clube):
+            return comando(**opcoes)
+    return executar
+
+@bp.cli.command("init-db")
+@click.option("--importar", is_flag=True, help="Importa também os arquivos JSON legados")
+@click.pass_context
+def init_db_comando(ctx, importar):
+    """Cria tabelas, aplica migrações e grava a configuração padrão"""
+    init_db(current_app)
+    click.echo("Banco de dados inicializado")
+    if importar:
+        ctx.invoke(importar_json)
+
+@bp.cli.command("importar-json")
+@click.option("--alunos", default="data/alunos.json", help="Arquivo JSON de alunos")
+@click.option("--checkins", default="data/checkins.json", help="Arquivo JSON de check-ins")
+@click.option("--lote", default=1000, help="Linhas por INSERT em lote")
+@com_clube
+def importar_json(alunos, checkins, lote):
+    """Importa os dados legados dos arquivos JSON para o banco de dados"""
+    for rotulo, importar, caminho in (
+        ("Alunos", importar_alunos, alunos),
+        ("Check-ins", importar_checkins, checkins),
+    ):
+        if not os.path.exists(caminho):
+            click.echo(f"{rotulo}: {caminho} não encontrado, ignorando")
+            continue
         
-        # Migrar check-ins
-        try:
-            with open("data/checkins.json", "r", encoding="utf-8") as f:
-                checkins_json = json.load(f)
-                
-            for data_str, horarios in checkins_json.items():
-                data_obj = datetime.strptime(data_str, "%Y-%m-%d").date()
-                
-                for horario, nomes in horarios.items():
-                    for nome in nomes:
-                        aluno = Aluno.query.filter_by(nome=nome).first()
-                        if aluno:
-                            # Verificar se já existe o check-in
-                            checkin_existente = Checkin.query.filter_by(
-                                aluno_id=aluno.id,
-                                data=data_obj,
-                                horario=horario
-                            ).first()
-                            
-                            if not checkin_existente:
-                                checkin = Checkin(
-                                    aluno_id=aluno.id,
-                                    data=data_obj,
-                                    horario=horario
-                                )
-                                db.session.add(checkin)
-        except FileNotFoundError:
-            pass  # Arquivo de check-ins não existe ainda
-            
-        db.session.commit()
+        resultado = importar(caminho, lote)
+        segundos = resultado["segundos"]
+        taxa = resultado["lidos"] / segundos if segundos else 0
+        extra = f", {resultado['desconhecidos']} com aluno ou horário desconhecido" if "desconhecidos" in resultado else ""
+        click.echo(
+            f"{rotulo}: {resultado['lidos']} lidos, {resultado['inseridos']} inseridos{extra} "
+            f"em {segundos:.2f}s ({taxa:.0f} linhas/s)"
+        )
         
-    except FileNotFoundError:
-        pass  # Arquivos JSON não existem ainda
+        # Check-ins importados não passam por reservar(): os rollups são recalculados
+        if importar is importar_checkins and resultado["inseridos"]:
+            click.echo(f"Histórico: {analitico.reconstruir()} linhas do rollup diário recalculadas")
+
+@bp.cli.command("criar-clube")
+@click.argument("slug")
+@click.argument("nome")
+@click.option("--dominio", help="Host próprio do clube (ex.: reservas.clube.com.br)")
+@click.option("--senha-admin", default=SENHA_ADMIN, help="Senha inicial do painel admin")
+def criar_clube(slug, nome, dominio, senha_admin):
+    """Cadastra um clube com a grade padrão; ele responde em /c/SLUG/ e no domínio, se informado"""
+    if not re.fullmatch(r"[a-z0-9-]{1,50}", slug):
+        raise click.BadParameter("use letras minúsculas, números e hífen", param_hint="SLUG")
+    clube = Clube(slug=slug, nome=nome, dominio=dominio.lower() if dominio else None)
+    db.session.add(clube)
+    try:
+        db.session.flush()
+    except IntegrityError:
+        db.session.rollback()
+        raise click.ClickException("Slug ou domínio já cadastrado")
+    db.session.add(Admin(clube_id=clube.id, chave='senha_admin', valor=gerar_hash(senha_admin)))
+    db.session.commit()
+    semear_sessoes(clube.id)
+    clubes.invalidar()
+    click.echo(f"Clube {nome} criado em /c/{slug}/" + (f" e em {clube.dominio}" if dominio else ""))
+
+@bp.cli.command("conciliar-creditos")
+@click.option("--corrigir", is_flag=True, help="Lança ajustes para igualar o extrato aos saldos")
+def conciliar_creditos(corrigir):
+    """Confere o saldo de cada aluno contra a soma do extrato de créditos"""
+    divergencias = extrato.conciliar()
+    for aluno_id, nome, saldo, total in divergencias[:50]:
+        click.echo(f"{nome} (id {aluno_id}): saldo {saldo}, extrato {total}")
+    if not divergencias:
+        click.echo("Saldos e extrato conferem")
+    elif corrigir:
+        extrato.corrigir(divergencias)
+        click.echo(f"{len(divergencias)} ajustes lançados")
+    else:
+        raise SystemExit(f"{len(divergencias)} alunos com divergência (use --corrigir para lançar ajustes)")
 
-@app.route("/")
+@bp.cli.command("compactar-extrato")
+@click.option("--dias", default=365, help="Mantém o detalhe dos últimos N dias")
+def compactar_extrato(dias):
+    """Resume os lançamentos antigos em um lançamento de saldo por aluno"""
+    alunos, removidos = extrato.compactar(datetime.utcnow() - timedelta(days=dias))
+    click.echo(f"{removidos} lançamentos compactados em {alunos} saldos")
+
+@bp.cli.command("arquivar-checkins")
+@click.option("--dias", default=retencao.RETENCAO_DIAS, help="Mantém na tabela quente os check-ins dos últimos N dias")
+@click.option("--meses", type=int, help="Arquiva no máximo N meses nesta execução")
+def arquivar_checkins(dias, meses):
+    """Move os check-ins antigos para o arquivo mensal, um mês por transação (pode ser interrompido e repetido)"""
+    try:
+        corte = retencao.horizonte(dias)
+    except ValueError as erro:
+        raise click.BadParameter(str(erro), param_hint="--dias")
+    total = quantos = 0
+    inicio = monotonic()
+    for mes, movidos in retencao.arquivar(corte, meses):
+        click.echo(f"{mes:%Y-%m}: {movidos} check-ins arquivados")
+        total += movidos
+        quantos += 1
+    click.echo(f"{total} check-ins de {quantos} meses arquivados em {monotonic() - inicio:.1f} s; "
+               f"a tabela quente começa em {corte:%d/%m/%Y}")
+
+@bp.cli.command("construir-estaticos")
+def construir_estaticos():
+    """Minifica, versiona e pré-comprime script.js e style.css em static/dist"""
+    for nome, versionado in construir().items():
+        click.echo(f"{nome} -> {versionado}")
+
+@bp.cli.command("notificacoes")
+@click.option("--uma-vez", is_flag=True, help="Agenda os lembretes, drena a caixa de saída e sai")
+@click.option("--intervalo", default=2.0, help="Segundos entre consultas com a caixa vazia")
+@click.option("--sem-lembretes", is_flag=True, help="Não agenda lembretes (ex.: feitos por cron)")
+@click.option("--antecedencia", default=120, help="Minutos antes da sessão para o lembrete")
+def notificacoes_comando(uma_vez, intervalo, sem_lembretes, antecedencia):
+    """Worker que envia confirmações, cancelamentos e lembretes da caixa de saída"""
+    transporte = notificacoes.criar_transporte()
+    if uma_vez:
+        if not sem_lembretes:
+            click.echo(f"{notificacoes.agendar_lembretes(antecedencia)} lembretes agendados")
+
+        async def drenar_tudo():
+            total = 0
+            while processadas := await notificacoes.drenar(transporte):
+                total += processadas
+            return total
+
+        click.echo(f"{asyncio.run(drenar_tudo())} notificações processadas")
+        return
+    click.echo(f"Enviando notificações por {type(transporte).__name__}")
+    asyncio.run(notificacoes.executar(transporte, intervalo, not sem_lembretes, antecedencia))
+
+@bp.cli.command("agendar-lembretes")
+@click.option("--antecedencia", default=120, help="Minutos antes da sessão para o lembrete")
+def agendar_lembretes(antecedencia):
+    """Enfileira lembretes das sessões que começam em breve (para cron, sem o worker)"""
+    click.echo(f"{notificacoes.agendar_lembretes(antecedencia)} lembretes agendados")
+
+@bp.cli.command("reconstruir-analitico")
+@click.option("--desde", type=click.DateTime(formats=["%Y-%m-%d"]), help="Primeira data (AAAA-MM-DD)")
+@click.option("--ate", type=click.DateTime(formats=["%Y-%m-%d"]), help="Última data (AAAA-MM-DD)")
+def reconstruir_analitico(desde, ate):
+    """Recalcula os rollups do histórico a partir dos check-ins (meses inteiros)"""
+    linhas = analitico.reconstruir(desde.date() if desde else None, ate.date() if ate else None)
+    click.echo(f"{linhas} linhas do rollup diário recalculadas")
+
+@bp.cli.command("importar-alunos")
+@click.argument("arquivo", type=click.Path(exists=True, dir_okay=False))
+@click.option("--relatorio", type=click.Path(dir_okay=False), help="Grava o relatório por linha em CSV")
+@com_clube
+def importar_alunos_comando(arquivo, relatorio):
+    """Cria/atualiza alunos, pagamentos e créditos a partir de um CSV ou JSON"""
+    formato = "json" if arquivo.lower().endswith(".json") else "csv"
+    with open(arquivo, "r", encoding="utf-8-sig", newline="") as entrada:
+        linhas, resumo = importar_cadastro(ler_cadastro(entrada, formato))
+    
+    if relatorio:
+        with open(relatorio, "w", encoding="utf-8", newline="") as saida:
+            saida.write(relatorio_csv(linhas))
+    for item in linhas:
+        if item["resultado"] == "erro":
+            click.echo(f"Linha {item['linha']} ({item['nome']}): {item['mensagem']}")
+    click.echo(
+        f"{resumo['criado']} criados, {resumo['atualizado']} atualizados, "
+        f"{resumo['erro']} com erro em {resumo['segundos']:.2f}s"
+    )
+
+@bp.cli.command("migrar-senhas")
+@click.option("--lote", default=500, help="Alunos por lote")
+def migrar_senhas(lote):
+    """Converte senhas em texto puro para hash scrypt"""
+    convertidas = 0
+    ultimo_id = 0
+    while True:
+        alunos = db.session.execute(
+            select(Aluno.id, Aluno.senha)
+            .where(Aluno.id > ultimo_id, ~Aluno.senha.startswith("scrypt$"))
+            .order_by(Aluno.id)
+            .limit(lote)
+        ).all()
+        if not alunos:
+            break
+        hashes = gerar_hashes([senha for _, senha in alunos])
+        db.session.execute(
+            update(Aluno.__table__)
+            .where(Aluno.__table__.c.id == bindparam("b_id"))
+            .values(senha=bindparam("b_senha")),
+            [{"b_id": aluno_id, "b_senha": h} for (aluno_id, _), h in zip(alunos, hashes)]
+        )
+        db.session.commit()
+        convertidas += len(alunos)
+        ultimo_id = alunos[-1][0]
+    
+    for admin_config in Admin.query.filter_by(chave='senha_admin'):
+        if not eh_hash(admin_config.valor):
+            admin_config.valor = gerar_hash(admin_config.valor)
+            db.session.commit()
+            click.echo(f"Senha administrativa do clube {admin_config.clube_id} convertida")
+    
+    click.echo(f"{convertidas} senhas de alunos convertidas")
+
+@bp.route("/healthz")
+def healthz():
+    """Liveness: o processo está de pé e atendendo (não toca no banco)"""
+    return jsonify({"status": "ok"})
+
+@bp.route("/readyz")
+def readyz():
+    """Readiness: o banco responde e o esquema foi criado"""
+    try:
+        db.session.execute(select(Admin.id).limit(1))
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"status": "indisponivel", "erro": type(e).__name__}), 503
+    return jsonify({"status": "ok"})
+
+@bp.route("/metrics")
+def metrics():
+    """Métricas do processo no formato texto do Prometheus"""
+    token = os.environ.get("METRICAS_TOKEN")
+    if token and not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        return Response("token inválido\n", status=401, mimetype="text/plain")
+    return Response(metricas.exportar(), mimetype="text/plain; version=0.0.4")
+
+@bp.route("/assets/<nome>")
+def asset(nome):
+    """Arquivo estático versionado (gerado por construir-estaticos), com cache permanente"""
+    return estaticos.servir(nome)
+
+@bp.route("/")
 def home():
     """Página inicial com login dual"""
     return render_template("login.html")
 
-@app.route("/admin_login", methods=["POST", "GET"])
+@bp.route("/admin_login", methods=["POST", "GET"])
 def admin_login():
     """Login do administrador"""
     if request.method == "POST":
         senha = request.form.get("senha", "").strip()
         
-        # Buscar senha admin no banco
-        admin_config = Admin.query.filter_by(chave='senha_admin').first()
-        senha_correta = admin_config.valor if admin_config else SENHA_ADMIN
+        if not limite_login_ip.permitir(f"admin:{request.remote_addr}"):
+            flash("Muitas tentativas. Aguarde um minuto e tente novamente.", "error")
+            return render_template("admin_login.html"), 429
         
-        if senha == senha_correta:
-            session["admin"] = True
+        try:
+            senha_correta = verificar_senha_pool(senha, senha_admin_armazenada())
+        except SobrecargaLogin:
+            flash("Sistema ocupado. Tente novamente em instantes.", "error")
+            return render_template("admin_login.html"), 503
+        
+        if senha_correta:
+            atualizar_hash_admin(senha)
+            session["admin"] = clube_atual().id
             flash("Login administrativo realizado com sucesso!", "success")
-            return redirect(url_for("admin"))
+            return redirect(url_for("galpao.admin"))
         else:
             flash("Senha administrativa incorreta", "error")
     
     return render_template("admin_login.html")
 
-@app.route("/admin", methods=["POST", "GET"])
+def admin_logado():
+    """Login administrativo feito neste clube (sessões anteriores aos clubes guardavam True, igual ao id 1)"""
+    return session.get("admin") == clube_atual().id
+
+def senha_admin_armazenada():
+    """Hash (ou senha legada) do admin do clube, em cache para não consultar o banco a cada tentativa"""
+    clube_id = clube_atual().id
+    valor, lido_em = _senha_admin.get(clube_id, (None, 0.0))
+    if valor is None or monotonic() - lido_em > 60:
+        admin_config = Admin.query.filter_by(clube_id=clube_id, chave='senha_admin').first()
+        valor = admin_config.valor if admin_config else SENHA_ADMIN
+        _senha_admin[clube_id] = (valor, monotonic())
+    return valor
+
+def atualizar_hash_admin(senha):
+    """Regrava a senha admin com hash se ainda estiver em texto puro ou com custo antigo"""
+    if not precisa_rehash(senha_admin_armazenada()):
+        return
+    admin_config = Admin.query.filter_by(clube_id=clube_atual().id, chave='senha_admin').first()
+    if admin_config:
+        try:
+            admin_config.valor = gerar_hash_pool(senha)
+        except SobrecargaLogin:
+            # Pool cheio: fica para o próximo login
+            return
+        db.session.commit()
+        _senha_admin.pop(admin_config.clube_id, None)
+
+@bp.route("/admin", methods=["POST", "GET"])
 def admin():
     """Painel administrativo para gerenciar alunos"""
-    if not session.get("admin"):
+    if not admin_logado():
         flash("Acesso negado. Faça login como administrador.", "error")
-        return redirect(url_for("admin_login"))
+        return redirect(url_for("galpao.admin_login"))
     
     if request.method == "POST":
         nome = request.form.get("nome", "").strip()
@@ -128,20 +478,26 @@ def admin():
         # Validação dos dados
         if not nome:
             flash("Nome é obrigatório", "error")
-            return render_template("admin.html")
+            return renderizar_admin()
         
         if not pagamento:
             flash("Informação de pagamento é obrigatória", "error")
-            return render_template("admin.html")
+            return renderizar_admin()
         
         try:
             creditos = int(creditos)
             if creditos < 0:
                 flash("Créditos deve ser um número positivo", "error")
-                return render_template("admin.html")
+                return renderizar_admin()
         except ValueError:
             flash("Créditos deve ser um número válido", "error")
-            return render_template("admin.html")
+            return renderizar_admin()
+        
+        # Contato opcional para confirmações e lembretes
+        email = request.form.get("email", "").strip() or None
+        if email and ("@" not in email or len(email) > 200):
+            flash("E-mail inválido", "error")
+            return renderizar_admin()
         
         # Gerar senha padrão se não existir
         senha_usuario = request.form.get("senha", "").strip()
@@ -149,34 +505,233 @@ def admin():
             senha_usuario = nome.lower().replace(" ", "")[:8]  # Primeiros 8 chars do nome em minúscula
         
         # Verificar se aluno já existe
-        aluno_existente = Aluno.query.filter_by(nome=nome).first()
+        aluno_existente = Aluno.query.filter_by(clube_id=clube_atual().id, nome=nome).first()
         if aluno_existente:
             flash("Aluno já cadastrado. Atualizando informações.", "info")
             aluno_existente.pagamento = pagamento
-            aluno_existente.creditos = creditos
-            aluno_existente.senha = senha_usuario
+            if email:
+                aluno_existente.email = email
+            aluno_existente.senha = gerar_hash(senha_usuario)
+            # Incremento atômico com lançamento no extrato (não sobrescreve débitos simultâneos)
+            extrato.ajustar_saldo(aluno_existente.id, creditos, descricao=pagamento)
+            identidades.invalidar(aluno_existente.id)
         else:
             # Criar novo aluno
             novo_aluno = Aluno(
+                clube_id=clube_atual().id,
                 nome=nome,
-                senha=senha_usuario,
+                senha=gerar_hash(senha_usuario),
                 pagamento=pagamento,
-                creditos=creditos
+                creditos=creditos,
+                email=email
             )
             db.session.add(novo_aluno)
+            if creditos:
+                db.session.flush()
+                extrato.lancar(novo_aluno.id, extrato.COMPRA, creditos, descricao=pagamento)
         
         db.session.commit()
+        fragmentos.tocar()
         flash(f"Aluno {nome} cadastrado com sucesso!", "success")
     
-    # Carregar lista de alunos para exibição
-    alunos = Aluno.query.order_by(Aluno.nome).all()
+    return renderizar_admin()
+
+@bp.route("/admin/importar", methods=["POST"])
+def admin_importar():
+    """Importação em lote de alunos; devolve o relatório por linha (CSV ou JSON)"""
+    if not admin_logado():
+        flash("Acesso negado. Faça login como administrador.", "error")
+        return redirect(url_for("galpao.admin_login"))
     
-    # Gerar resumo de check-ins
-    resumo_checkins = gerar_resumo_checkins()
+    arquivo = request.files.get("arquivo")
+    if not arquivo or not arquivo.filename:
+        flash("Selecione um arquivo CSV ou JSON", "error")
+        return redirect(url_for("galpao.admin"))
+    
+    formato = "json" if arquivo.filename.lower().endswith(".json") else "csv"
+    entrada = io.TextIOWrapper(arquivo.stream, encoding="utf-8-sig", newline="")
+    try:
+        linhas, resumo = importar_cadastro(ler_cadastro(entrada, formato))
+    except (ValueError, csv.Error) as e:
+        flash(f"Arquivo inválido: {e}", "error")
+        return redirect(url_for("galpao.admin"))
+    identidades.limpar()
+    fragmentos.tocar()
+    
+    if request.accept_mimetypes.best_match(["text/csv", "application/json"]) == "application/json":
+        return jsonify({"resumo": resumo, "linhas": linhas})
+    
+    return Response(
+        relatorio_csv(linhas),
+        mimetype="text/csv",
+        headers={"Content-Disposition": "attachment; filename=relatorio_importacao.csv"}
+    )
+
+def _inteiro_form(campo, rotulo, minimo):
+    """Lê um inteiro do formulário; ValueError com mensagem para o usuário"""
+    try:
+        valor = int(request.form.get(campo, ""))
+    except ValueError:
+        raise ValueError(f"{rotulo} deve ser um número válido")
+    if valor < minimo:
+        raise ValueError(f"{rotulo} deve ser no mínimo {minimo}")
+    return valor
+
+def _hora_form(campo, rotulo):
+    """Lê um HH:MM opcional do formulário (None se vazio); ValueError com mensagem para o usuário"""
+    valor = request.form.get(campo, "").strip()
+    if not valor:
+        return None
+    try:
+        return datetime.strptime(valor, "%H:%M").time()
+    except ValueError:
+        raise ValueError(f"{rotulo} deve estar no formato HH:MM")
+
+def _validar_corte(corte, inicio):
+    """Corte de cancelamento depois do início deixaria cancelar (com reembolso) uma sessão já começada"""
+    if corte is not None and corte > inicio:
+        raise ValueError(f"O corte de cancelamento deve ser até o início da sessão ({inicio:%H:%M})")
+
+@bp.route("/admin/sessoes", methods=["GET", "POST"])
+def admin_sessoes():
+    """Grade semanal: cria sessões e ajusta capacidade, mesas e status sem redeploy"""
+    if not admin_logado():
+        flash("Acesso negado. Faça login como administrador.", "error")
+        return redirect(url_for("galpao.admin_login"))
+    
+    if request.method == "POST":
+        ampliada = None
+        try:
+            capacidade = _inteiro_form("capacidade", "Capacidade", 1)
+            mesas = _inteiro_form("mesas", "Mesas", 0)
+            corte = _hora_form("corte", "Corte de cancelamento")
+            sessao_id = request.form.get("sessao_id")
+            if sessao_id:
+                sessao = db.session.get(Sessao, int(sessao_id))
+                if sessao is None or sessao.clube_id != clube_atual().id:
+                    raise ValueError("Sessão não encontrada")
+                _validar_corte(corte, sessao.inicio)
+                if capacidade > sessao.capacidade:
+                    ampliada = sessao
+                sessao.capacidade = capacidade
+                sessao.mesas = mesas
+                sessao.ativa = request.form.get("ativa") == "1"
+                sessao.corte_cancelamento = corte
+            else:
+                dias = sorted({int(d) for d in request.form.getlist("dias") if d.isdigit() and int(d) < 7})
+                if not dias:
+                    raise ValueError("Escolha pelo menos um dia da semana")
+                try:
+                    inicio, fim = ler_rotulo(f"{request.form.get('inicio', '')}-{request.form.get('fim', '')}")
+                except ValueError:
+                    raise ValueError("Informe início e fim no formato HH:MM")
+                if fim <= inicio:
+                    raise ValueError("O fim deve ser depois do início")
+                _validar_corte(corte, inicio)
+                for dia in dias:
+                    db.session.add(Sessao(clube_id=clube_atual().id, dia_semana=dia, inicio=inicio, fim=fim,
+                                          capacidade=capacidade, mesas=mesas, corte_cancelamento=corte))
+            db.session.commit()
+        except ValueError as e:
+            db.session.rollback()
+            flash(str(e), "error")
+            return redirect(url_for("galpao.admin_sessoes"))
+        except IntegrityError:
+            db.session.rollback()
+            flash("Já existe sessão nesse dia e horário", "error")
+            return redirect(url_for("galpao.admin_sessoes"))
+        
+        # Este worker vê a mudança na hora; os demais em até AGENDA_TTL segundos
+        agenda.invalidar()
+        fragmentos.tocar()
+        flash("Grade de sessões atualizada", "success")
+        
+        # Vagas novas vão primeiro para a fila de espera, em ordem, antes de novas reservas
+        if ampliada is not None and ampliada.ativa:
+            agora = momento()
+            desde = agora.hoje if agora.reserva_aberta(ampliada, agora.hoje) else agora.hoje + timedelta(days=1)
+            promovidos = preencher_vagas(ampliada.id, ampliada.capacidade, desde)
+            if promovidos:
+                flash(f"{promovidos} aluno(s) da lista de espera promovido(s) para as novas vagas", "info")
+        return redirect(url_for("galpao.admin_sessoes"))
+    
+    return render_template("admin_sessoes.html", sessoes=agenda.todas(), dias=DIAS_SEMANA,
+                           corte_padrao=relogio.relogio().corte_padrao)
+
+def _periodo_analitico():
+    """Período de ?inicio=&fim= (AAAA-MM-DD); padrão: últimos 90 dias até hoje"""
+    hoje = momento().hoje
+    try:
+        fim = date.fromisoformat(request.args["fim"]) if request.args.get("fim") else hoje
+        inicio = date.fromisoformat(request.args["inicio"]) if request.args.get("inicio") else fim - timedelta(days=89)
+    except ValueError:
+        flash("Datas inválidas; use AAAA-MM-DD", "error")
+        return hoje - timedelta(days=89), hoje
+    if inicio > fim:
+        inicio, fim = fim, inicio
+    return inicio, fim
+
+@bp.route("/admin/analitico")
+def admin_analitico():
+    """Frequência histórica a partir dos rollups (sem varrer a tabela de check-ins)"""
+    if not admin_logado():
+        flash("Acesso negado. Faça login como administrador.", "error")
+        return redirect(url_for("galpao.admin_login"))
+    
+    inicio, fim = _periodo_analitico()
+    diario = analitico.serie_diaria(inicio, fim)
+    return render_template(
+        "admin_analitico.html",
+        inicio=inicio,
+        fim=fim,
+        sessoes=analitico.utilizacao_sessoes(inicio, fim),
+        diario=diario,
+        maximo_dia=max((d["checkins"] for d in diario), default=0),
+        meses=analitico.resumo_mensal(inicio, fim),
+        alunos=analitico.frequencia_alunos(inicio, fim),
+        total=sum(d["checkins"] for d in diario),
+        dias=DIAS_SEMANA
+    )
+
+@bp.route("/admin/analitico/exportar")
+def admin_analitico_exportar():
+    """Exporta em CSV, em fluxo, o rollup diário, a frequência mensal ou os check-ins do período"""
+    if not admin_logado():
+        flash("Acesso negado. Faça login como administrador.", "error")
+        return redirect(url_for("galpao.admin_login"))
+    
+    tipo = request.args.get("tipo", "diario")
+    if tipo not in analitico.EXPORTACOES:
+        flash("Tipo de exportação inválido", "error")
+        return redirect(url_for("galpao.admin_analitico"))
+    
+    inicio, fim = _periodo_analitico()
+    return Response(
+        stream_with_context(analitico.exportar_csv(tipo, inicio, fim)),
+        mimetype="text/csv",
+        headers={"Content-Disposition": f"attachment; filename={tipo}_{inicio}_{fim}.csv"}
+    )
+
+def renderizar_admin():
+    """Renderiza o painel admin com a página atual de alunos, totais e resumo"""
+    busca = request.args.get("q", "").strip()
+    alunos, tem_anterior, tem_proxima = listar_alunos(
+        prefixo=busca,
+        depois=request.args.get("depois"),
+        antes=request.args.get("antes")
+    )
     
-    return render_template("admin.html", alunos=alunos, resumo=resumo_checkins)
+    return render_template(
+        "admin.html",
+        alunos=alunos,
+        busca=busca,
+        tem_anterior=tem_anterior,
+        tem_proxima=tem_proxima,
+        totais=totais_alunos(),
+        resumo=gerar_resumo_checkins()
+    )
 
-@app.route("/usuario", methods=["POST", "GET"])
+@bp.route("/usuario", methods=["POST", "GET"])
 def usuario():
     """Login de usuário"""
     if request.method == "POST":
@@ -187,237 +742,502 @@ def usuario():
             flash("Nome e senha são obrigatórios", "error")
             return render_template("usuario.html")
         
+        # Recusar rajadas antes de qualquer consulta ou cálculo de hash
+        if not limite_login_ip.permitir(request.remote_addr) or not limite_login_nome.permitir(f"{clube_atual().id}:{nome.lower()}"):
+            flash("Muitas tentativas. Aguarde um minuto e tente novamente.", "error")
+            return render_template("usuario.html"), 429
+        
         # Buscar aluno no banco de dados
-        aluno = Aluno.query.filter_by(nome=nome).first()
+        aluno = Aluno.query.filter_by(clube_id=clube_atual().id, nome=nome).first()
         if not aluno:
             flash("Usuário não cadastrado. Entre em contato com a administração.", "error")
             return render_template("usuario.html")
         
-        # Verificar senha
-        if aluno.senha != senha:
+        # Verificar senha (no pool de threads, com fila limitada)
+        try:
+            senha_correta = verificar_senha_pool(senha, aluno.senha)
+        except SobrecargaLogin:
+            flash("Sistema ocupado. Tente novamente em instantes.", "error")
+            return render_template("usuario.html"), 503
+        
+        if not senha_correta:
             flash("Senha incorreta", "error")
             return render_template("usuario.html")
         
-        session["usuario"] = nome
+        # Migrar senhas legadas em texto puro (ou com custo antigo/de importação) no primeiro login,
+        # no mesmo pool limitado; com o pool cheio fica para um próximo login
+        if precisa_rehash(aluno.senha):
+            try:
+                aluno.senha = gerar_hash_pool(senha)
+                db.session.commit()
+            except SobrecargaLogin:
+                pass
+        
+        # A sessão guarda o id; o nome fica só para a saudação do base.html
+        session["aluno_id"] = aluno.id
+        session["clube"] = clube_atual().id
+        session["usuario"] = aluno.nome
+        identidades.lembrar(Identidade(aluno.id, aluno.nome, aluno.creditos))
         flash(f"Bem-vindo(a), {nome}!", "success")
-        return redirect(url_for("painel_usuario"))
+        return redirect(url_for("galpao.painel_usuario"))
     
     return render_template("usuario.html")
 
-@app.route("/painel_usuario", methods=["GET", "POST"])
-def painel_usuario():
-    """Painel do usuário com status dos horários"""
-    nome = session.get("usuario")
-    if not nome:
-        flash("Faça login para acessar o painel", "error")
-        return redirect(url_for("usuario"))
+def aluno_logado():
+    """Identidade do aluno da sessão, do cache por id (None se não houver login válido)"""
+    if session.get("clube", 1) != clube_atual().id:
+        # Login feito em outro clube (o cookie é do domínio): aqui não vale, mas continua lá
+        return None
+    aluno_id = session.get("aluno_id")
+    if aluno_id is None and session.get("usuario"):
+        # Sessões anteriores ao aluno_id só guardavam o nome: busca uma vez e migra
+        aluno_id = db.session.execute(select(Aluno.id).where(
+            Aluno.clube_id == clube_atual().id, Aluno.nome == session["usuario"]
+        )).scalar()
+        if aluno_id is None:
+            session.pop("usuario", None)
+            return None
+        session["aluno_id"] = aluno_id
+    if aluno_id is None:
+        return None
     
-    # Buscar aluno no banco
-    aluno = Aluno.query.filter_by(nome=nome).first()
-    if not aluno:
-        flash("Usuário não encontrado", "error")
+    aluno = identidades.obter(aluno_id)
+    if aluno is None:
+        # Aluno removido: encerra a sessão
+        session.pop("aluno_id", None)
         session.pop("usuario", None)
-        return redirect(url_for("usuario"))
-    
-    hoje = date.today()
-    status = {}
+    elif session.get("usuario") != aluno.nome:
+        # Renomeado pelo admin: acompanha na saudação
+        session["usuario"] = aluno.nome
+    return aluno
 
-    for h in HORARIOS:
-        # Contar check-ins para hoje neste horário
-        checkins_horario = Checkin.query.filter_by(
-            data=hoje,
-            horario=h
-        ).all()
-        
-        # Verificar se usuário já tem reserva
-        usuario_reservado = any(c.aluno.nome == nome for c in checkins_horario)
+def status_sessoes(data, ocupacao, filas, aluno_id):
+    """Vagas restantes, lotação, reserva, lugar do aluno na fila e janelas de cada sessão da data"""
+    agora = momento()
+    status = {}
+    for sessao in agenda.do_dia(data):
+        reservas = ocupacao.get(sessao.id, frozenset())
+        fila = filas.get(sessao.id, ())
         
-        status[h] = {
-            "vagas_restantes": LIMITE_VAGAS - len(checkins_horario),
-            "reservado": usuario_reservado,
-            "lotado": len(checkins_horario) >= LIMITE_VAGAS
+        status[sessao.id] = {
+            "horario": sessao.rotulo,
+            "capacidade": sessao.capacidade,
+            "vagas_restantes": max(0, sessao.capacidade - len(reservas)),
+            "reservado": aluno_id in reservas,
+            "lotado": len(reservas) >= sessao.capacidade,
+            "na_fila": len(fila),
+            "posicao_espera": fila.index(aluno_id) + 1 if aluno_id in fila else None,
+            "aberta": agora.reserva_aberta(sessao, data),
+            "pode_cancelar": agora.pode_cancelar(sessao, data),
+            "corte": f"{agora.corte(sessao):%H:%M}"
         }
+    return status
 
-    # Verificar se é antes das 15h no horário do Brasil (GMT-3) para permitir cancelamentos
-    # 15:00 Brasil = 18:00 UTC
-    agora_utc = datetime.now(timezone.utc).time()
-    pode_cancelar = agora_utc <= time(18, 0)  # 18:00 UTC = 15:00 Brasil
+def montar_status(hoje, aluno_id):
+    """Status das sessões de hoje"""
+    # Ocupação e filas do dia vêm do cache (recarregadas no máximo uma vez por TTL)
+    filas = cache_ocupacao.filas(hoje, hoje)[hoje]
+    return status_sessoes(hoje, cache_ocupacao.do_dia(hoje), filas, aluno_id)
+
+def montar_calendario(hoje, dias, aluno_id):
+    """Matriz dia × sessão dos próximos dias, com no máximo uma consulta por intervalo"""
+    fim = hoje + timedelta(days=dias - 1)
+    ocupacao = cache_ocupacao.do_periodo(hoje, fim)
+    filas = cache_ocupacao.filas(hoje, fim)
+    return [
+        {"data": data, "sessoes": status_sessoes(data, ocupacao[data], filas[data], aluno_id)}
+        for data in sorted(ocupacao)
+    ]
+
+def data_reserva(hoje):
+    """Data pedida em ?data=AAAA-MM-DD (hoje se ausente); None se fora do horizonte"""
+    valor = request.args.get("data")
+    if not valor:
+        return hoje
+    try:
+        data = date.fromisoformat(valor)
+    except ValueError:
+        return None
+    if not hoje <= data < hoje + timedelta(days=DIAS_ANTECEDENCIA):
+        return None
+    return data
+
+def voltar_reserva(data, hoje):
+    """Reservas de outros dias voltam para o calendário; as de hoje, para o painel"""
+    if data is not None and data != hoje:
+        return redirect(url_for("galpao.calendario"))
+    return redirect(url_for("galpao.painel_usuario"))
+
+def status_json(aluno_id):
+    """Status das sessões de hoje no formato da API"""
+    hoje = momento().hoje
+    return {
+        "data": hoje.isoformat(),
+        "sessoes": montar_status(hoje, aluno_id)
+    }
+
+@bp.route("/painel_usuario", methods=["GET", "POST"])
+def painel_usuario():
+    """Painel do usuário com status dos horários"""
+    aluno = aluno_logado()
+    if not aluno:
+        flash("Faça login para acessar o painel", "error")
+        return redirect(url_for("galpao.usuario"))
+    
+    hoje = momento().hoje
+    status = montar_status(hoje, aluno.id)
     
     return render_template(
         "painel_usuario.html", 
-        nome=nome, 
+        nome=aluno.nome, 
+        sessoes=agenda.do_dia(hoje),
         status=status, 
         creditos=aluno.creditos,
         hoje=hoje.strftime("%Y-%m-%d"),
-        pode_cancelar=pode_cancelar
+        aluno_id=aluno.id
     )
 
-@app.route("/checkin/<horario>")
-def checkin(horario):
-    """Realiza check-in do usuário"""
-    nome = session.get("usuario")
-    if not nome:
-        flash("Faça login para fazer check-in", "error")
-        return redirect(url_for("usuario"))
+@bp.route("/sw.js")
+def service_worker():
+    """Service worker do PWA: guarda o shell do painel e reenvia as ações feitas sem conexão"""
+    shell = [estaticos.url("style.css"), estaticos.url("script.js"), url_for("static", filename="icone.svg"), *SHELL_CDN]
+    resposta = Response(render_template(
+        "sw.js",
+        versao=hashlib.sha256("\n".join(shell).encode()).hexdigest()[:12],
+        shell=shell,
+        painel=url_for("galpao.painel_usuario"),
+        sair=url_for("galpao.logout"),
+        api=[url_for("galpao.api_checkin"), url_for("galpao.api_cancelar")]
+    ), mimetype="text/javascript")
+    # O navegador confere o service worker a cada navegação; o nome do cache muda com os assets
+    resposta.headers["Cache-Control"] = "no-cache"
+    return resposta
+
+@bp.route("/manifest.webmanifest")
+def manifesto_pwa():
+    """Manifesto do app instalável (abre direto no painel do aluno)"""
+    resposta = jsonify({
+        "name": clube_atual().nome,
+        "short_name": "Check-in",
+        "lang": "pt-BR",
+        "start_url": url_for("galpao.painel_usuario"),
+        "scope": url_for("galpao.home"),
+        "display": "standalone",
+        "background_color": "#ffffff",
+        "theme_color": "#0d6efd",
+        "icons": [{"src": url_for("static", filename="icone.svg"), "sizes": "any", "type": "image/svg+xml"}],
+    })
+    resposta.mimetype = "application/manifest+json"
+    return resposta
+
+@bp.route("/api/status")
+def api_status():
+    """Status dos horários de hoje em JSON"""
+    aluno = aluno_logado()
+    if not aluno:
+        return jsonify({"erro": "Faça login para consultar os horários"}), 401
     
-    if horario not in HORARIOS:
-        flash("Horário inválido", "error")
-        return redirect(url_for("painel_usuario"))
+    return jsonify(status_json(aluno.id))
+
+@bp.route("/api/status/stream")
+def api_status_stream():
+    """Fluxo Server-Sent Events com mudanças de vagas dos horários de hoje"""
+    aluno = aluno_logado()
+    if not aluno:
+        return jsonify({"erro": "Faça login para consultar os horários"}), 401
     
-    hoje = date.today()
+    canal = canal_status.de(clube_atual().id)
+    # Sem vaga, o painel consulta /api/status (o EventSource não reconecta após um 503)
+    if not fluxos_sse.entrar():
+        return jsonify({"erro": "Muitas conexões em tempo real; use /api/status"}), 503, {"Retry-After": "60"}
     
-    # Buscar aluno no banco
-    aluno = Aluno.query.filter_by(nome=nome).first()
-    if not aluno:
-        flash("Usuário não encontrado", "error")
-        return redirect(url_for("usuario"))
-
-    if aluno.creditos <= 0:
-        flash("Sem créditos disponíveis. Entre em contato com a administração.", "error")
-        return redirect(url_for("painel_usuario"))
+    aluno_id = aluno.id
 
-    # Verificar se já tem reserva para este horário
-    checkin_existente = Checkin.query.filter_by(
-        aluno_id=aluno.id,
-        data=hoje,
-        horario=horario
-    ).first()
+    def calcular():
+        # O fluxo dura horas: cada envio recalcula o momento (data e cortes)
+        g.pop("momento", None)
+        dados = status_json(aluno_id)
+        # Devolver a conexão ao pool enquanto o fluxo espera por mudanças
+        db.session.close()
+        return dados
     
-    if checkin_existente:
-        flash("Você já tem reserva para este horário", "info")
-        return redirect(url_for("painel_usuario"))
-
-    # Verificar se horário está lotado
-    total_checkins = Checkin.query.filter_by(
-        data=hoje,
-        horario=horario
-    ).count()
-    
-    if total_checkins >= LIMITE_VAGAS:
-        flash("Horário lotado. Tente outro horário.", "error")
-        return redirect(url_for("painel_usuario"))
-
-    # Criar check-in e debitar crédito
-    novo_checkin = Checkin(
-        aluno_id=aluno.id,
-        data=hoje,
-        horario=horario
+    db.session.close()
+    resposta = Response(
+        stream_with_context(fluxo_sse(calcular, canal)),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
+    # Chamado pelo servidor quando o fluxo termina ou o cliente desconecta
+    resposta.call_on_close(fluxos_sse.sair)
+    return resposta
+
+def fazer_checkin(aluno_id, sessao_id, data):
+    """Regras do check-in (data, janela da sessão, créditos, vagas); retorna (resultado, mensagem, categoria)"""
+    sessao = agenda.validar(sessao_id, data) if data else None
+    if sessao is None:
+        return INVALIDO, "Horário inválido", "error"
     
-    aluno.creditos -= 1
+    if not momento().reserva_aberta(sessao, data):
+        return ENCERRADA, f"As reservas para {sessao.rotulo} já encerraram", "error"
     
-    db.session.add(novo_checkin)
-    db.session.commit()
+    # Sem atalho pelos créditos em cache (podem estar defasados): o débito atômico decide
+    resultado = reservar(aluno_id, data, sessao.id, sessao.capacidade)
     
-    flash(f"Check-in realizado com sucesso para {horario}!", "success")
+    if resultado == SEM_CREDITOS:
+        return resultado, "Sem créditos disponíveis. Entre em contato com a administração.", "error"
+    if resultado == JA_RESERVADO:
+        return resultado, "Você já tem reserva para este horário", "info"
+    if resultado == LOTADO:
+        return resultado, "Horário lotado. Entre na lista de espera para ficar com a próxima vaga.", "error"
+    return resultado, f"Check-in realizado com sucesso para {sessao.rotulo} em {data.strftime('%d/%m')}!", "success"
 
-    return redirect(url_for("painel_usuario"))
+def fazer_cancelamento(aluno_id, sessao_id, data):
+    """Regras do cancelamento (data, corte do dia) com reembolso; retorna (resultado, mensagem, categoria)"""
+    # Sessões desativadas depois da reserva ainda podem ser canceladas
+    sessao = agenda.sessao(sessao_id) if data else None
+    if sessao is None:
+        return INVALIDO, "Horário inválido", "error"
+    
+    # Corte de cancelamento da sessão no dia dela, no horário de Brasília
+    if not momento().pode_cancelar(sessao, data):
+        return FORA_DO_CORTE, f"Cancelamento não permitido após {momento().corte(sessao):%H:%M}h (horário de Brasília)", "error"
+    
+    # A vaga vai direto para o primeiro da lista de espera, se houver
+    resultado = cancelar_reserva(aluno_id, data, sessao.id, sessao.capacidade)
+    
+    if resultado == SEM_RESERVA:
+        return resultado, "Você não tem reserva para este horário", "info"
+    return resultado, f"Reserva cancelada para {sessao.rotulo} em {data.strftime('%d/%m')}. Crédito reembolsado!", "success"
 
-@app.route("/cancelar/<horario>")
-def cancelar(horario):
-    """Cancela reserva do usuário"""
-    nome = session.get("usuario")
-    if not nome:
+def acao_api(nome, fazer):
+    """Ação de reserva pedida em JSON ({"sessao_id", "data", "aluno_id"}), executada uma vez por Idempotency-Key"""
+    aluno = aluno_logado()
+    if not aluno:
+        return jsonify({"erro": "Faça login para continuar"}), 401
+    
+    chave = request.headers.get("Idempotency-Key", "")
+    if not idempotencia.chave_valida(chave):
+        return jsonify({"erro": "Cabeçalho Idempotency-Key ausente ou inválido"}), 400
+    
+    dados = request.get_json(silent=True) or {}
+    # Ação guardada na fila offline por outro aluno no mesmo aparelho: não pode debitar deste
+    if "aluno_id" in dados and dados["aluno_id"] != aluno.id:
+        return jsonify({"resultado": OUTRO_ALUNO, "erro": "Ação feita por outro aluno neste aparelho"}), 403
+    
+    try:
+        sessao_id = int(dados["sessao_id"])
+        data = date.fromisoformat(dados["data"])
+    except (KeyError, TypeError, ValueError):
+        return jsonify({"erro": "Informe sessao_id e data (AAAA-MM-DD)"}), 400
+    # Ids fora da coluna INTEGER estourariam no Postgres (e na impressão do pedido)
+    if not 1 <= sessao_id <= ID_MAXIMO:
+        return jsonify({"erro": "sessao_id inválido"}), 400
+    
+    # Impressão do pedido com tamanho limitado: cabe em ChaveIdempotencia.pedido
+    pedido = f"{nome}:{sessao_id}:{data.isoformat()}"
+    
+    # A data vem do clique: uma ação reenviada depois da meia-noite não muda de dia
+    hoje = momento().hoje
+    if not hoje <= data < hoje + timedelta(days=DIAS_ANTECEDENCIA):
+        data = None
+    
+    def responder():
+        resultado, mensagem, categoria = fazer(aluno.id, sessao_id, data)
+        status = 400 if resultado == INVALIDO else STATUS_API[categoria]
+        return {"resultado": resultado, "mensagem": mensagem, "categoria": categoria}, status
+    
+    corpo, status = idempotencia.executar(aluno.id, chave, pedido, responder)
+    return jsonify(corpo), status
+
+@bp.route("/api/checkin", methods=["POST"])
+def api_checkin():
+    """Check-in pelo PWA (idempotente: reenvios da fila offline não reservam duas vezes)"""
+    return acao_api("checkin", fazer_checkin)
+
+@bp.route("/api/cancelar", methods=["POST"])
+def api_cancelar():
+    """Cancelamento pelo PWA (idempotente)"""
+    return acao_api("cancelar", fazer_cancelamento)
+
+@bp.route("/checkin/<int:sessao_id>")
+def checkin(sessao_id):
+    """Realiza check-in do usuário (hoje ou, com ?data=, outro dia do horizonte)"""
+    aluno = aluno_logado()
+    if not aluno:
+        flash("Faça login para fazer check-in", "error")
+        return redirect(url_for("galpao.usuario"))
+    
+    hoje = momento().hoje
+    data = data_reserva(hoje)
+    _, mensagem, categoria = fazer_checkin(aluno.id, sessao_id, data)
+    flash(mensagem, categoria)
+    return voltar_reserva(data, hoje)
+
+@bp.route("/cancelar/<int:sessao_id>")
+def cancelar(sessao_id):
+    """Cancela reserva do usuário (hoje ou, com ?data=, outro dia do horizonte)"""
+    aluno = aluno_logado()
+    if not aluno:
         flash("Faça login para cancelar reserva", "error")
-        return redirect(url_for("usuario"))
+        return redirect(url_for("galpao.usuario"))
+    
+    hoje = momento().hoje
+    data = data_reserva(hoje)
+    _, mensagem, categoria = fazer_cancelamento(aluno.id, sessao_id, data)
+    flash(mensagem, categoria)
+    return voltar_reserva(data, hoje)
+
+@bp.route("/espera/<int:sessao_id>")
+def espera(sessao_id):
+    """Entra na lista de espera de uma sessão lotada (vaga liberada vira reserva automática)"""
+    aluno = aluno_logado()
+    if not aluno:
+        flash("Faça login para entrar na lista de espera", "error")
+        return redirect(url_for("galpao.usuario"))
     
-    if horario not in HORARIOS:
+    hoje = momento().hoje
+    data = data_reserva(hoje)
+    sessao = agenda.validar(sessao_id, data) if data else None
+    if sessao is None:
         flash("Horário inválido", "error")
-        return redirect(url_for("painel_usuario"))
+        return voltar_reserva(data, hoje)
+    
+    if not momento().reserva_aberta(sessao, data):
+        flash(f"As reservas para {sessao.rotulo} já encerraram", "error")
+        return voltar_reserva(data, hoje)
+    
+    if aluno.creditos <= 0:
+        flash("Sem créditos disponíveis. Entre em contato com a administração.", "error")
+        return voltar_reserva(data, hoje)
+    
+    resultado = entrar_na_espera(aluno.id, data, sessao.id, sessao.capacidade)
     
-    # Verificar se ainda é possível cancelar (antes das 15h no horário do Brasil)
-    # 15:00 Brasil = 18:00 UTC
-    agora_utc = datetime.now(timezone.utc).time()
-    if agora_utc > time(18, 0):  # 18:00 UTC = 15:00 Brasil
-        flash("Cancelamento não permitido após 15:00h (horário de Brasília)", "error")
-        return redirect(url_for("painel_usuario"))
+    if resultado == HA_VAGA:
+        flash("Este horário tem vaga: faça a reserva diretamente.", "info")
+    elif resultado == JA_RESERVADO:
+        flash("Você já tem reserva para este horário", "info")
+    elif resultado == JA_NA_ESPERA:
+        flash("Você já está na lista de espera deste horário", "info")
+    else:
+        flash(f"Você entrou na lista de espera de {sessao.rotulo}. "
+              "Se uma vaga abrir, a reserva é feita automaticamente (1 crédito).", "success")
+    
+    return voltar_reserva(data, hoje)
 
-    hoje = date.today()
+@bp.route("/espera/<int:sessao_id>/sair")
+def sair_espera(sessao_id):
+    """Sai da lista de espera de uma sessão"""
+    aluno = aluno_logado()
+    if not aluno:
+        flash("Faça login para sair da lista de espera", "error")
+        return redirect(url_for("galpao.usuario"))
+    
+    hoje = momento().hoje
+    data = data_reserva(hoje)
+    if data is None:
+        flash("Horário inválido", "error")
+        return voltar_reserva(data, hoje)
+    
+    if sair_da_espera(aluno.id, data, sessao_id) == SEM_RESERVA:
+        flash("Você não está na lista de espera deste horário", "info")
+    else:
+        flash("Você saiu da lista de espera", "info")
     
-    # Buscar aluno no banco
-    aluno = Aluno.query.filter_by(nome=nome).first()
+    return voltar_reserva(data, hoje)
+
+@bp.route("/calendario", methods=["GET", "POST"])
+def calendario():
+    """Calendário dos próximos dias; o POST reserva várias sessões de uma vez"""
+    aluno = aluno_logado()
     if not aluno:
-        flash("Usuário não encontrado", "error")
-        return redirect(url_for("usuario"))
-
-    # Buscar check-in para cancelar
-    checkin = Checkin.query.filter_by(
-        aluno_id=aluno.id,
-        data=hoje,
-        horario=horario
-    ).first()
-    
-    if not checkin:
-        flash("Você não tem reserva para este horário", "info")
-        return redirect(url_for("painel_usuario"))
-
-    # Cancelar check-in e reembolsar crédito
-    db.session.delete(checkin)
-    aluno.creditos += 1
-    db.session.commit()
+        flash("Faça login para acessar o calendário", "error")
+        return redirect(url_for("galpao.usuario"))
     
-    flash(f"Reserva cancelada para {horario}. Crédito reembolsado!", "success")
+    hoje = momento().hoje
+    
+    if request.method == "POST":
+        # Cada escolha vem como "AAAA-MM-DD:sessao_id"; cada reserva é sua própria transação
+        resultados = Counter()
+        limite_dia = hoje + timedelta(days=DIAS_ANTECEDENCIA)
+        for escolha in request.form.getlist("reserva"):
+            try:
+                valor_data, valor_sessao = escolha.split(":")
+                data = date.fromisoformat(valor_data)
+                sessao = agenda.validar(int(valor_sessao), data) if hoje <= data < limite_dia else None
+            except ValueError:
+                sessao = None
+            if sessao is not None and not momento().reserva_aberta(sessao, data):
+                sessao = None
+            if sessao is None:
+                resultados["invalido"] += 1
+                continue
+            resultados[reservar(aluno.id, data, sessao.id, sessao.capacidade)] += 1
+        
+        if resultados[RESERVADO]:
+            flash(f"{resultados[RESERVADO]} reserva(s) confirmada(s)!", "success")
+        for resultado, mensagem in (
+            (SEM_CREDITOS, "sem créditos suficientes"),
+            (LOTADO, "horário lotado"),
+            (JA_RESERVADO, "já reservada(s)"),
+            ("invalido", "horário inválido"),
+        ):
+            if resultados[resultado]:
+                flash(f"{resultados[resultado]} não reservada(s): {mensagem}", "error")
+        if not resultados:
+            flash("Selecione pelo menos um horário", "info")
+        return redirect(url_for("galpao.calendario"))
+    
+    return render_template(
+        "calendario.html",
+        nome=aluno.nome,
+        creditos=aluno.creditos,
+        dias=montar_calendario(hoje, DIAS_ANTECEDENCIA, aluno.id),
+        nomes_dias=DIAS_SEMANA,
+        hoje=hoje
+    )
 
-    return redirect(url_for("painel_usuario"))
+@bp.route("/api/calendario")
+def api_calendario():
+    """Ocupação e reservas do aluno nos próximos dias (até o horizonte de reservas)"""
+    aluno = aluno_logado()
+    if not aluno:
+        return jsonify({"erro": "Faça login para consultar os horários"}), 401
+    
+    try:
+        dias = min(max(int(request.args.get("dias", DIAS_ANTECEDENCIA)), 1), DIAS_ANTECEDENCIA)
+    except ValueError:
+        dias = DIAS_ANTECEDENCIA
+    
+    hoje = momento().hoje
+    return jsonify({
+        "inicio": hoje.isoformat(),
+        "dias": [
+            {"data": linha["data"].isoformat(), "sessoes": linha["sessoes"]}
+            for linha in montar_calendario(hoje, dias, aluno.id)
+        ]
+    })
 
-@app.route("/logout")
+@bp.route("/logout")
 def logout():
     """Logout do usuário"""
+    session.pop("aluno_id", None)
     session.pop("usuario", None)
     session.pop("admin", None)
     flash("Logout realizado com sucesso", "info")
-    return redirect(url_for("home"))
+    return redirect(url_for("galpao.home"))
 
 def gerar_resumo_checkins():
     """Gera resumo dos check-ins do dia e da semana"""
-    hoje = date.today()
-    
-    # Check-ins de hoje
-    checkins_hoje = Checkin.query.filter_by(data=hoje).all()
-    total_hoje = len(checkins_hoje)
-    
-    # Organizar por horário
-    checkins_hoje_detalhado = {}
-    for horario in HORARIOS:
-        nomes = [c.aluno.nome for c in checkins_hoje if c.horario == horario]
-        checkins_hoje_detalhado[horario] = nomes
-    
-    # Check-ins da semana (últimos 7 dias)
-    data_inicio = hoje - timedelta(days=6)
-    checkins_semana = Checkin.query.filter(
-        Checkin.data >= data_inicio,
-        Checkin.data <= hoje
-    ).all()
-    
-    total_semana = len(checkins_semana)
-    
-    # Contar por aluno
-    checkins_por_aluno = defaultdict(int)
-    for checkin in checkins_semana:
-        checkins_por_aluno[checkin.aluno.nome] += 1
-    
-    return {
-        "hoje": {
-            "total": total_hoje,
-            "por_horario": checkins_hoje_detalhado,
-            "data": hoje.strftime("%Y-%m-%d")
-        },
-        "semana": {
-            "total": total_semana,
-            "por_aluno": dict(checkins_por_aluno),
-            "periodo": f"{data_inicio.strftime('%d/%m')} - {hoje.strftime('%d/%m')}"
-        }
-    }
+    hoje = momento().hoje
+    return resumo_checkins.obter(hoje, agenda.do_dia(hoje))
 
-# Inicializar banco de dados
-init_db()
-
-# Tentar migrar dados existentes do JSON (se existirem)
-try:
-    with app.app_context():
-        migrar_dados_json()
-except Exception as e:
-    print(f"Aviso: Erro ao migrar dados JSON: {e}")
+app = create_app()
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    # Servidor de desenvolvimento; em produção use gunicorn -c gunicorn.conf.py main:app
+    init_db(app)
+    app.run(
+        host="0.0.0.0",
+        port=int(os.environ.get("PORT", 5000)),
+        debug=os.environ.get("FLASK_DEBUG", "1") == "1"
+    )
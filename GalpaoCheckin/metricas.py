@@ -0,0 +1,171 @@
+"""Instrumentação por requisição (latência, SQL, templates) exportada no formato Prometheus"""
+import os
+import threading
+from time import perf_counter
+from flask import g, request, current_app, has_request_context, before_render_template, template_rendered
+from sqlalchemy import event
+
+# Limites dos buckets (segundos e número de consultas)
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_CONSULTAS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+
+# Modo de depuração (ou app em debug): registra no log as requisições acima do orçamento
+METRICAS_DEBUG = os.environ.get("METRICAS_DEBUG") == "1"
+ORCAMENTO_CONSULTAS = int(os.environ.get("ORCAMENTO_CONSULTAS", "10"))
+ORCAMENTO_MS = float(os.environ.get("ORCAMENTO_MS", "250"))
+
+# Consultas guardadas por requisição para o log de depuração
+MAX_CONSULTAS_LOG = 30
+
+class Histograma:
+    """Histograma cumulativo por conjunto de rótulos, seguro entre threads"""
+
+    def __init__(self, nome, ajuda, rotulos, buckets):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = rotulos
+        self.buckets = buckets
+        self._trava = threading.Lock()
+        self._series = {}  # valores dos rótulos -> [contagens por bucket, soma, total]
+
+    def observar(self, valor, *rotulos):
+        """Soma uma observação à série dos rótulos informados"""
+        with self._trava:
+            serie = self._series.get(rotulos)
+            if serie is None:
+                serie = self._series[rotulos] = [[0] * len(self.buckets), 0.0, 0]
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    serie[0][i] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def serie(self, *rotulos):
+        """(total de observações, soma) de uma série; (0, 0.0) se não existir"""
+        with self._trava:
+            serie = self._series.get(rotulos)
+            return (serie[2], serie[1]) if serie else (0, 0.0)
+
+    def exportar(self):
+        """Linhas no formato texto do Prometheus"""
+        with self._trava:
+            series = [(r, list(s[0]), s[1], s[2]) for r, s in sorted(self._series.items())]
+        linhas = [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} histogram"]
+        for valores, contagens, soma, total in series:
+            base = ",".join(f'{n}="{_escapar(v)}"' for n, v in zip(self.rotulos, valores))
+            sep = "," if base else ""
+            for limite, contagem in zip(self.buckets, contagens):
+                linhas.append(f'{self.nome}_bucket{{{base}{sep}le="{limite:g}"}} {contagem}')
+            linhas.append(f'{self.nome}_bucket{{{base}{sep}le="+Inf"}} {total}')
+            linhas.append(f"{self.nome}_sum{{{base}}} {soma:.6f}")
+            linhas.append(f"{self.nome}_count{{{base}}} {total}")
+        return linhas
+
+    def limpar(self):
+        """Zera todas as séries"""
+        with self._trava:
+            self._series.clear()
+
+def _escapar(valor):
+    """Escapa um valor de rótulo (barra invertida, aspas e quebra de linha)"""
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+class Metricas:
+    """Registro em memória do processo; cada worker do gunicorn exporta o seu"""
+
+    def __init__(self):
+        self.latencia = Histograma(
+            "galpao_requisicao_segundos", "Latência das requisições por rota",
+            ("rota", "metodo", "status"), BUCKETS_SEGUNDOS
+        )
+        self.consultas = Histograma(
+            "galpao_sql_consultas_por_requisicao", "Consultas SQL executadas por requisição",
+            ("rota",), BUCKETS_CONSULTAS
+        )
+        self.tempo_banco = Histograma(
+            "galpao_sql_segundos_por_requisicao", "Tempo total no banco por requisição",
+            ("rota",), BUCKETS_SEGUNDOS
+        )
+        self.templates = Histograma(
+            "galpao_template_segundos", "Tempo de renderização por template",
+            ("template",), BUCKETS_SEGUNDOS
+        )
+
+    def histogramas(self):
+        """Todos os histogramas, na ordem de exportação"""
+        return (self.latencia, self.consultas, self.tempo_banco, self.templates)
+
+    def exportar(self):
+        """Texto completo para o endpoint /metrics"""
+        linhas = []
+        for histograma in self.histogramas():
+            linhas.extend(histograma.exportar())
+        return "\n".join(linhas) + "\n"
+
+    def limpar(self):
+        """Zera o registro (útil em benchmarks)"""
+        for histograma in self.histogramas():
+            histograma.limpar()
+
+    def instalar(self, app, engine):
+        """Liga os ganchos de requisição, do engine SQLAlchemy e dos templates"""
+        app.before_request(self._inicio_requisicao)
+        app.after_request(self._fim_requisicao)
+        event.listen(engine, "before_cursor_execute", _antes_consulta)
+        event.listen(engine, "after_cursor_execute", _depois_consulta)
+        before_render_template.connect(_antes_template, app, weak=False)
+        template_rendered.connect(self._depois_template, app, weak=False)
+
+    def _inicio_requisicao(self):
+        g.metricas = {"inicio": perf_counter(), "consultas": 0, "banco": 0.0, "templates": 0.0, "sql": []}
+
+    def _fim_requisicao(self, resposta):
+        """Observa a requisição; respostas em fluxo (SSE) contam só até o primeiro byte"""
+        dados = g.pop("metricas", None)
+        if dados is None:
+            return resposta
+        segundos = perf_counter() - dados["inicio"]
+        rota = request.endpoint or "desconhecida"
+        self.latencia.observar(segundos, rota, request.method, str(resposta.status_code))
+        self.consultas.observar(dados["consultas"], rota)
+        self.tempo_banco.observar(dados["banco"], rota)
+
+        if (METRICAS_DEBUG or current_app.debug) and (dados["consultas"] > ORCAMENTO_CONSULTAS or segundos * 1000 > ORCAMENTO_MS):
+            current_app.logger.warning(
+                "Acima do orçamento: %s %s -> %s em %.0f ms; %d consultas (%.0f ms no banco), "
+                "templates %.0f ms\n  %s",
+                request.method, request.path, resposta.status_code, segundos * 1000,
+                dados["consultas"], dados["banco"] * 1000, dados["templates"] * 1000,
+                "\n  ".join(dados["sql"]) or "(sem SQL)"
+            )
+        return resposta
+
+    def _depois_template(self, app, template, context, **_):
+        inicio = g.get("inicio_template", {}).pop(id(template), None)
+        if inicio is None:
+            return
+        segundos = perf_counter() - inicio
+        self.templates.observar(segundos, template.name or "inline")
+        if "metricas" in g:
+            g.metricas["templates"] += segundos
+
+def _antes_template(app, template, context, **_):
+    g.setdefault("inicio_template", {})[id(template)] = perf_counter()
+
+def _antes_consulta(conn, cursor, statement, parameters, context, executemany):
+    # Uma conexão executa uma consulta por vez; consultas com erro são sobrescritas
+    conn.info["inicio_consulta"] = perf_counter()
+
+def _depois_consulta(conn, cursor, statement, parameters, context, executemany):
+    inicio = conn.info.pop("inicio_consulta", None)
+    # Consultas fora de requisição (CLI, ouvintes após o fim) não entram na conta
+    if inicio is None or not has_request_context() or "metricas" not in g:
+        return
+    dados = g.metricas
+    dados["consultas"] += 1
+    dados["banco"] += perf_counter() - inicio
+    if (METRICAS_DEBUG or current_app.debug) and len(dados["sql"]) < MAX_CONSULTAS_LOG:
+        dados["sql"].append(" ".join(statement.split())[:200])
+
+# Instância única do processo
+metricas = Metricas()
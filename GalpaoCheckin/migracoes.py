@@ -0,0 +1,186 @@
+"""Ajustes de esquema para bancos criados antes das mudanças nos modelos"""
+from sqlalchemy import inspect, text, bindparam, select, func, MetaData
+from sqlalchemy.schema import CreateIndex, CreateTable
+from models import db, Clube, Aluno, Admin, Checkin, Sessao, ResumoDiario, MovimentoCredito
+from agenda import GRADE_PADRAO, CAPACIDADE_PADRAO, MESAS_PADRAO, ler_rotulo
+from clubes import clubes, CLUBE_PADRAO, NOME_PADRAO
+from analitico import reconstruir
+from extrato import abrir_saldos
+
+def _indices(tabela):
+    """Nomes dos índices existentes em uma tabela"""
+    return {indice['name'] for indice in inspect(db.engine).get_indexes(tabela)}
+
+def _colunas(tabela):
+    """Nomes das colunas existentes em uma tabela"""
+    return {coluna['name'] for coluna in inspect(db.engine).get_columns(tabela)}
+
+def _tamanho_coluna(tabela, coluna):
+    """Tamanho declarado de uma coluna VARCHAR (None se não houver)"""
+    for info in inspect(db.engine).get_columns(tabela):
+        if info['name'] == coluna:
+            return getattr(info['type'], 'length', None)
+    return None
+
+def semear_sessoes(clube_id):
+    """Cria a grade padrão (antigos HORARIOS/LIMITE_VAGAS) se o clube não tiver sessões"""
+    if db.session.execute(select(func.count(Sessao.id)).where(Sessao.clube_id == clube_id)).scalar():
+        return
+    for dia in range(7):
+        for rotulo in GRADE_PADRAO:
+            inicio, fim = ler_rotulo(rotulo)
+            db.session.add(Sessao(
+                clube_id=clube_id, dia_semana=dia, inicio=inicio, fim=fim,
+                capacidade=CAPACIDADE_PADRAO, mesas=MESAS_PADRAO
+            ))
+    db.session.commit()
+
+# Tabelas que ganharam clube_id e a restrição única antiga (do Postgres) que ele passou a compor
+_TABELAS_CLUBE = (
+    (Aluno, 'alunos_nome_key'),
+    (Sessao, 'uq_sessao_dia_horario'),
+    (Admin, 'admin_config_chave_key'),
+    (Checkin, None),
+)
+
+def _recriar_sqlite(modelo, clube_id):
+    """Recria a tabela com o esquema do modelo, copiando as linhas para o clube dado.
+
+    O SQLite não remove um UNIQUE declarado na coluna: a tabela nova é
+    criada ao lado, recebe as linhas e assume o nome da antiga. Com as
+    chaves estrangeiras desligadas (padrão do SQLite), as tabelas que
+    apontam para ela continuam valendo.
+    """
+    tabela = modelo.__table__
+    copia = MetaData()
+    Clube.__table__.to_metadata(copia)
+    nova = tabela.to_metadata(copia, name=f"{tabela.name}_nova")
+    colunas = [c.name for c in tabela.columns if c.name in _colunas(tabela.name)]
+    db.session.execute(CreateTable(nova))
+    db.session.execute(
+        text(f"INSERT INTO {nova.name} ({', '.join(colunas)}, clube_id) "
+             f"SELECT {', '.join(colunas)}, :clube FROM {tabela.name}"),
+        {"clube": clube_id}
+    )
+    db.session.execute(text(f"DROP TABLE {tabela.name}"))
+    db.session.execute(text(f"ALTER TABLE {nova.name} RENAME TO {tabela.name}"))
+
+def _migrar_clubes():
+    """Cria o clube padrão e põe os dados de antes da separação por clube nele; retorna o id"""
+    clube = db.session.execute(select(Clube).where(Clube.slug == CLUBE_PADRAO)).scalar()
+    if clube is None:
+        clube = Clube(slug=CLUBE_PADRAO, nome=NOME_PADRAO)
+        db.session.add(clube)
+        db.session.commit()
+        clubes.invalidar()
+
+    for modelo, unica_antiga in _TABELAS_CLUBE:
+        tabela = modelo.__table__.name
+        if 'clube_id' in _colunas(tabela):
+            continue
+        if db.engine.dialect.name == 'sqlite' and unica_antiga:
+            _recriar_sqlite(modelo, clube.id)
+        else:
+            db.session.execute(text(
+                f"ALTER TABLE {tabela} ADD COLUMN clube_id INTEGER NOT NULL DEFAULT {clube.id} REFERENCES clubes (id)"
+            ))
+            if db.engine.dialect.name == 'postgresql':
+                db.session.execute(text(f"ALTER TABLE {tabela} ALTER COLUMN clube_id DROP DEFAULT"))
+                if unica_antiga:
+                    db.session.execute(text(f"ALTER TABLE {tabela} DROP CONSTRAINT IF EXISTS {unica_antiga}"))
+        db.session.commit()
+
+    # A busca por prefixo passou a começar pelo clube (idx_aluno_clube_nome_prefixo)
+    db.session.execute(text("DROP INDEX IF EXISTS idx_aluno_nome_prefixo"))
+    db.session.commit()
+    return clube.id
+
+def _migrar_horarios(clube_id):
+    """Troca checkins.horario (texto) por checkins.sessao_id (FK para sessoes)"""
+    colunas = _colunas('checkins')
+    if 'horario' not in colunas:
+        return
+
+    if 'sessao_id' not in colunas:
+        db.session.execute(text("ALTER TABLE checkins ADD COLUMN sessao_id INTEGER REFERENCES sessoes (id)"))
+
+    # Um UPDATE por (data, horario) distinto: poucas centenas de linhas por ano
+    sessoes = {(s.dia_semana, s.rotulo): s.id for s in db.session.execute(select(Sessao)).scalars()}
+    pares = db.session.execute(
+        text("SELECT DISTINCT data, horario FROM checkins WHERE sessao_id IS NULL")
+        .columns(data=db.Date, horario=db.String)
+    ).all()
+    atualizacoes = []
+    for data, horario in pares:
+        chave = (data.weekday(), horario)
+        if chave not in sessoes:
+            # Horário antigo fora da grade: vira sessão inativa para manter o histórico
+            inicio, fim = ler_rotulo(horario)
+            sessao = Sessao(clube_id=clube_id, dia_semana=data.weekday(), inicio=inicio, fim=fim,
+                            capacidade=CAPACIDADE_PADRAO, mesas=MESAS_PADRAO, ativa=False)
+            db.session.add(sessao)
+            db.session.flush()
+            sessoes[chave] = sessao.id
+        atualizacoes.append({"s": sessoes[chave], "d": data, "h": horario})
+    if atualizacoes:
+        db.session.execute(
+            text("UPDATE checkins SET sessao_id = :s WHERE data = :d AND horario = :h")
+            .bindparams(bindparam("d", type_=db.Date)),
+            atualizacoes
+        )
+
+    # Índices antigos sobre horario precisam sair antes da coluna (exigência do SQLite)
+    for nome in ('idx_checkin_data_horario', 'uq_checkin_aluno_data_horario'):
+        db.session.execute(text(f"DROP INDEX IF EXISTS {nome}"))
+    db.session.execute(text("ALTER TABLE checkins DROP COLUMN horario"))
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(text("ALTER TABLE checkins ALTER COLUMN sessao_id SET NOT NULL"))
+
+    # Os contadores por horário viraram vagas_sessao (recriados sob demanda)
+    db.session.execute(text("DROP TABLE IF EXISTS vagas_horario"))
+    db.session.commit()
+
+def aplicar_migracoes():
+    """Aplica ajustes idempotentes que o db.create_all() não cobre"""
+    clube_id = _migrar_clubes()
+    semear_sessoes(clube_id)
+    _migrar_horarios(clube_id)
+
+    # Corte de cancelamento por sessão (antes fixo em 15:00 para todas)
+    if 'corte_cancelamento' not in _colunas('sessoes'):
+        db.session.execute(text("ALTER TABLE sessoes ADD COLUMN corte_cancelamento TIME"))
+        db.session.commit()
+
+    # Contato para notificações, adicionado depois do cadastro original
+    if 'email' not in _colunas('alunos'):
+        db.session.execute(text("ALTER TABLE alunos ADD COLUMN email VARCHAR(200)"))
+        db.session.commit()
+
+    if 'uq_checkin_aluno_data_sessao' not in _indices('checkins'):
+        # Remover reservas duplicadas antes de criar o índice único
+        db.session.execute(text(
+            "DELETE FROM checkins WHERE id NOT IN ("
+            "SELECT MIN(id) FROM checkins GROUP BY aluno_id, data, sessao_id)"
+        ))
+        db.session.commit()
+
+    # Índices novos em tabelas existentes (o create_all só cria tabelas ausentes)
+    for modelo in (Checkin, Aluno, Sessao, Admin):
+        for indice in modelo.__table__.indexes:
+            db.session.execute(CreateIndex(indice, if_not_exists=True))
+    db.session.commit()
+
+    # Rollups do histórico criados depois dos check-ins: preencher uma vez a partir deles
+    if (db.session.execute(select(ResumoDiario.id).limit(1)).first() is None
+            and db.session.execute(select(Checkin.id).limit(1)).first() is not None):
+        reconstruir()
+
+    # Extrato de créditos criado depois dos saldos: abre com o saldo atual de cada aluno
+    if db.session.execute(select(MovimentoCredito.id).limit(1)).first() is None:
+        abrir_saldos(descricao="saldo inicial do extrato")
+        db.session.commit()
+
+    # Hashes de senha não cabem no antigo VARCHAR(50) (o SQLite não impõe tamanho)
+    if db.engine.dialect.name == 'postgresql' and (_tamanho_coluna('alunos', 'senha') or 255) < 255:
+        db.session.execute(text("ALTER TABLE alunos ALTER COLUMN senha TYPE VARCHAR(255)"))
+        db.session.commit()
@@ -3,20 +3,51 @@ from datetime import datetime
 
 db = SQLAlchemy()
 
+def inserir_do_dialeto(modelo):
+    """Retorna o INSERT do dialeto em uso (com suporte a ON CONFLICT)"""
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(modelo)
+
+def inserir_ignorando_conflito(modelo):
+    """Retorna um INSERT ... ON CONFLICT DO NOTHING no dialeto do banco em uso"""
+    return inserir_do_dialeto(modelo).on_conflict_do_nothing()
+
+class Clube(db.Model):
+    """Local atendido pelo deploy; alunos, sessões, check-ins e configuração são separados por clube_id"""
+    __tablename__ = 'clubes'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    slug = db.Column(db.String(50), unique=True, nullable=False)  # caminho /c/<slug>/ (ver clubes.py)
+    nome = db.Column(db.String(100), nullable=False)
+    dominio = db.Column(db.String(200), unique=True)  # host próprio (opcional)
+    criado_em = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<Clube {self.slug}>'
+
 class Aluno(db.Model):
     """Modelo para representar um aluno"""
     __tablename__ = 'alunos'
     
     id = db.Column(db.Integer, primary_key=True)
-    nome = db.Column(db.String(100), unique=True, nullable=False)
-    senha = db.Column(db.String(50), nullable=False)
+    clube_id = db.Column(db.Integer, db.ForeignKey('clubes.id'), nullable=False)
+    nome = db.Column(db.String(100), nullable=False)  # único dentro do clube
+    senha = db.Column(db.String(255), nullable=False)  # hash scrypt (ver senhas.py)
     pagamento = db.Column(db.String(200), nullable=False)
-    creditos = db.Column(db.Integer, default=0, nullable=False)
+    creditos = db.Column(db.Integer, default=0, nullable=False)  # saldo em vigor; histórico em movimentos_credito
+    email = db.Column(db.String(200))  # destino das notificações (opcional)
     criado_em = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relacionamento com check-ins
     checkins = db.relationship('Checkin', backref='aluno', lazy=True, cascade='all, delete-orphan')
     
+    __table_args__ = (
+        db.Index('uq_aluno_clube_nome', 'clube_id', 'nome', unique=True),
+    )
+    
     def __repr__(self):
         return f'<Aluno {self.nome}>'
     
@@ -24,31 +55,72 @@ class Aluno(db.Model):
         """Converte o objeto para dicionário"""
         return {
             'id': self.id,
+            'clube_id': self.clube_id,
             'nome': self.nome,
             'senha': self.senha,
             'pagamento': self.pagamento,
             'creditos': self.creditos,
+            'email': self.email,
             'criado_em': self.criado_em.isoformat() if self.criado_em else None
         }
 
+# Busca por prefixo de nome no painel admin (LIKE 'abc%' sem diferenciar maiúsculas), dentro do clube
+idx_aluno_nome_prefixo = db.Index(
+    'idx_aluno_clube_nome_prefixo',
+    Aluno.clube_id,
+    db.func.lower(Aluno.nome).label('nome_minusculo'),
+    postgresql_ops={'nome_minusculo': 'varchar_pattern_ops'}
+)
+
+class Sessao(db.Model):
+    """Sessão da grade semanal: dia da semana, horário, capacidade e mesas"""
+    __tablename__ = 'sessoes'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    clube_id = db.Column(db.Integer, db.ForeignKey('clubes.id'), nullable=False)
+    dia_semana = db.Column(db.Integer, nullable=False)  # 0 = segunda ... 6 = domingo (date.weekday())
+    inicio = db.Column(db.Time, nullable=False)
+    fim = db.Column(db.Time, nullable=False)
+    capacidade = db.Column(db.Integer, default=12, nullable=False)
+    mesas = db.Column(db.Integer, default=6, nullable=False)
+    ativa = db.Column(db.Boolean, default=True, nullable=False)
+    corte_cancelamento = db.Column(db.Time)  # limite de cancelamento no dia (None = CORTE_CANCELAMENTO)
+    
+    __table_args__ = (
+        db.Index('uq_sessao_clube_dia_horario', 'clube_id', 'dia_semana', 'inicio', 'fim', unique=True),
+    )
+    
+    @property
+    def rotulo(self):
+        """Horário no formato exibido (ex.: 18:00-20:00)"""
+        return f"{self.inicio:%H:%M}-{self.fim:%H:%M}"
+    
+    def __repr__(self):
+        return f'<Sessao {self.dia_semana} {self.rotulo}>'
+
 class Checkin(db.Model):
     """Modelo para representar um check-in"""
     __tablename__ = 'checkins'
     
     id = db.Column(db.Integer, primary_key=True)
+    clube_id = db.Column(db.Integer, db.ForeignKey('clubes.id'), nullable=False)  # o mesmo da sessão
     aluno_id = db.Column(db.Integer, db.ForeignKey('alunos.id'), nullable=False)
     data = db.Column(db.Date, nullable=False)
-    horario = db.Column(db.String(20), nullable=False)  # "18:00-20:00" ou "20:00-22:00"
+    sessao_id = db.Column(db.Integer, db.ForeignKey('sessoes.id'), nullable=False)
     criado_em = db.Column(db.DateTime, default=datetime.utcnow)
     
+    sessao = db.relationship('Sessao', lazy=True)
+    
     # Índices para melhor performance
     __table_args__ = (
-        db.Index('idx_checkin_data_horario', 'data', 'horario'),
+        db.Index('idx_checkin_clube_data', 'clube_id', 'data', 'sessao_id'),
+        db.Index('idx_checkin_data_sessao', 'data', 'sessao_id'),
         db.Index('idx_checkin_aluno_data', 'aluno_id', 'data'),
+        db.Index('uq_checkin_aluno_data_sessao', 'aluno_id', 'data', 'sessao_id', unique=True),
     )
     
     def __repr__(self):
-        return f'<Checkin {self.aluno.nome} - {self.data} {self.horario}>'
+        return f'<Checkin {self.aluno.nome} - {self.data} {self.sessao.rotulo}>'
     
     def to_dict(self):
         """Converte o objeto para dicionário"""
@@ -57,18 +129,175 @@ class Checkin(db.Model):
             'aluno_id': self.aluno_id,
             'aluno_nome': self.aluno.nome,
             'data': self.data.isoformat() if self.data else None,
-            'horario': self.horario,
+            'sessao_id': self.sessao_id,
+            'horario': self.sessao.rotulo,
             'criado_em': self.criado_em.isoformat() if self.criado_em else None
         }
 
+class CheckinArquivo(db.Model):
+    """Check-in antigo movido de checkins por retencao.py; no Postgres, uma partição por mês"""
+    __tablename__ = 'checkins_arquivo'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)  # o mesmo id de checkins
+    data = db.Column(db.Date, primary_key=True)  # chave de partição: precisa estar na chave primária
+    clube_id = db.Column(db.Integer, db.ForeignKey('clubes.id'), nullable=False)
+    aluno_id = db.Column(db.Integer, db.ForeignKey('alunos.id', ondelete='CASCADE'), nullable=False)
+    sessao_id = db.Column(db.Integer, db.ForeignKey('sessoes.id'), nullable=False)
+    criado_em = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('idx_arquivo_clube_data', 'clube_id', 'data'),
+        db.Index('uq_arquivo_aluno_data_sessao', 'aluno_id', 'data', 'sessao_id', unique=True),
+        {'postgresql_partition_by': 'RANGE (data)'},
+    )
+
+    def __repr__(self):
+        return f'<CheckinArquivo {self.aluno_id} - {self.data} {self.sessao_id}>'
+
+class VagaSessao(db.Model):
+    """Contador de vagas ocupadas por dia e sessão (linha de capacidade)"""
+    __tablename__ = 'vagas_sessao'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    data = db.Column(db.Date, nullable=False)
+    sessao_id = db.Column(db.Integer, db.ForeignKey('sessoes.id'), nullable=False)
+    ocupadas = db.Column(db.Integer, default=0, nullable=False)
+    
+    __table_args__ = (
+        db.UniqueConstraint('data', 'sessao_id', name='uq_vaga_data_sessao'),
+    )
+    
+    def __repr__(self):
+        return f'<VagaSessao {self.data} {self.sessao_id}: {self.ocupadas}>'
+
+class Espera(db.Model):
+    """Lugar na lista de espera de uma sessão lotada (ordem de chegada pelo id)"""
+    __tablename__ = 'lista_espera'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    aluno_id = db.Column(db.Integer, db.ForeignKey('alunos.id'), nullable=False)
+    data = db.Column(db.Date, nullable=False)
+    sessao_id = db.Column(db.Integer, db.ForeignKey('sessoes.id'), nullable=False)
+    criado_em = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('idx_espera_data_sessao', 'data', 'sessao_id', 'id'),
+        db.Index('uq_espera_aluno_data_sessao', 'aluno_id', 'data', 'sessao_id', unique=True),
+    )
+    
+    def __repr__(self):
+        return f'<Espera {self.aluno_id} - {self.data} {self.sessao_id}>'
+
+class MovimentoCredito(db.Model):
+    """Lançamento imutável no extrato de créditos; o saldo em vigor fica em Aluno.creditos"""
+    __tablename__ = 'movimentos_credito'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    aluno_id = db.Column(db.Integer, db.ForeignKey('alunos.id', ondelete='CASCADE'), nullable=False)
+    tipo = db.Column(db.String(20), nullable=False)    # compra, debito, reembolso, ajuste, saldo (ver extrato.py)
+    quantidade = db.Column(db.Integer, nullable=False)  # com sinal: débitos são negativos
+    data = db.Column(db.Date)                            # reserva que gerou o débito/reembolso
+    sessao_id = db.Column(db.Integer, db.ForeignKey('sessoes.id'))
+    descricao = db.Column(db.String(200))
+    criado_em = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    __table_args__ = (
+        db.Index('idx_movimento_aluno', 'aluno_id', 'id'),
+        db.Index('idx_movimento_criado_em', 'criado_em'),
+    )
+    
+    def __repr__(self):
+        return f'<MovimentoCredito {self.aluno_id} {self.tipo} {self.quantidade:+d}>'
+
+class Notificacao(db.Model):
+    """Caixa de saída: mensagem gravada na mesma transação da reserva e enviada por notificacoes.py"""
+    __tablename__ = 'notificacoes'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    aluno_id = db.Column(db.Integer, db.ForeignKey('alunos.id', ondelete='CASCADE'), nullable=False)
+    tipo = db.Column(db.String(20), nullable=False)  # confirmacao, promocao, cancelamento, lembrete
+    data = db.Column(db.Date, nullable=False)
+    sessao_id = db.Column(db.Integer, db.ForeignKey('sessoes.id'), nullable=False)
+    chave = db.Column(db.String(100), unique=True)   # evita repetir lembretes (NULL nos demais tipos)
+    estado = db.Column(db.String(20), default='pendente', nullable=False)  # pendente, enviada, falhou, descartada
+    tentativas = db.Column(db.Integer, default=0, nullable=False)
+    proxima_em = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)  # próxima tentativa (UTC)
+    enviada_em = db.Column(db.DateTime)
+    erro = db.Column(db.String(300))
+    criado_em = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    __table_args__ = (
+        db.Index('idx_notificacao_pendente', 'estado', 'proxima_em'),
+    )
+    
+    def __repr__(self):
+        return f'<Notificacao {self.tipo} {self.aluno_id} {self.estado}>'
+
+class ChaveIdempotencia(db.Model):
+    """Resposta dada a uma ação da API pela chave gerada no cliente; apagada depois de IDEMPOTENCIA_HORAS"""
+    __tablename__ = 'chaves_idempotencia'
+
+    aluno_id = db.Column(db.Integer, db.ForeignKey('alunos.id', ondelete='CASCADE'), primary_key=True)
+    chave = db.Column(db.String(64), primary_key=True)
+    pedido = db.Column(db.String(60), nullable=False)  # ex.: checkin:12:2025-06-02 (a chave não vale para outro pedido)
+    status = db.Column(db.Integer)                     # None enquanto a primeira requisição está em andamento
+    resposta = db.Column(db.Text)                      # corpo JSON devolvido
+    criado_em = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        db.Index('idx_idempotencia_criado_em', 'criado_em'),
+    )
+
+    def __repr__(self):
+        return f'<ChaveIdempotencia {self.aluno_id} {self.chave}>'
+
+class ResumoDiario(db.Model):
+    """Rollup materializado por dia e sessão, atualizado na transação de cada reserva/cancelamento"""
+    __tablename__ = 'resumo_diario'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    data = db.Column(db.Date, nullable=False)
+    sessao_id = db.Column(db.Integer, db.ForeignKey('sessoes.id'), nullable=False)
+    checkins = db.Column(db.Integer, default=0, nullable=False)       # reservas em vigor (= alunos distintos)
+    reservas = db.Column(db.Integer, default=0, nullable=False)       # reservas feitas, incluindo promoções da fila
+    cancelamentos = db.Column(db.Integer, default=0, nullable=False)
+    
+    __table_args__ = (
+        db.UniqueConstraint('data', 'sessao_id', name='uq_resumo_data_sessao'),
+    )
+    
+    def __repr__(self):
+        return f'<ResumoDiario {self.data} {self.sessao_id}: {self.checkins}>'
+
+class FrequenciaMensal(db.Model):
+    """Check-ins por aluno e mês: frequência e alunos distintos sem varrer checkins"""
+    __tablename__ = 'frequencia_mensal'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    mes = db.Column(db.Date, nullable=False)  # primeiro dia do mês
+    aluno_id = db.Column(db.Integer, db.ForeignKey('alunos.id', ondelete='CASCADE'), nullable=False)
+    checkins = db.Column(db.Integer, default=0, nullable=False)
+    
+    __table_args__ = (
+        db.UniqueConstraint('mes', 'aluno_id', name='uq_frequencia_mes_aluno'),
+    )
+    
+    def __repr__(self):
+        return f'<FrequenciaMensal {self.mes:%Y-%m} {self.aluno_id}: {self.checkins}>'
+
 class Admin(db.Model):
     """Modelo para configurações administrativas"""
     __tablename__ = 'admin_config'
     
     id = db.Column(db.Integer, primary_key=True)
-    chave = db.Column(db.String(50), unique=True, nullable=False)
+    clube_id = db.Column(db.Integer, db.ForeignKey('clubes.id'), nullable=False)
+    chave = db.Column(db.String(50), nullable=False)
     valor = db.Column(db.String(200), nullable=False)
     atualizado_em = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    __table_args__ = (
+        db.Index('uq_admin_clube_chave', 'clube_id', 'chave', unique=True),
+    )
+    
     def __repr__(self):
         return f'<AdminConfig {self.chave}: {self.valor}>'
\ No newline at end of file
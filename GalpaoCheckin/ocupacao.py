@@ -0,0 +1,126 @@
+"""Cache de ocupação dos horários por dia, atualizado na escrita"""
+import os
+import threading
+import time
+from datetime import timedelta
+from sqlalchemy import select
+from models import db, Checkin, Espera, Sessao
+from clubes import PorClube
+from reservas import RESERVADO, CANCELADO, NA_ESPERA, SAIU_DA_ESPERA
+
+class CacheOcupacao:
+    """Guarda, por (data, sessão) de um clube, os ids de alunos com reserva e a fila de espera.
+
+    Um dia (ou um intervalo de dias, para o calendário) é carregado com uma
+    consulta de reservas e uma da fila, ambas pelo índice (data, sessao_id);
+    reservas, cancelamentos e entradas/saídas da fila confirmadas atualizam
+    o cache em seguida (write-through).
+    O TTL limita quanto tempo outro processo leva para enxergar escritas
+    feitas fora dele, e dias passados são descartados automaticamente.
+    """
+
+    def __init__(self, clube_id, ttl=None):
+        self.clube_id = clube_id
+        self.ttl = ttl if ttl is not None else int(os.environ.get("OCUPACAO_TTL", "10"))
+        self._trava = threading.Lock()
+        self._dias = {}         # data -> {sessao_id: set(aluno_id)}
+        self._filas = {}        # data -> {sessao_id: [aluno_id]} em ordem de chegada
+        self._carregado_em = {} # data -> instante da carga
+
+    def _descartar_passado(self, hoje):
+        """Remove do cache dias anteriores a hoje"""
+        for data in [d for d in self._dias if d < hoje]:
+            del self._dias[data]
+            del self._filas[data]
+            del self._carregado_em[data]
+
+    def _carregar(self, inicio, fim):
+        """Lê reservas e filas de espera de inicio a fim (uma consulta para cada)"""
+        datas = [inicio + timedelta(days=i) for i in range((fim - inicio).days + 1)]
+        dias = {data: {} for data in datas}
+        filas = {data: {} for data in datas}
+        for data, sessao_id, aluno_id in db.session.execute(
+            select(Checkin.data, Checkin.sessao_id, Checkin.aluno_id)
+            .where(Checkin.clube_id == self.clube_id, Checkin.data >= inicio, Checkin.data <= fim)
+        ):
+            dias[data].setdefault(sessao_id, set()).add(aluno_id)
+        for data, sessao_id, aluno_id in db.session.execute(
+            select(Espera.data, Espera.sessao_id, Espera.aluno_id)
+            .where(
+                Espera.data >= inicio, Espera.data <= fim,
+                Espera.sessao_id.in_(select(Sessao.id).where(Sessao.clube_id == self.clube_id))
+            )
+            .order_by(Espera.id)
+        ):
+            filas[data].setdefault(sessao_id, []).append(aluno_id)
+        agora = time.monotonic()
+        for data in datas:
+            self._dias[data] = dias[data]
+            self._filas[data] = filas[data]
+            self._carregado_em[data] = agora
+
+    def _expirado(self, data, agora):
+        carregado_em = self._carregado_em.get(data)
+        return carregado_em is None or agora - carregado_em >= self.ttl
+
+    def do_dia(self, data, hoje=None):
+        """Retorna {sessao_id: frozenset(aluno_id)} para a data, carregando se preciso"""
+        with self._trava:
+            self._garantir(data, data, hoje)
+            return {s: frozenset(ids) for s, ids in self._dias[data].items()}
+
+    def do_periodo(self, inicio, fim, hoje=None):
+        """Matriz {data: {sessao_id: frozenset(aluno_id)}} de inicio a fim (inclusive).
+
+        Dias ausentes ou expirados são relidos juntos numa única consulta por intervalo.
+        """
+        with self._trava:
+            datas = self._garantir(inicio, fim, hoje)
+            return {d: {s: frozenset(ids) for s, ids in self._dias[d].items()} for d in datas}
+
+    def filas(self, inicio, fim, hoje=None):
+        """Filas de espera {data: {sessao_id: (aluno_id, ...)}} de inicio a fim, em ordem de chegada"""
+        with self._trava:
+            datas = self._garantir(inicio, fim, hoje)
+            return {d: {s: tuple(ids) for s, ids in self._filas[d].items()} for d in datas}
+
+    def _garantir(self, inicio, fim, hoje):
+        """Carrega juntos os dias ausentes ou expirados do intervalo; retorna as datas"""
+        self._descartar_passado(hoje or inicio)
+        agora = time.monotonic()
+        datas = [inicio + timedelta(days=i) for i in range((fim - inicio).days + 1)]
+        faltando = [d for d in datas if self._expirado(d, agora)]
+        if faltando:
+            self._carregar(faltando[0], faltando[-1])
+        return datas
+
+    def registrar(self, evento, aluno_id, data, sessao_id):
+        """Aplica uma reserva, cancelamento ou mudança na fila confirmada (write-through)"""
+        with self._trava:
+            sessoes = self._dias.get(data)
+            if sessoes is None:
+                return
+            if evento == RESERVADO:
+                sessoes.setdefault(sessao_id, set()).add(aluno_id)
+            elif evento == CANCELADO:
+                sessoes.setdefault(sessao_id, set()).discard(aluno_id)
+            elif evento == NA_ESPERA:
+                self._filas[data].setdefault(sessao_id, []).append(aluno_id)
+            elif evento == SAIU_DA_ESPERA:
+                fila = self._filas[data].get(sessao_id, [])
+                if aluno_id in fila:
+                    fila.remove(aluno_id)
+
+    def invalidar(self, data=None):
+        """Descarta um dia (ou tudo); a próxima leitura recarrega do banco"""
+        with self._trava:
+            if data is None:
+                self._dias.clear()
+                self._filas.clear()
+                self._carregado_em.clear()
+            else:
+                self._dias.pop(data, None)
+                self._filas.pop(data, None)
+                self._carregado_em.pop(data, None)
+
+cache_ocupacao = PorClube(CacheOcupacao)
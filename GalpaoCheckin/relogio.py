@@ -0,0 +1,102 @@
+"""Relógio do clube: data local, corte de cancelamento e janelas das sessões no fuso do galpão"""
+import os
+from datetime import datetime, time, timedelta
+from zoneinfo import ZoneInfo
+from flask import current_app, g, has_app_context, has_request_context
+
+# O servidor pode estar em UTC: "hoje" e os cortes são sempre do fuso do clube
+FUSO = ZoneInfo(os.environ.get("FUSO_HORARIO", "America/Sao_Paulo"))
+
+# Corte de cancelamento das sessões sem corte próprio (Sessao.corte_cancelamento)
+CORTE_PADRAO = time.fromisoformat(os.environ.get("CORTE_CANCELAMENTO", "15:00"))
+
+class Relogio:
+    """Hora atual no fuso do clube mais a política de corte"""
+
+    def __init__(self, fuso=FUSO, corte_padrao=CORTE_PADRAO):
+        self.fuso = fuso
+        self.corte_padrao = corte_padrao
+
+    def agora(self):
+        """Instante atual com fuso"""
+        return datetime.now(self.fuso)
+
+    def momento(self):
+        """Instantâneo para uma requisição inteira"""
+        return Momento(self.agora(), self)
+
+class RelogioFixo(Relogio):
+    """Relógio parado num instante (testes e benchmarks determinísticos)"""
+
+    def __init__(self, instante, **opcoes):
+        super().__init__(**opcoes)
+        self.instante = instante if instante.tzinfo else instante.replace(tzinfo=self.fuso)
+
+    def agora(self):
+        return self.instante
+
+    def avancar(self, **delta):
+        """Move o relógio (ex.: avancar(hours=2))"""
+        self.instante += timedelta(**delta)
+
+class Momento:
+    """Data local e regras de horário calculadas sobre um único instante.
+
+    Uma requisição usa o mesmo Momento do começo ao fim, então a data do
+    check-in, o corte de cancelamento e as janelas das sessões nunca
+    divergem por a requisição atravessar uma virada de minuto ou de dia.
+    """
+
+    __slots__ = ("agora", "hoje", "fuso", "corte_padrao")
+
+    def __init__(self, agora, relogio):
+        self.agora = agora.astimezone(relogio.fuso)
+        self.hoje = self.agora.date()
+        self.fuso = relogio.fuso
+        self.corte_padrao = relogio.corte_padrao
+
+    def em(self, data, hora):
+        """Data e hora locais do clube como instante com fuso"""
+        return datetime.combine(data, hora, tzinfo=self.fuso)
+
+    def inicio(self, sessao, data):
+        """Início da sessão na data"""
+        return self.em(data, sessao.inicio)
+
+    def corte(self, sessao):
+        """Horário limite de cancelamento da sessão (próprio ou o padrão), nunca depois do início"""
+        return min(getattr(sessao, "corte", None) or self.corte_padrao, sessao.inicio)
+
+    def pode_cancelar(self, sessao, data):
+        """Cancelamento permitido até o corte do dia da sessão (dias futuros sempre)"""
+        return self.agora <= self.em(data, self.corte(sessao))
+
+    def reserva_aberta(self, sessao, data):
+        """Reservas e lista de espera aceitas até o início da sessão"""
+        return self.agora < self.inicio(sessao, data)
+
+def instalar(app):
+    """Usa o relógio de app.config["RELOGIO"] (ou o real) nas requisições do app"""
+    relogio_app = app.extensions["relogio"] = app.config.get("RELOGIO") or Relogio()
+    app.jinja_env.globals["corte_padrao"] = f"{relogio_app.corte_padrao:%H:%M}"
+
+def fixar(app, instante):
+    """Troca o relógio do app por um RelogioFixo no instante dado; retorna o relógio"""
+    app.extensions["relogio"] = RelogioFixo(instante)
+    return app.extensions["relogio"]
+
+_padrao = Relogio()
+
+def relogio():
+    """Relógio do app atual (o real fora de um app)"""
+    if has_app_context():
+        return current_app.extensions.get("relogio", _padrao)
+    return _padrao
+
+def momento():
+    """Momento da requisição atual, calculado uma vez; fora de requisição, um novo a cada chamada"""
+    if not has_request_context():
+        return relogio().momento()
+    if "momento" not in g:
+        g.momento = relogio().momento()
+    return g.momento
@@ -0,0 +1,344 @@
+"""Motor de reservas: check-in e cancelamento como operações atômicas no banco"""
+from sqlalchemy import select, update, delete, func
+from sqlalchemy.exc import IntegrityError
+from models import db, Aluno, Checkin, Sessao, VagaSessao, Espera, inserir_ignorando_conflito
+from analitico import contabilizar
+from extrato import lancar, DEBITO, REEMBOLSO
+from notificacoes import enfileirar, CONFIRMACAO, PROMOCAO, CANCELAMENTO
+
+# Resultados possíveis das operações
+RESERVADO = "reservado"
+SEM_CREDITOS = "sem_creditos"
+JA_RESERVADO = "ja_reservado"
+LOTADO = "lotado"
+CANCELADO = "cancelado"
+SEM_RESERVA = "sem_reserva"
+NA_ESPERA = "na_espera"
+JA_NA_ESPERA = "ja_na_espera"
+SAIU_DA_ESPERA = "saiu_da_espera"
+HA_VAGA = "ha_vaga"
+
+# Funções chamadas após cada reserva/cancelamento confirmado no banco
+_ouvintes = []
+
+def registrar_ouvinte(funcao):
+    """Registra funcao(evento, aluno_id, data, sessao_id) para rodar após o commit"""
+    _ouvintes.append(funcao)
+    return funcao
+
+def _notificar(evento, aluno_id, data, sessao_id):
+    for funcao in _ouvintes:
+        funcao(evento, aluno_id, data, sessao_id)
+
+def _clube_da_sessao(sessao_id):
+    """Clube do check-in: sempre o da sessão (subconsulta dentro do próprio INSERT)"""
+    return select(Sessao.clube_id).where(Sessao.id == sessao_id).scalar_subquery()
+
+def garantir_vaga(data, sessao_id):
+    """Cria a linha de capacidade da sessão, contando check-ins já existentes"""
+    ocupadas = select(func.count(Checkin.id)).where(
+        Checkin.data == data,
+        Checkin.sessao_id == sessao_id
+    ).scalar_subquery()
+
+    db.session.execute(
+        inserir_ignorando_conflito(VagaSessao).values(
+            data=data,
+            sessao_id=sessao_id,
+            ocupadas=ocupadas
+        )
+    )
+
+def recalcular_vagas(datas, tamanho_lote=500):
+    """Recalcula os contadores de vagas das datas a partir dos check-ins gravados"""
+    ocupadas = select(func.count(Checkin.id)).where(
+        Checkin.data == VagaSessao.data,
+        Checkin.sessao_id == VagaSessao.sessao_id
+    ).scalar_subquery()
+
+    datas = sorted(datas)
+    for i in range(0, len(datas), tamanho_lote):
+        db.session.execute(
+            update(VagaSessao)
+            .where(VagaSessao.data.in_(datas[i:i + tamanho_lote]))
+            .values(ocupadas=ocupadas)
+            .execution_options(synchronize_session=False)
+        )
+
+def reservar(aluno_id, data, sessao_id, limite):
+    """Debita o crédito, grava o check-in e ocupa a vaga numa única transação.
+
+    Cada etapa é um UPDATE/INSERT condicional: o banco bloqueia as linhas
+    envolvidas, então reservas simultâneas nunca ultrapassam o limite nem
+    perdem débitos de crédito.
+    """
+    try:
+        garantir_vaga(data, sessao_id)
+
+        # Debitar crédito somente se houver saldo
+        debito = db.session.execute(
+            update(Aluno)
+            .where(Aluno.id == aluno_id, Aluno.creditos > 0)
+            .values(creditos=Aluno.creditos - 1)
+        )
+        if debito.rowcount != 1:
+            db.session.rollback()
+            return SEM_CREDITOS
+
+        # O índice único (aluno_id, data, sessao_id) barra reservas duplicadas
+        db.session.add(Checkin(clube_id=_clube_da_sessao(sessao_id), aluno_id=aluno_id, data=data, sessao_id=sessao_id))
+        try:
+            db.session.flush()
+        except IntegrityError:
+            db.session.rollback()
+            return JA_RESERVADO
+
+        # Ocupar a vaga somente se ainda houver lugar
+        vaga = db.session.execute(
+            update(VagaSessao)
+            .where(
+                VagaSessao.data == data,
+                VagaSessao.sessao_id == sessao_id,
+                VagaSessao.ocupadas < limite
+            )
+            .values(ocupadas=VagaSessao.ocupadas + 1)
+        )
+        if vaga.rowcount != 1:
+            db.session.rollback()
+            return LOTADO
+        lancar(aluno_id, DEBITO, -1, data, sessao_id)
+        contabilizar(aluno_id, data, sessao_id, 1)
+        enfileirar(aluno_id, CONFIRMACAO, data, sessao_id)
+
+        # Quem reserva direto deixa a fila de espera da mesma sessão
+        saiu = db.session.execute(
+            delete(Espera).where(
+                Espera.aluno_id == aluno_id,
+                Espera.data == data,
+                Espera.sessao_id == sessao_id
+            )
+        ).rowcount
+
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    if saiu:
+        _notificar(SAIU_DA_ESPERA, aluno_id, data, sessao_id)
+    _notificar(RESERVADO, aluno_id, data, sessao_id)
+    return RESERVADO
+
+def _promover(data, sessao_id, limite):
+    """Passa a vaga recém-liberada ao primeiro da fila com crédito (na transação atual).
+
+    Retorna (aluno promovido ou None, ids que saíram da fila). Alunos cuja
+    linha está bloqueada por outra transação (ex.: reservando agora) são
+    pulados nesta rodada em vez de esperados, o que evita deadlock com
+    reservar(), que bloqueia aluno -> vaga na ordem inversa.
+    """
+    sairam = []
+    fila = db.session.execute(
+        select(Espera.id, Espera.aluno_id)
+        .where(Espera.data == data, Espera.sessao_id == sessao_id)
+        .order_by(Espera.id)
+        .with_for_update(skip_locked=True)
+    ).all()
+    for espera_id, aluno_id in fila:
+        creditos = db.session.execute(
+            select(Aluno.creditos).where(Aluno.id == aluno_id).with_for_update(skip_locked=True)
+        ).scalar()
+        if creditos is None:
+            continue
+
+        if creditos <= 0:
+            db.session.execute(delete(Espera).where(Espera.id == espera_id))
+            sairam.append(aluno_id)
+            continue
+
+        # Com a linha do aluno bloqueada, nenhuma reserva dele pode estar em andamento
+        ja_reservado = db.session.execute(
+            select(Checkin.id).where(
+                Checkin.aluno_id == aluno_id,
+                Checkin.data == data,
+                Checkin.sessao_id == sessao_id
+            )
+        ).first()
+        if ja_reservado:
+            db.session.execute(delete(Espera).where(Espera.id == espera_id))
+            sairam.append(aluno_id)
+            continue
+
+        # A vaga primeiro: sem ela (ex.: capacidade reduzida) o aluno continua na fila
+        vaga = db.session.execute(
+            update(VagaSessao)
+            .where(
+                VagaSessao.data == data,
+                VagaSessao.sessao_id == sessao_id,
+                VagaSessao.ocupadas < limite
+            )
+            .values(ocupadas=VagaSessao.ocupadas + 1)
+        )
+        if vaga.rowcount != 1:
+            break
+        db.session.execute(delete(Espera).where(Espera.id == espera_id))
+        sairam.append(aluno_id)
+        db.session.execute(
+            update(Aluno).where(Aluno.id == aluno_id).values(creditos=Aluno.creditos - 1)
+        )
+        db.session.add(Checkin(clube_id=_clube_da_sessao(sessao_id), aluno_id=aluno_id, data=data, sessao_id=sessao_id))
+        db.session.flush()
+        lancar(aluno_id, DEBITO, -1, data, sessao_id, descricao="lista de espera")
+        contabilizar(aluno_id, data, sessao_id, 1)
+        enfileirar(aluno_id, PROMOCAO, data, sessao_id)
+        return aluno_id, sairam
+    return None, sairam
+
+def cancelar_reserva(aluno_id, data, sessao_id, limite):
+    """Remove o check-in, reembolsa o crédito e repassa a vaga ao primeiro da fila de espera.
+
+    Tudo acontece numa única transação: a vaga liberada nunca fica visível
+    como livre enquanto houver alguém esperando com crédito.
+    """
+    try:
+        # Mesma ordem de bloqueio de reservar(): aluno, check-in, vaga e, por último,
+        # extrato e resumos (a ordem inversa travaria com uma reserva simultânea no Postgres)
+        db.session.execute(
+            update(Aluno)
+            .where(Aluno.id == aluno_id)
+            .values(creditos=Aluno.creditos + 1)
+        )
+
+        removido = db.session.execute(
+            delete(Checkin).where(
+                Checkin.aluno_id == aluno_id,
+                Checkin.data == data,
+                Checkin.sessao_id == sessao_id
+            )
+        )
+        if removido.rowcount != 1:
+            db.session.rollback()
+            return SEM_RESERVA
+
+        db.session.execute(
+            update(VagaSessao)
+            .where(
+                VagaSessao.data == data,
+                VagaSessao.sessao_id == sessao_id,
+                VagaSessao.ocupadas > 0
+            )
+            .values(ocupadas=VagaSessao.ocupadas - 1)
+        )
+        lancar(aluno_id, REEMBOLSO, 1, data, sessao_id)
+        contabilizar(aluno_id, data, sessao_id, -1)
+        enfileirar(aluno_id, CANCELAMENTO, data, sessao_id)
+
+        promovido, sairam = _promover(data, sessao_id, limite)
+
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    _notificar(CANCELADO, aluno_id, data, sessao_id)
+    for aluno_fila in sairam:
+        _notificar(SAIU_DA_ESPERA, aluno_fila, data, sessao_id)
+    if promovido is not None:
+        _notificar(RESERVADO, promovido, data, sessao_id)
+    return CANCELADO
+
+def preencher_vagas(sessao_id, limite, desde):
+    """Passa à fila de espera as vagas abertas por um aumento de capacidade, de `desde` em diante.
+
+    Cada dia com fila é uma transação: promove, em ordem, enquanto houver
+    vaga e alguém com crédito. Retorna quantos alunos foram promovidos.
+    """
+    datas = db.session.execute(
+        select(Espera.data).where(Espera.sessao_id == sessao_id, Espera.data >= desde)
+        .distinct().order_by(Espera.data)
+    ).scalars().all()
+    total = 0
+    for data in datas:
+        promovidos, sairam = [], []
+        try:
+            garantir_vaga(data, sessao_id)
+            while True:
+                promovido, saiu = _promover(data, sessao_id, limite)
+                sairam.extend(saiu)
+                if promovido is None:
+                    break
+                promovidos.append(promovido)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        for aluno_fila in sairam:
+            _notificar(SAIU_DA_ESPERA, aluno_fila, data, sessao_id)
+        for promovido in promovidos:
+            _notificar(RESERVADO, promovido, data, sessao_id)
+        total += len(promovidos)
+    return total
+
+def entrar_na_espera(aluno_id, data, sessao_id, limite):
+    """Coloca o aluno no fim da fila de espera de uma sessão lotada"""
+    try:
+        garantir_vaga(data, sessao_id)
+        ocupadas = db.session.execute(
+            select(VagaSessao.ocupadas).where(
+                VagaSessao.data == data,
+                VagaSessao.sessao_id == sessao_id
+            )
+        ).scalar()
+        if ocupadas < limite:
+            db.session.rollback()
+            return HA_VAGA
+
+        ja_reservado = db.session.execute(
+            select(Checkin.id).where(
+                Checkin.aluno_id == aluno_id,
+                Checkin.data == data,
+                Checkin.sessao_id == sessao_id
+            )
+        ).first()
+        if ja_reservado:
+            db.session.rollback()
+            return JA_RESERVADO
+
+        # O índice único (aluno_id, data, sessao_id) impede entrar duas vezes na fila
+        entrou = db.session.execute(
+            inserir_ignorando_conflito(Espera.__table__).values(
+                aluno_id=aluno_id,
+                data=data,
+                sessao_id=sessao_id
+            )
+        ).rowcount
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    if not entrou:
+        return JA_NA_ESPERA
+    _notificar(NA_ESPERA, aluno_id, data, sessao_id)
+    return NA_ESPERA
+
+def sair_da_espera(aluno_id, data, sessao_id):
+    """Remove o aluno da fila de espera; retorna SAIU_DA_ESPERA ou SEM_RESERVA"""
+    try:
+        removido = db.session.execute(
+            delete(Espera).where(
+                Espera.aluno_id == aluno_id,
+                Espera.data == data,
+                Espera.sessao_id == sessao_id
+            )
+        ).rowcount
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    if not removido:
+        return SEM_RESERVA
+    _notificar(SAIU_DA_ESPERA, aluno_id, data, sessao_id)
+    return SAIU_DA_ESPERA
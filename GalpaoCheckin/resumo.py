@@ -0,0 +1,153 @@
+"""Rollup diário/semanal de check-ins para o painel administrativo"""
+import os
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+from sqlalchemy import select, func
+from models import db, Aluno, Checkin
+from clubes import PorClube
+from reservas import RESERVADO, CANCELADO
+
+DIAS_SEMANA = 7
+
+class ResumoCheckins:
+    """Mantém em memória os check-ins de hoje e as contagens dos últimos 7 dias de um clube.
+
+    A carga inicial usa duas consultas agregadas limitadas pelo índice de
+    data; depois disso reservas e cancelamentos atualizam o rollup
+    incrementalmente. O TTL faz outros processos convergirem para o banco.
+    """
+
+    def __init__(self, clube_id, ttl=None):
+        self.clube_id = clube_id
+        self.ttl = ttl if ttl is not None else int(os.environ.get("RESUMO_TTL", "60"))
+        self._trava = threading.Lock()
+        self._hoje = None
+        self._carregado_em = 0.0
+        self._por_sessao = {}    # sessao_id -> [aluno_id] de hoje, em ordem de reserva
+        self._dias = {}          # data -> Counter(aluno_id)
+        self._semana = Counter()
+        self._nomes = {}         # aluno_id -> nome
+
+    def invalidar(self):
+        """Descarta o rollup; a próxima leitura recarrega do banco"""
+        with self._trava:
+            self._hoje = None
+
+    def _somar_dias(self, inicio, fim):
+        """Soma ao rollup as contagens por dia e aluno do intervalo [inicio, fim]"""
+        linhas = db.session.execute(
+            select(Checkin.data, Checkin.aluno_id, Aluno.nome, func.count(Checkin.id))
+            .join(Aluno, Aluno.id == Checkin.aluno_id)
+            .where(Checkin.clube_id == self.clube_id, Checkin.data >= inicio, Checkin.data <= fim)
+            .group_by(Checkin.data, Checkin.aluno_id, Aluno.nome)
+        ).all()
+        for data, aluno_id, nome, quantidade in linhas:
+            self._dias.setdefault(data, Counter())[aluno_id] += quantidade
+            self._semana[aluno_id] += quantidade
+            self._nomes[aluno_id] = nome
+
+    def _carregar_hoje(self, hoje):
+        """Carrega quem reservou cada sessão de hoje"""
+        self._por_sessao = {}
+        for sessao_id, aluno_id in db.session.execute(
+            select(Checkin.sessao_id, Checkin.aluno_id)
+            .where(Checkin.clube_id == self.clube_id, Checkin.data == hoje)
+            .order_by(Checkin.id)
+        ):
+            self._por_sessao.setdefault(sessao_id, []).append(aluno_id)
+
+    def _carregar(self, hoje):
+        """Recarrega o rollup inteiro com duas consultas agregadas"""
+        self._dias = {}
+        self._semana = Counter()
+        self._nomes = {}
+        self._somar_dias(hoje - timedelta(days=DIAS_SEMANA - 1), hoje)
+        self._carregar_hoje(hoje)
+        self._hoje = hoje
+        self._carregado_em = time.monotonic()
+
+    def _avancar(self, hoje):
+        """Avança a janela para um novo dia sem reler a semana inteira"""
+        inicio = hoje - timedelta(days=DIAS_SEMANA - 1)
+        for data in [d for d in self._dias if d < inicio]:
+            self._semana.subtract(self._dias.pop(data))
+        self._somar_dias(max(inicio, self._hoje + timedelta(days=1)), hoje)
+        self._carregar_hoje(hoje)
+        self._hoje = hoje
+
+    def _nomes_faltantes(self, ids):
+        """Busca numa única consulta nomes de alunos que entraram após a carga"""
+        faltantes = [i for i in ids if i not in self._nomes]
+        if faltantes:
+            for aluno_id, nome in db.session.execute(
+                select(Aluno.id, Aluno.nome).where(Aluno.id.in_(faltantes))
+            ):
+                self._nomes[aluno_id] = nome
+
+    def obter(self, hoje, sessoes):
+        """Retorna o resumo no formato usado pelo template admin.html.
+
+        `sessoes` são as sessões do dia (InfoSessao), na ordem de exibição.
+        """
+        with self._trava:
+            expirado = time.monotonic() - self._carregado_em >= self.ttl
+            if self._hoje is None or expirado or hoje < self._hoje:
+                self._carregar(hoje)
+            elif hoje != self._hoje:
+                self._avancar(hoje)
+
+            ids = set(self._semana)
+            for lista in self._por_sessao.values():
+                ids.update(lista)
+            self._nomes_faltantes(ids)
+
+            por_sessao = [
+                {
+                    "rotulo": sessao.rotulo,
+                    "capacidade": sessao.capacidade,
+                    "alunos": [self._nomes.get(i, "?") for i in self._por_sessao.get(sessao.id, [])]
+                }
+                for sessao in sessoes
+            ]
+            por_aluno = {self._nomes.get(i, "?"): n for i, n in self._semana.items() if n > 0}
+            total_hoje = sum(len(lista) for lista in self._por_sessao.values())
+            total_semana = sum(self._semana.values())
+
+        data_inicio = hoje - timedelta(days=DIAS_SEMANA - 1)
+        return {
+            "hoje": {
+                "total": total_hoje,
+                "sessoes": por_sessao,
+                "data": hoje.strftime("%Y-%m-%d")
+            },
+            "semana": {
+                "total": total_semana,
+                "por_aluno": por_aluno,
+                "periodo": f"{data_inicio.strftime('%d/%m')} - {hoje.strftime('%d/%m')}"
+            }
+        }
+
+    def registrar(self, evento, aluno_id, data, sessao_id):
+        """Aplica uma reserva (+1) ou cancelamento (-1) ao rollup carregado"""
+        if evento not in (RESERVADO, CANCELADO):
+            return
+        with self._trava:
+            if self._hoje is None:
+                return
+            if not (self._hoje - timedelta(days=DIAS_SEMANA - 1) <= data <= self._hoje):
+                return
+
+            delta = 1 if evento == RESERVADO else -1
+            self._dias.setdefault(data, Counter())[aluno_id] += delta
+            self._semana[aluno_id] += delta
+
+            if data == self._hoje:
+                lista = self._por_sessao.setdefault(sessao_id, [])
+                if delta > 0:
+                    lista.append(aluno_id)
+                elif aluno_id in lista:
+                    lista.remove(aluno_id)
+
+resumo_checkins = PorClube(ResumoCheckins)
@@ -0,0 +1,75 @@
+"""Retenção do histórico: check-ins antigos saem da tabela quente para o arquivo mensal"""
+import os
+from datetime import timedelta
+from sqlalchemy import select, delete, func, text
+from models import db, Checkin, CheckinArquivo, VagaSessao, Espera, inserir_ignorando_conflito
+from analitico import reconstruir, inicio_do_mes, fim_do_mes
+from relogio import momento
+
+# Dias de check-ins mantidos em checkins; o app só lê de hoje em diante e a última semana
+RETENCAO_DIAS = int(os.environ.get("RETENCAO_DIAS", "180"))
+
+# Abaixo disso o resumo semanal e o calendário poderiam perder dados
+RETENCAO_MINIMA = 31
+
+COLUNAS = ["id", "clube_id", "aluno_id", "data", "sessao_id", "criado_em"]
+
+def horizonte(dias=RETENCAO_DIAS):
+    """Primeiro dia que fica na tabela quente: só meses inteiros anteriores a hoje - dias são arquivados"""
+    if dias < RETENCAO_MINIMA:
+        raise ValueError(f"a retenção mínima é de {RETENCAO_MINIMA} dias")
+    return inicio_do_mes(momento().hoje - timedelta(days=dias))
+
+def proximo_mes(corte):
+    """Mês mais antigo com check-ins na tabela quente antes do corte (None se não houver)"""
+    menor = db.session.execute(select(func.min(Checkin.data)).where(Checkin.data < corte)).scalar()
+    return inicio_do_mes(menor) if menor else None
+
+def _garantir_particao(mes):
+    """No Postgres o arquivo é particionado por mês: cria a partição do mês se ainda não existir"""
+    if db.engine.dialect.name != 'postgresql':
+        return
+    seguinte = fim_do_mes(mes) + timedelta(days=1)
+    db.session.execute(text(
+        f"CREATE TABLE IF NOT EXISTS checkins_arquivo_{mes:%Y_%m} PARTITION OF checkins_arquivo "
+        f"FOR VALUES FROM ('{mes.isoformat()}') TO ('{seguinte.isoformat()}')"
+    ))
+
+def arquivar_mes(mes):
+    """Consolida o mês nos rollups e move os check-ins dele para o arquivo; retorna quantos foram movidos.
+
+    Os rollups são recalculados antes (tabela quente mais o que já estiver
+    arquivado do mês), então o histórico em /admin/analitico não muda. A
+    cópia e a remoção acontecem numa só transação: se o processo cair no
+    meio, o mês continua inteiro na tabela quente e basta repetir. Contadores
+    de vagas e filas de espera de dias arquivados não servem mais e também
+    saem.
+    """
+    fim = fim_do_mes(mes)
+    reconstruir(mes, fim)
+    try:
+        _garantir_particao(mes)
+        db.session.execute(inserir_ignorando_conflito(CheckinArquivo.__table__).from_select(
+            COLUNAS,
+            select(*(getattr(Checkin, coluna) for coluna in COLUNAS)).where(Checkin.data.between(mes, fim))
+        ))
+        movidos = db.session.execute(
+            delete(Checkin).where(Checkin.data.between(mes, fim)).execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.execute(delete(VagaSessao).where(VagaSessao.data.between(mes, fim)))
+        db.session.execute(delete(Espera).where(Espera.data.between(mes, fim)))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return movidos
+
+def arquivar(corte, meses=None):
+    """Arquiva mês a mês, do mais antigo, tudo antes do corte (ou só `meses` meses); gera (mês, movidos)"""
+    feitos = 0
+    while meses is None or feitos < meses:
+        mes = proximo_mes(corte)
+        if mes is None:
+            return
+        yield mes, arquivar_mes(mes)
+        feitos += 1
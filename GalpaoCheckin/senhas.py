@@ -0,0 +1,92 @@
+"""Hash de senhas com scrypt e verificação em um pool de threads limitado"""
+import base64
+import hashlib
+import hmac
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+PREFIXO = "scrypt"
+
+# Custo do scrypt (memória ~ 128 * N * r bytes por hash); ajustável por ambiente
+SCRYPT_N = int(os.environ.get("SCRYPT_N", 2 ** 14))
+SCRYPT_R = int(os.environ.get("SCRYPT_R", 8))
+SCRYPT_P = int(os.environ.get("SCRYPT_P", 1))
+
+# Custo menor nas importações em lote (milhares de senhas por arquivo): o hash é
+# refeito com o custo cheio no primeiro login, por precisa_rehash()
+SCRYPT_N_LOTE = int(os.environ.get("SCRYPT_N_LOTE", 2 ** 8))
+
+# Verificações simultâneas e quantas podem esperar na fila antes de recusar
+THREADS_SENHA = int(os.environ.get("SENHA_THREADS", 2))
+FILA_SENHA = int(os.environ.get("SENHA_FILA", 32))
+
+# Threads das importações, separadas das do login
+THREADS_LOTE = int(os.environ.get("SENHA_THREADS_LOTE", 2))
+
+class SobrecargaLogin(Exception):
+    """Fila de verificação de senhas cheia; o login deve ser tentado de novo"""
+
+def _b64(dados):
+    return base64.b64encode(dados).decode("ascii")
+
+def _scrypt(senha, sal, n, r, p):
+    return hashlib.scrypt(
+        senha.encode("utf-8"), salt=sal, n=n, r=r, p=p,
+        maxmem=256 * n * r * p, dklen=32
+    )
+
+def gerar_hash(senha, n=SCRYPT_N):
+    """Hash no formato scrypt$N$r$p$sal$hash com os parâmetros atuais"""
+    sal = os.urandom(16)
+    derivada = _scrypt(senha, sal, n, SCRYPT_R, SCRYPT_P)
+    return f"{PREFIXO}${n}${SCRYPT_R}${SCRYPT_P}${_b64(sal)}${_b64(derivada)}"
+
+def _gerar_hash_lote(senha):
+    return gerar_hash(senha, SCRYPT_N_LOTE)
+
+def eh_hash(armazenada):
+    """Indica se o valor gravado já é um hash (e não a senha em texto puro)"""
+    return bool(armazenada) and armazenada.startswith(PREFIXO + "$")
+
+def verificar_senha(senha, armazenada):
+    """Confere a senha contra o hash gravado; aceita senhas legadas em texto puro"""
+    if not eh_hash(armazenada):
+        return hmac.compare_digest(senha.encode("utf-8"), (armazenada or "").encode("utf-8"))
+    try:
+        _, n, r, p, sal, esperada = armazenada.split("$")
+        derivada = _scrypt(senha, base64.b64decode(sal), int(n), int(r), int(p))
+    except ValueError:
+        return False
+    return hmac.compare_digest(derivada, base64.b64decode(esperada))
+
+def precisa_rehash(armazenada):
+    """Senha em texto puro ou com parâmetros de custo diferentes dos atuais"""
+    if not eh_hash(armazenada):
+        return True
+    return armazenada.split("$")[1:4] != [str(SCRYPT_N), str(SCRYPT_R), str(SCRYPT_P)]
+
+_executor = ThreadPoolExecutor(max_workers=THREADS_SENHA, thread_name_prefix="senha")
+_executor_lote = ThreadPoolExecutor(max_workers=THREADS_LOTE, thread_name_prefix="senha-lote")
+_vagas_fila = threading.BoundedSemaphore(THREADS_SENHA + FILA_SENHA)
+
+def _no_pool(funcao, *args):
+    """Roda funcao no pool de senhas; recusa na hora se a fila estiver cheia"""
+    if not _vagas_fila.acquire(blocking=False):
+        raise SobrecargaLogin()
+    try:
+        return _executor.submit(funcao, *args).result()
+    finally:
+        _vagas_fila.release()
+
+def verificar_senha_pool(senha, armazenada):
+    """verificar_senha() no pool: limita o CPU gasto com hashes durante picos de login"""
+    return _no_pool(verificar_senha, senha, armazenada)
+
+def gerar_hash_pool(senha):
+    """gerar_hash() no pool do login (rehash após o login); SobrecargaLogin se a fila estiver cheia"""
+    return _no_pool(gerar_hash, senha)
+
+def gerar_hashes(senhas):
+    """Hashes de custo SCRYPT_N_LOTE para importações, fora do pool do login"""
+    return list(_executor_lote.map(_gerar_hash_lote, senhas))
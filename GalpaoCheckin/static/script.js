@@ -16,6 +16,12 @@ document.addEventListener('DOMContentLoaded', function() {
     // Confirmation dialogs
     setupConfirmationDialogs();
     
+    // Check-in/cancelamento pela API (depois das confirmações, que podem barrar o clique)
+    setupAcoesApi();
+    
+    // App instalável e fila offline
+    setupPwa();
+    
     console.log('Sistema de Check-in inicializado');
 });
 
@@ -115,28 +121,116 @@ function setupAutoAlerts() {
  */
 function setupRealTimeUpdates() {
     // Check if we're on the user panel
-    if (window.location.pathname.includes('painel_usuario')) {
-        // Update every 30 seconds
-        setInterval(updateVagasStatus, 30000);
+    const painel = document.getElementById('horarios');
+    if (!painel || !painel.dataset.stream) {
+        return;
+    }
+    
+    if (window.EventSource) {
+        // Server-Sent Events: o servidor envia o status assim que as vagas mudam
+        const fonte = new EventSource(painel.dataset.stream);
+        fonte.onmessage = function(event) {
+            updateVagasStatus(JSON.parse(event.data));
+        };
+        // Fluxo recusado (ex.: 503, limite de conexões do servidor): o navegador
+        // não reconecta, então passamos a consultar a API
+        fonte.onerror = function() {
+            if (fonte.readyState === EventSource.CLOSED) {
+                consultarStatus(painel);
+            }
+        };
+    } else {
+        // Navegadores sem EventSource consultam a API
+        consultarStatus(painel);
     }
 }
 
+/**
+ * Consulta /api/status a cada 30 segundos
+ */
+function consultarStatus(painel) {
+    setInterval(function() {
+        fetch(painel.dataset.status, { credentials: 'same-origin' })
+            .then(response => response.ok ? response.json() : null)
+            .then(dados => dados && updateVagasStatus(dados))
+            .catch(() => {});
+    }, 30000);
+}
+
 /**
  * Update vagas status without full page reload
  */
-function updateVagasStatus() {
-    // This would typically make an AJAX call to get updated status
-    // For now, we'll just add a visual indicator that data is being refreshed
-    const statusCards = document.querySelectorAll('.card .badge');
-    
-    statusCards.forEach(badge => {
-        badge.style.opacity = '0.5';
-        setTimeout(() => {
-            badge.style.opacity = '1';
-        }, 500);
+function updateVagasStatus(dados) {
+    Object.keys(dados.sessoes).forEach(sessao => {
+        const card = document.querySelector(`[data-sessao="${sessao}"]`);
+        if (!card) {
+            return;
+        }
+        
+        const status = dados.sessoes[sessao];
+        const ocupadas = status.capacidade - status.vagas_restantes;
+        const plural = status.vagas_restantes !== 1 ? 's' : '';
+        
+        setCampo(card, 'vagas', status.vagas_restantes);
+        setCampo(card, 'ocupadas', ocupadas);
+        setCampo(card, 'restantes', `${status.vagas_restantes} vaga${plural} restante${plural}`);
+        
+        const barra = card.querySelector('[data-campo="progresso"]');
+        if (barra) {
+            barra.style.width = `${Math.round(ocupadas / status.capacidade * 100)}%`;
+            barra.classList.remove('bg-success', 'bg-warning', 'bg-danger');
+            barra.classList.add(status.vagas_restantes > 6 ? 'bg-success' : status.vagas_restantes > 3 ? 'bg-warning' : 'bg-danger');
+        }
+        
+        // Reservas do próprio aluno recarregam a página; aqui só alternamos lotado/livre
+        if (card.dataset.reservado === 'true') {
+            return;
+        }
+        
+        // Vaga repassada pela lista de espera (ou reserva feita em outra aba)
+        if (status.reservado) {
+            card.dataset.reservado = 'true';
+            showAlert('Uma vaga abriu e sua reserva foi confirmada!', 'success');
+            setTimeout(() => window.location.reload(), 1500);
+            return;
+        }
+        
+        setCampo(card, 'fila', status.na_fila);
+        if (status.posicao_espera) {
+            setCampo(card, 'espera', `Você é o ${status.posicao_espera}º da lista de espera`);
+        }
+        
+        const header = card.querySelector('.card-header');
+        header.classList.toggle('bg-danger', status.lotado);
+        header.classList.toggle('bg-primary', !status.lotado);
+        card.classList.toggle('border-danger', status.lotado);
+        card.classList.toggle('border-primary', !status.lotado);
+        
+        card.querySelectorAll('[data-estado]').forEach(bloco => {
+            const visivel = (bloco.dataset.estado === 'lotado') === status.lotado;
+            bloco.classList.toggle('d-none', !visivel);
+        });
     });
 }
 
+/**
+ * Set text of a [data-campo] element inside a card
+ */
+function setCampo(card, campo, valor) {
+    const elemento = card.querySelector(`[data-campo="${campo}"]`);
+    if (elemento) {
+        elemento.textContent = valor;
+    }
+}
+
+/**
+ * Horário (ex.: 18:00-20:00) do card de sessão que contém o elemento
+ */
+function rotuloSessao(elemento) {
+    const card = elemento.closest('[data-sessao]');
+    return card ? card.dataset.rotulo : '';
+}
+
 /**
  * Setup confirmation dialogs
  */
@@ -145,7 +239,7 @@ function setupConfirmationDialogs() {
     const checkinLinks = document.querySelectorAll('a[href*="/checkin/"]');
     checkinLinks.forEach(link => {
         link.addEventListener('click', function(event) {
-            const horario = this.href.split('/').pop();
+            const horario = rotuloSessao(this);
             if (!confirm(`Confirma a reserva para o horário ${horario}?\n\nSerá descontado 1 crédito da sua conta.`)) {
                 event.preventDefault();
             }
@@ -156,7 +250,7 @@ function setupConfirmationDialogs() {
     const cancelLinks = document.querySelectorAll('a[href*="/cancelar/"]');
     cancelLinks.forEach(link => {
         link.addEventListener('click', function(event) {
-            const horario = this.href.split('/').pop();
+            const horario = rotuloSessao(this);
             if (!confirm(`Tem certeza que deseja cancelar sua reserva para ${horario}?\n\nO crédito será reembolsado.`)) {
                 event.preventDefault();
             }
@@ -167,8 +261,14 @@ function setupConfirmationDialogs() {
     const adminForms = document.querySelectorAll('form[action*="admin"]');
     adminForms.forEach(form => {
         form.addEventListener('submit', function(event) {
-            const nome = form.querySelector('input[name="nome"]').value;
-            const creditos = form.querySelector('input[name="creditos"]').value;
+            // Busca e importação em lote também apontam para /admin
+            const nomeInput = form.querySelector('input[name="nome"]');
+            const creditosInput = form.querySelector('input[name="creditos"]');
+            if (!nomeInput || !creditosInput) {
+                return;
+            }
+            const nome = nomeInput.value;
+            const creditos = creditosInput.value;
             
             if (!confirm(`Confirma o cadastro do aluno?\n\nNome: ${nome}\nCréditos: ${creditos}`)) {
                 event.preventDefault();
@@ -177,6 +277,95 @@ function setupConfirmationDialogs() {
     });
 }
 
+/**
+ * Check-in e cancelamento do painel pela API JSON, com Idempotency-Key.
+ * Sem conexão, o service worker guarda a ação na fila e responde 202;
+ * sem JavaScript, os links continuam funcionando como antes.
+ */
+function setupAcoesApi() {
+    const painel = document.getElementById('horarios');
+    if (!painel || !window.fetch) {
+        return;
+    }
+    
+    painel.querySelectorAll('a[data-acao]').forEach(link => {
+        link.addEventListener('click', function(event) {
+            // Confirmação recusada
+            if (event.defaultPrevented) {
+                return;
+            }
+            event.preventDefault();
+            if (link.classList.contains('disabled')) {
+                return;
+            }
+            
+            const card = link.closest('[data-sessao]');
+            link.classList.add('disabled');
+            fetch(link.dataset.acao, {
+                method: 'POST',
+                credentials: 'same-origin',
+                headers: { 'Content-Type': 'application/json', 'Idempotency-Key': novaChave() },
+                body: JSON.stringify({
+                    sessao_id: Number(card.dataset.sessao),
+                    data: painel.dataset.data,
+                    aluno_id: Number(painel.dataset.aluno)
+                })
+            }).then(response => {
+                if (response.status === 401) {
+                    window.location.reload();
+                    return;
+                }
+                return response.json().then(corpo => {
+                    showAlert(corpo.mensagem || corpo.erro, corpo.categoria || 'error');
+                    // Na fila: o resultado chega por mensagem do service worker
+                    if (response.status !== 202) {
+                        setTimeout(() => window.location.reload(), 1500);
+                    }
+                });
+            }).catch(() => {
+                link.classList.remove('disabled');
+                showAlert('Sem conexão. Tente de novo quando a internet voltar.', 'error');
+            });
+        });
+    });
+}
+
+/**
+ * Identificador único de cada clique (a mesma chave acompanha a ação na fila offline)
+ */
+function novaChave() {
+    if (window.crypto && crypto.randomUUID) {
+        return crypto.randomUUID();
+    }
+    return Date.now().toString(36) + '-' + Math.random().toString(36).slice(2, 12);
+}
+
+/**
+ * Registra o service worker do painel e mostra o resultado das ações reenviadas da fila
+ */
+function setupPwa() {
+    const painel = document.getElementById('horarios');
+    if (!painel || !painel.dataset.sw || !('serviceWorker' in navigator)) {
+        return;
+    }
+    
+    navigator.serviceWorker.register(painel.dataset.sw).catch(() => {});
+    navigator.serviceWorker.addEventListener('message', event => {
+        if (event.data && event.data.tipo === 'resultado') {
+            const corpo = event.data.corpo;
+            showAlert(corpo.mensagem || corpo.erro, corpo.categoria || 'error');
+            setTimeout(() => window.location.reload(), 1500);
+        }
+    });
+    
+    // Navegadores sem Background Sync: a página pede o reenvio ao abrir e quando a conexão volta;
+    // o service worker descarta o que outro aluno deixou na fila deste aparelho
+    const pedirReenvio = () => navigator.serviceWorker.ready.then(registro => registro.active
+        && registro.active.postMessage({ tipo: 'reenviar', aluno: Number(painel.dataset.aluno) }));
+    pedirReenvio();
+    window.addEventListener('online', pedirReenvio);
+}
+
 /**
  * Show custom alert
  */
@@ -0,0 +1,202 @@
+// Service worker do painel do aluno (gerado por /sw.js)
+// - shell (CSS, JS, ícone e CDN) em cache: o painel abre mesmo sem conexão
+// - última versão do painel guardada a cada visita, servida quando a rede falha
+// - check-ins e cancelamentos sem conexão vão para uma fila no IndexedDB e são
+//   reenviados em ordem, um por vez, quando a conexão volta; a Idempotency-Key
+//   gravada com cada ação garante que o servidor execute cada uma só uma vez
+// - cada ação guarda o aluno que a fez: a fila é apagada no logout, e ações de
+//   outro aluno (aparelho compartilhado) são descartadas, aqui e no servidor
+
+const VERSAO = {{ versao|tojson }};
+const CACHE_SHELL = `galpao-shell-${VERSAO}`;
+const CACHE_PAGINAS = 'galpao-paginas';
+const SHELL = {{ shell|tojson }};
+const PAINEL = {{ painel|tojson }};
+const SAIR = {{ sair|tojson }};
+const API = {{ api|tojson }};
+const SINCRONIA = 'galpao-fila';
+
+self.addEventListener('install', event => {
+    event.waitUntil(caches.open(CACHE_SHELL).then(cache => cache.addAll(SHELL)).then(() => self.skipWaiting()));
+});
+
+self.addEventListener('activate', event => {
+    // Caches de shells anteriores (assets com outro hash) não servem mais
+    event.waitUntil(
+        caches.keys()
+            .then(nomes => Promise.all(nomes
+                .filter(nome => nome.startsWith('galpao-shell-') && nome !== CACHE_SHELL)
+                .map(nome => caches.delete(nome))))
+            .then(() => self.clients.claim())
+    );
+});
+
+self.addEventListener('fetch', event => {
+    const pedido = event.request;
+    const url = new URL(pedido.url);
+
+    if (pedido.method === 'POST' && url.origin === self.location.origin && API.includes(url.pathname)) {
+        event.respondWith(enviarOuEnfileirar(pedido));
+        return;
+    }
+    if (pedido.method !== 'GET') {
+        return;
+    }
+    if (pedido.mode === 'navigate' && url.pathname === SAIR) {
+        // A cópia do painel e a fila são do aluno logado: somem no logout
+        event.waitUntil(Promise.all([caches.delete(CACHE_PAGINAS), limpar()]));
+        return;
+    }
+    if (pedido.mode === 'navigate' && url.pathname === PAINEL) {
+        event.respondWith(painelComCopia(pedido));
+        return;
+    }
+    if (SHELL.includes(pedido.url) || SHELL.includes(url.pathname) || url.origin !== self.location.origin) {
+        event.respondWith(doCache(pedido));
+    }
+});
+
+self.addEventListener('sync', event => {
+    if (event.tag === SINCRONIA) {
+        event.waitUntil(reenviar());
+    }
+});
+
+self.addEventListener('message', event => {
+    if (event.data && event.data.tipo === 'reenviar') {
+        event.waitUntil(reenviar(event.data.aluno));
+    }
+});
+
+/**
+ * Shell: cache primeiro; o que faltar (ex.: fontes do Font Awesome) é guardado na primeira busca
+ */
+function doCache(pedido) {
+    return caches.match(pedido).then(guardada => guardada || fetch(pedido).then(resposta => {
+        if (resposta.ok) {
+            const copia = resposta.clone();
+            caches.open(CACHE_SHELL).then(cache => cache.put(pedido, copia));
+        }
+        return resposta;
+    }));
+}
+
+/**
+ * Painel: rede primeiro (vagas em tempo real); sem rede, a última versão vista
+ */
+function painelComCopia(pedido) {
+    return fetch(pedido).then(resposta => {
+        if (resposta.ok && !resposta.redirected) {
+            const copia = resposta.clone();
+            caches.open(CACHE_PAGINAS).then(cache => cache.put(PAINEL, copia));
+        }
+        return resposta;
+    }).catch(() => caches.match(PAINEL, { cacheName: CACHE_PAGINAS }).then(guardada => guardada || new Response(
+        '<!DOCTYPE html><meta charset="utf-8"><title>Sem conexão</title>' +
+        '<p style="font-family:sans-serif;margin:2rem">Sem conexão. Abra o painel de novo quando a internet voltar.</p>',
+        { status: 503, headers: { 'Content-Type': 'text/html; charset=utf-8' } }
+    )));
+}
+
+/**
+ * Envia a ação; se a rede falhar, guarda na fila e responde 202 para a página
+ */
+function enviarOuEnfileirar(pedido) {
+    const copia = pedido.clone();
+    return fetch(pedido).catch(() => copia.text().then(corpo => guardar({
+        url: copia.url,
+        corpo: corpo,
+        aluno_id: JSON.parse(corpo).aluno_id,
+        chave: copia.headers.get('Idempotency-Key'),
+        criada: Date.now()
+    })).then(() => {
+        if (self.registration.sync) {
+            self.registration.sync.register(SINCRONIA).catch(() => {});
+        }
+        return new Response(JSON.stringify({
+            resultado: 'na_fila',
+            categoria: 'warning',
+            mensagem: 'Sem conexão: a ação foi guardada e será enviada assim que a internet voltar.'
+        }), { status: 202, headers: { 'Content-Type': 'application/json' } });
+    }));
+}
+
+let reenviando = null;
+
+/**
+ * Reenvia a fila em ordem, uma ação por vez; para na primeira falha de rede ou do servidor
+ * (tenta de novo no próximo evento de conexão), sem repetição em laço.
+ * Com `aluno` (enviado pela página), ações de outros alunos são descartadas antes.
+ */
+function reenviar(aluno) {
+    if (!reenviando) {
+        reenviando = processarFila(aluno).finally(() => { reenviando = null; });
+    }
+    return reenviando;
+}
+
+async function processarFila(aluno) {
+    for (const acao of await listar()) {
+        if (!acao.aluno_id || (aluno && acao.aluno_id !== aluno)) {
+            await remover(acao.id);
+            continue;
+        }
+        let resposta;
+        try {
+            resposta = await fetch(acao.url, {
+                method: 'POST',
+                credentials: 'same-origin',
+                headers: { 'Content-Type': 'application/json', 'Idempotency-Key': acao.chave },
+                body: acao.corpo
+            });
+        } catch (erro) {
+            return;
+        }
+        const corpo = await resposta.json().catch(() => ({}));
+        // 401: login expirado (fica para o próximo login do mesmo aluno); 5xx, 429 e 409 em processamento: tentar depois
+        if (resposta.status === 401 || resposta.status === 429 || resposta.status >= 500
+                || corpo.resultado === 'em_processamento') {
+            return;
+        }
+        await remover(acao.id);
+        // 403: ação de outro aluno, recusada pelo servidor; descartada sem aviso
+        if (resposta.status === 403) {
+            continue;
+        }
+        const janelas = await self.clients.matchAll({ type: 'window' });
+        janelas.forEach(janela => janela.postMessage({ tipo: 'resultado', corpo: corpo }));
+    }
+}
+
+/**
+ * Fila no IndexedDB (sobrevive ao fechamento da aba e ao reinício do service worker)
+ */
+function fila(modo, operacao) {
+    return new Promise((resolver, rejeitar) => {
+        const abertura = indexedDB.open(SINCRONIA, 1);
+        abertura.onupgradeneeded = () => abertura.result.createObjectStore('acoes', { keyPath: 'id', autoIncrement: true });
+        abertura.onerror = () => rejeitar(abertura.error);
+        abertura.onsuccess = () => {
+            const transacao = abertura.result.transaction('acoes', modo);
+            const pedido = operacao(transacao.objectStore('acoes'));
+            transacao.oncomplete = () => resolver(pedido.result);
+            transacao.onerror = () => rejeitar(transacao.error);
+        };
+    });
+}
+
+function guardar(acao) {
+    return fila('readwrite', acoes => acoes.add(acao));
+}
+
+function listar() {
+    return fila('readonly', acoes => acoes.getAll());
+}
+
+function remover(id) {
+    return fila('readwrite', acoes => acoes.delete(id));
+}
+
+function limpar() {
+    return fila('readwrite', acoes => acoes.clear());
+}